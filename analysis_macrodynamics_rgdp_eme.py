@@ -2,7 +2,16 @@
 import pandas as pd
 from datetime import date, timedelta
 import re
-from helper import telsendmsg, telsendimg, telsendfiles, get_data_from_ceic
+from helper import (
+    telsendmsg,
+    telsendimg,
+    telsendfiles,
+    get_data_from_ceic,
+    build_analysis_panel,
+    as_period,
+    compact_panel,
+    panel_to_multiindex,
+)
 import statsmodels.tsa.api as smt
 from statsmodels.tsa.ar_model import ar_select_order
 import localprojections as lp
@@ -24,31 +33,7 @@ path_ceic = "./ceic/"
 tel_config = os.getenv("TEL_CONFIG")
 t_start_q = "1991Q1"
 t_end_q = "2023Q1"
-
-# %%
-# I --- Load data
-# Macro
-df = pd.read_parquet(path_data + "data_macro_quarterly.parquet")
-# UGap
-df_ugap = pd.read_parquet(path_output + "plucking_ugap_quarterly.parquet")
-# df_ugap["quarter"] = pd.to_datetime(df_ugap["month"]).dt.to_period("q")
-# df_ugap = (
-#     df_ugap.groupby(["country", "quarter"])[["urate_ceiling", "urate_gap"]]
-#     .mean()
-#     .reset_index(drop=False)
-# )
-df_ugap["quarter"] = df_ugap["quarter"].astype("str")
-# Expected inflation
-df_expcpi = pd.read_parquet(path_data + "data_macro_quarterly_expcpi.parquet")
-# Merge
-df = df.merge(df_ugap, on=["country", "quarter"], how="outer", validate="one_to_one")
-df = df.merge(df_expcpi, on=["country", "quarter"], how="outer", validate="one_to_one")
-# Sort
-df = df.sort_values(by=["country", "quarter"])
-
-# %%
-# II --- Pre-analysis wrangling
-# Trim countries
+# Countries to read from the data store
 list_countries_keep = [
     # "australia",
     "malaysia",
@@ -71,15 +56,24 @@ list_countries_keep = [
     "mexico",
     "brazil",
 ]
-df = df[df["country"].isin(list_countries_keep)]
+
+# %%
+# I --- Load data
 # Transform
 cols_pretransformed = ["rgdp", "m2", "cpi", "corecpi", "maxgepu", "expcpi"]
 cols_levels = ["reer", "ber", "brent", "gepu"]
 cols_rate = ["stir", "ltir", "urate_ceiling", "urate", "urate_gap", "urate_gap_ratio", "privdebt", "privdebt_bank"]
-for col in cols_levels:
-    df[col] = 100 * ((df[col] / df.groupby("country")[col].shift(4)) - 1)
-for col in cols_rate:
-    df[col] = df[col] - df.groupby("country")[col].shift(4)
+# Merged and transformed panel, cached
+df = build_analysis_panel(
+    path_data=path_data,
+    path_output=path_output,
+    countries=list_countries_keep,
+    cols_levels=cols_levels,
+    cols_rate=cols_rate,
+)
+
+# %%
+# II --- Pre-analysis wrangling
 # Check when the panel becomes balanced
 min_quarter_by_country = df[
     [
@@ -99,15 +93,16 @@ min_quarter_by_country = (
 )
 print(tabulate(min_quarter_by_country, headers="keys", tablefmt="pretty"))
 # Trim dates
-df["quarter"] = pd.to_datetime(df["quarter"]).dt.to_period("q")
+df["quarter"] = as_period(df["quarter"], frequency="quarter")
 df = df[(df["quarter"] >= t_start_q) & (df["quarter"] <= t_end_q)]
 # Reset index
 df = df.reset_index(drop=True)
 # Set numeric time index
 df["time"] = df.groupby("country").cumcount()
 del df["quarter"]
-# Set multiindex for localprojections
-df = df.set_index(["country", "time"])
+# Set multiindex for localprojections, on a compact panel
+df = compact_panel(df, time_label="time")
+df = panel_to_multiindex(df, time_label="time")
 
 # %%
 # II --- Analysis
@@ -12,6 +12,10 @@ from helper import (
     gmmiv_reg,
     heatmap,
     pil_img2pdf,
+    read_partitioned_store,
+    as_period,
+    transform_panel,
+    lag_panel,
 )
 import statsmodels.tsa.api as smt
 from statsmodels.tsa.ar_model import ar_select_order
@@ -33,13 +37,48 @@ path_ceic = "./ceic/"
 tel_config = os.getenv("TEL_CONFIG")
 t_start_q = "1991Q1"
 t_end_q = "2023Q1"
+# Countries to read from the data store
+list_countries_keep = [
+    # "australia",
+    # "malaysia",
+    # "singapore",
+    # "thailand",
+    # "indonesia",  # no urate data
+    # "philippines",  # no urate data
+    "united_states",  # problems with BER
+    # "united_kingdom",
+    # "germany",
+    # "france",
+    # "italy",
+    # "japan",
+    # "south_korea",
+    # "taiwan",  # not covered country
+    # "hong_kong_sar_china_",  # no core inflation
+    # "india",  # no urate data
+    # "china",  # special case
+    # "chile",
+    # "mexico",
+    # "brazil",
+]
 
 # %%
 # I --- Load data
 # Macro
-df = pd.read_parquet(path_data + "data_macro_quarterly.parquet")
+df = read_partitioned_store(
+    path_store=path_data + "store/",
+    dataset="data_macro",
+    frequency="quarterly",
+    countries=list_countries_keep,
+    path_source=path_data + "data_macro_quarterly.parquet",
+)
 # UGap
-df_ugap = pd.read_parquet(path_output + "plucking_ugap_quarterly.parquet")
+df_ugap = read_partitioned_store(
+    path_store=path_output + "store/",
+    dataset="plucking_ugap",
+    frequency="quarterly",
+    countries=list_countries_keep,
+    path_source=path_output + "plucking_ugap_quarterly.parquet",
+)
 # df_ugap["quarter"] = pd.to_datetime(df_ugap["month"]).dt.to_period("q")
 # df_ugap = (
 #     df_ugap.groupby(["country", "quarter"])[["urate_ceiling", "urate_gap"]]
@@ -48,11 +87,17 @@ df_ugap = pd.read_parquet(path_output + "plucking_ugap_quarterly.parquet")
 # )
 df_ugap["quarter"] = df_ugap["quarter"].astype("str")
 # Expected inflation
-df_expcpi = pd.read_parquet(path_data + "data_macro_quarterly_expcpi.parquet")
+df_expcpi = read_partitioned_store(
+    path_store=path_data + "store/",
+    dataset="data_macro_expcpi",
+    frequency="quarterly",
+    countries=list_countries_keep,
+    path_source=path_data + "data_macro_quarterly_expcpi.parquet",
+)
 # NAIRU for the US
 df_nairu_us = pd.read_csv(path_data + "us_cbo_nairu.csv")
 df_nairu_us = df_nairu_us.rename(columns={"DATE": "quarter", "NROU": "nairu"})
-df_nairu_us["quarter"] = pd.to_datetime(df_nairu_us["quarter"]).dt.to_period("q")
+df_nairu_us["quarter"] = as_period(df_nairu_us["quarter"], frequency="quarter")
 df_nairu_us["country"] = "united_states"
 df_nairu_us["quarter"] = df_nairu_us["quarter"].astype("str")
 # Merge
@@ -66,28 +111,6 @@ df = df.sort_values(by=["country", "quarter"])
 # %%
 # II --- Pre-analysis wrangling
 # Trim countries
-list_countries_keep = [
-    # "australia",
-    # "malaysia",
-    # "singapore",
-    # "thailand",
-    # "indonesia",  # no urate data
-    # "philippines",  # no urate data
-    "united_states",  # problems with BER
-    # "united_kingdom",
-    # "germany",
-    # "france",
-    # "italy",
-    # "japan",
-    # "south_korea",
-    # "taiwan",  # not covered country
-    # "hong_kong_sar_china_",  # no core inflation
-    # "india",  # no urate data
-    # "china",  # special case
-    # "chile",
-    # "mexico",
-    # "brazil",
-]
 df = df[df["country"].isin(list_countries_keep)]
 # Compute NAIRU gap
 df["nairu_gap"] = df["urate"] - df["nairu"] 
@@ -95,19 +118,14 @@ df["nairu_gap"] = df["urate"] - df["nairu"]
 cols_pretransformed = ["rgdp", "m2", "cpi", "corecpi", "maxgepu", "expcpi", "nairu_gap"]
 cols_levels = ["reer", "ber", "brent", "gepu"]
 cols_rate = ["stir", "ltir", "urate_ceiling", "urate", "nairu", "privdebt", "privdebt_bank"]
-for col in cols_levels:
-    df[col] = 100 * ((df[col] / df.groupby("country")[col].shift(4)) - 1)
-for col in cols_rate:
-    df[col] = df[col] - df.groupby("country")[col].shift(4)
+df = transform_panel(df, cols_yoy=cols_levels, cols_diff=cols_rate)
 # Generate lagged terms for interacted variables
 df["urate_int_urate_gap"] = df["urate"] * df["urate_gap"]
 df["urate_int_nairu_gap"] = df["urate"] * df["nairu_gap"]
 # Generate lags
-for lag in range(1, 4 + 1):
-    for col in cols_pretransformed + cols_levels + cols_rate:
-        df[col + "_lag" + str(lag)] = df.groupby("country")[col].shift(lag)
+df = lag_panel(df, cols=cols_pretransformed + cols_levels + cols_rate, n_lags=4)
 # Trim dates
-df["quarter"] = pd.to_datetime(df["quarter"]).dt.to_period("q")
+df["quarter"] = as_period(df["quarter"], frequency="quarter")
 df = df[(df["quarter"] >= t_start_q) & (df["quarter"] <= t_end_q)]
 # Reset index
 df = df.reset_index(drop=True)
@@ -13,6 +13,8 @@ from helper import (
     heatmap,
     pil_img2pdf,
     subplots_linecharts,
+    transform_panel,
+    index_panel,
 )
 import statsmodels.tsa.api as smt
 from statsmodels.tsa.ar_model import ar_select_order
@@ -98,10 +100,7 @@ df = df[df["country"].isin(list_countries_keep)]
 cols_pretransformed = ["rgdp", "m2", "cpi", "corecpi", "maxgepu", "expcpi"]
 cols_levels = ["reer", "ber", "brent", "gepu"]
 cols_rate = ["stir", "ltir", "urate_ceiling", "urate", "privdebt", "privdebt_bank"]
-for col in cols_levels:
-    df[col] = 100 * ((df[col] / df.groupby("country")[col].shift(4)) - 1)
-for col in cols_rate:
-    df[col] = df[col] - df.groupby("country")[col].shift(4)
+df = transform_panel(df, cols_yoy=cols_levels, cols_diff=cols_rate)
 # Generate lists for charting
 nested_list_country_groups = [
     countries_asean4,
@@ -159,6 +158,14 @@ df = df[["country", "quarter", "slope", "slope_lb", "slope_ub", "perc_flattening
 # %%
 # IV --- Plot
 list_file_names = []
+# Row range of each country group
+df_by_group, dict_group_slices = index_panel(
+    data=df,
+    entities_label="country",
+    groups=dict(
+        zip(snakecase_group_names_by_country_groups, nested_list_country_groups)
+    ),
+)
 for country_groups, snakecase_group_name, nice_group_name, n_rows, n_cols in tqdm(
     zip(
         nested_list_country_groups,
@@ -169,7 +176,7 @@ for country_groups, snakecase_group_name, nice_group_name, n_rows, n_cols in tqd
     )
 ):
     # subset country
-    df_sub = df[df["country"].isin(country_groups)].copy()
+    df_sub = df_by_group.iloc[dict_group_slices[snakecase_group_name]].copy()
     df_sub["country"] = df_sub["country"].replace(dict_countries_snake_to_nice)
     # plot the PC slope
     fig = subplots_linecharts(
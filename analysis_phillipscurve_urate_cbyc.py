@@ -12,6 +12,8 @@ from helper import (
     re_reg,
     heatmap,
     pil_img2pdf,
+    build_analysis_panel,
+    index_panel,
 )
 import statsmodels.tsa.api as smt
 from statsmodels.tsa.ar_model import ar_select_order
@@ -33,31 +35,7 @@ path_ceic = "./ceic/"
 tel_config = os.getenv("TEL_CONFIG")
 t_start_q = "1991Q1"
 t_end_q = "2023Q1"
-
-# %%
-# I --- Load data
-# Macro
-df = pd.read_parquet(path_data + "data_macro_quarterly.parquet")
-# UGap
-df_ugap = pd.read_parquet(path_output + "plucking_ugap_quarterly.parquet")
-# df_ugap["quarter"] = pd.to_datetime(df_ugap["month"]).dt.to_period("q")
-# df_ugap = (
-#     df_ugap.groupby(["country", "quarter"])[["urate_ceiling", "urate_gap"]]
-#     .mean()
-#     .reset_index(drop=False)
-# )
-df_ugap["quarter"] = df_ugap["quarter"].astype("str")
-# Expected inflation
-df_expcpi = pd.read_parquet(path_data + "data_macro_quarterly_expcpi.parquet")
-# Merge
-df = df.merge(df_ugap, on=["country", "quarter"], how="outer", validate="one_to_one")
-df = df.merge(df_expcpi, on=["country", "quarter"], how="outer", validate="one_to_one")
-# Sort
-df = df.sort_values(by=["country", "quarter"])
-
-# %%
-# II --- Pre-analysis wrangling
-# Trim countries
+# Countries to read from the data store
 list_countries_keep = [
     "australia",
     "malaysia",
@@ -80,6 +58,39 @@ list_countries_keep = [
     "mexico",
     "brazil",
 ]
+
+# %%
+# I --- Load data
+# Transform
+cols_pretransformed = ["rgdp", "m2", "cpi", "corecpi", "maxgepu", "expcpi"]
+cols_levels = ["reer", "ber", "brent", "gepu"]
+cols_rate = [
+    "stir",
+    "ltir",
+    "urate_ceiling",
+    "urate",
+    "urate_gap",
+    "urate_gap_ratio",
+    "privdebt",
+    "privdebt_bank",
+]
+# Merged and transformed panel, cached
+df = build_analysis_panel(
+    path_data=path_data,
+    path_output=path_output,
+    countries=list_countries_keep,
+    cols_levels=cols_levels,
+    cols_rate=cols_rate,
+    cols_lags=cols_pretransformed + cols_levels + cols_rate,
+    cols_is_zero=["urate_gap"],
+    interactions={"urate_int_urate_gap_is_zero": ["urate", "urate_gap_is_zero"]},
+    t_start=t_start_q,
+    t_end=t_end_q,
+)
+
+# %%
+# II --- Pre-analysis wrangling
+# Names of countries kept, for charts
 list_countries_keep_nice = [
     "Australia",
     "Malaysia",
@@ -102,42 +113,6 @@ list_countries_keep_nice = [
     "Mexico",
     "Brazil",
 ]
-df = df[df["country"].isin(list_countries_keep)]
-# Compute indicator for when urate gap is nil
-df.loc[df["urate_gap"] == 0, "urate_gap_is_zero"] = 1
-df.loc[df["urate_gap"] > 0, "urate_gap_is_zero"] = 0
-# Transform
-cols_pretransformed = ["rgdp", "m2", "cpi", "corecpi", "maxgepu", "expcpi"]
-cols_levels = ["reer", "ber", "brent", "gepu"]
-cols_rate = [
-    "stir",
-    "ltir",
-    "urate_ceiling",
-    "urate",
-    "urate_gap",
-    "urate_gap_ratio",
-    "privdebt",
-    "privdebt_bank",
-]
-for col in cols_levels:
-    df[col] = 100 * ((df[col] / df.groupby("country")[col].shift(4)) - 1)
-for col in cols_rate:
-    df[col] = df[col] - df.groupby("country")[col].shift(4)
-
-# Generate lagged terms for interacted variables
-df["urate_int_urate_gap_is_zero"] = df["urate"] * df["urate_gap_is_zero"]
-# Generate lags
-for lag in range(1, 4 + 1):
-    for col in cols_pretransformed + cols_levels + cols_rate:
-        df[col + "_lag" + str(lag)] = df.groupby("country")[col].shift(lag)
-# Trim dates
-df["quarter"] = pd.to_datetime(df["quarter"]).dt.to_period("q")
-df = df[(df["quarter"] >= t_start_q) & (df["quarter"] <= t_end_q)]
-# Reset index
-df = df.reset_index(drop=True)
-# Set numeric time index
-df["time"] = df.groupby("country").cumcount()
-del df["quarter"]
 
 # %%
 # II --- Analysis
@@ -150,6 +125,7 @@ heatmaps_annot_fontsize = 12
 list_file_names = []
 # %%
 # Country by country loop
+df, dict_slices = index_panel(data=df, entities_label="country")
 relevant_cols = ["urate", "urate:urate_gap_is_zero"]
 sig_countries = []
 sig_countries_reer = []
@@ -157,7 +133,7 @@ params_urate_allcountries = pd.DataFrame(columns=relevant_cols)
 params_urate_allcountries_reer = pd.DataFrame(columns=relevant_cols)
 for country, country_nice in tqdm(zip(list_countries_keep, list_countries_keep_nice)):
     # Trim country
-    df_sub = df[df["country"] == country].copy()
+    df_sub = df.iloc[dict_slices[country]]
     # OLS
     # Without REER
     eqn = "corecpi ~ 1 + urate * urate_gap_is_zero + expcpi + corecpi_lag1"
@@ -12,6 +12,7 @@ from helper import (
     gmmiv_reg,
     heatmap,
     pil_img2pdf,
+    build_analysis_panel,
 )
 import statsmodels.tsa.api as smt
 from statsmodels.tsa.ar_model import ar_select_order
@@ -33,31 +34,7 @@ path_ceic = "./ceic/"
 tel_config = os.getenv("TEL_CONFIG")
 t_start_q = "1991Q1"
 t_end_q = "2023Q1"
-
-# %%
-# I --- Load data
-# Macro
-df = pd.read_parquet(path_data + "data_macro_quarterly.parquet")
-# UGap
-df_ugap = pd.read_parquet(path_output + "plucking_ugap_quarterly.parquet")
-# df_ugap["quarter"] = pd.to_datetime(df_ugap["month"]).dt.to_period("q")
-# df_ugap = (
-#     df_ugap.groupby(["country", "quarter"])[["urate_ceiling", "urate_gap"]]
-#     .mean()
-#     .reset_index(drop=False)
-# )
-df_ugap["quarter"] = df_ugap["quarter"].astype("str")
-# Expected inflation
-df_expcpi = pd.read_parquet(path_data + "data_macro_quarterly_expcpi.parquet")
-# Merge
-df = df.merge(df_ugap, on=["country", "quarter"], how="outer", validate="one_to_one")
-df = df.merge(df_expcpi, on=["country", "quarter"], how="outer", validate="one_to_one")
-# Sort
-df = df.sort_values(by=["country", "quarter"])
-
-# %%
-# II --- Pre-analysis wrangling
-# Trim countries
+# Countries to read from the data store
 list_countries_keep = [
     "australia",
     "malaysia",
@@ -80,40 +57,47 @@ list_countries_keep = [
     "mexico",
     "brazil",
 ]
-df = df[df["country"].isin(list_countries_keep)]
+
+# %%
+# I --- Load data
 # Transform
 cols_pretransformed = ["rgdp", "m2", "cpi", "corecpi", "maxgepu", "expcpi"]
 cols_levels = ["reer", "ber", "brent", "gepu"]
 cols_rate = ["stir", "ltir", "urate_ceiling", "urate", "privdebt", "privdebt_bank"]
-for col in cols_levels:
-    df[col] = 100 * ((df[col] / df.groupby("country")[col].shift(4)) - 1)
-for col in cols_rate:
-    df[col] = df[col] - df.groupby("country")[col].shift(4)
-# Generate polynomials
-cols_poly = []
-for col in ["urate_gap"]:
-    df[col + "_sq"] = df[col] ** 2
-    df[col + "_cube"] = df[col] ** 3
-    cols_poly += [col + "_sq", col + "_cube"]
-# Generate interacted variables
-df["urate_int_urate_gap"] = df["urate"] * df["urate_gap"]
-df["urate_int_urate_gap_sq"] = df["urate"] * df["urate_gap_sq"]
-df["urate_gap_int_urate_gap_sq"] = df["urate_gap"] * df["urate_gap_sq"]
-df["urate_int_urate_gap_int_urate_gap_sq"] = (
-    df["urate"] * df["urate_gap"] * df["urate_gap_sq"]
+# Polynomials
+cols_poly = ["urate_gap_sq", "urate_gap_cube"]
+# Models; only the columns they use are built
+eqn_pols = "corecpi ~ 1 + urate * urate_gap * urate_gap_sq + expcpi + corecpi_lag1"
+cols_x_fe = [
+    "urate",
+    "urate_gap",
+    "urate_gap_sq",
+    "urate_int_urate_gap",
+    "urate_int_urate_gap_sq",
+    "urate_gap_int_urate_gap_sq",
+    "urate_int_urate_gap_int_urate_gap_sq",
+    "expcpi",
+    "corecpi_lag1",
+]
+# Merged and transformed panel, cached
+df = build_analysis_panel(
+    path_data=path_data,
+    path_output=path_output,
+    countries=list_countries_keep,
+    cols_levels=cols_levels,
+    cols_rate=cols_rate,
+    cols_lags=cols_pretransformed + cols_levels + cols_rate + cols_poly,
+    cols_powers=["urate_gap"],
+    interactions={
+        "urate_int_urate_gap": ["urate", "urate_gap"],
+        "urate_int_urate_gap_sq": ["urate", "urate_gap_sq"],
+        "urate_gap_int_urate_gap_sq": ["urate_gap", "urate_gap_sq"],
+        "urate_int_urate_gap_int_urate_gap_sq": ["urate", "urate_gap", "urate_gap_sq"],
+    },
+    formulas=[eqn_pols, "corecpi", "reer"] + cols_x_fe,
+    t_start=t_start_q,
+    t_end=t_end_q,
 )
-# Generate lags
-for lag in range(1, 4 + 1):
-    for col in cols_pretransformed + cols_levels + cols_rate + cols_poly:
-        df[col + "_lag" + str(lag)] = df.groupby("country")[col].shift(lag)
-# Trim dates
-df["quarter"] = pd.to_datetime(df["quarter"]).dt.to_period("q")
-df = df[(df["quarter"] >= t_start_q) & (df["quarter"] <= t_end_q)]
-# Reset index
-df = df.reset_index(drop=True)
-# Set numeric time index
-df["time"] = df.groupby("country").cumcount()
-del df["quarter"]
 
 # %%
 # II --- Analysis
@@ -127,7 +111,7 @@ list_file_names = []
 # %%
 # POLS
 # Without REER
-eqn = "corecpi ~ 1 + urate * urate_gap * urate_gap_sq + expcpi + corecpi_lag1"
+eqn = eqn_pols
 mod_pols, res_pols, params_table_pols, joint_teststats_pols, reg_det_pols = reg_ols(
     df=df, eqn=eqn
 )
@@ -151,7 +135,7 @@ fig = heatmap(
 )
 # telsendimg(conf=tel_config, path=file_name + ".png", cap=chart_title)
 # With REER
-eqn = "corecpi ~ 1 + urate * urate_gap * urate_gap_sq + expcpi + corecpi_lag1 + reer"
+eqn = eqn_pols + " + reer"
 (
     mod_pols_reer,
     res_pols_reer,
@@ -184,17 +168,7 @@ fig = heatmap(
 mod_fe, res_fe, params_table_fe, joint_teststats_fe, reg_det_fe = fe_reg(
     df=df,
     y_col="corecpi",
-    x_cols=[
-        "urate",
-        "urate_gap",
-        "urate_gap_sq",
-        "urate_int_urate_gap",
-        "urate_int_urate_gap_sq",
-        "urate_gap_int_urate_gap_sq",
-        "urate_int_urate_gap_int_urate_gap_sq",
-        "expcpi",
-        "corecpi_lag1",
-    ],
+    x_cols=cols_x_fe,
     i_col="country",
     t_col="time",
     fixed_effects=True,
@@ -230,18 +204,7 @@ fig = heatmap(
 ) = fe_reg(
     df=df,
     y_col="corecpi",
-    x_cols=[
-        "urate",
-        "urate_gap",
-        "urate_gap_sq",
-        "urate_int_urate_gap",
-        "urate_int_urate_gap_sq",
-        "urate_gap_int_urate_gap_sq",
-        "urate_int_urate_gap_int_urate_gap_sq",
-        "expcpi",
-        "corecpi_lag1",
-        "reer",
-    ],
+    x_cols=cols_x_fe + ["reer"],
     i_col="country",
     t_col="time",
     fixed_effects=True,
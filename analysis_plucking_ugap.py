@@ -2,7 +2,7 @@
 import pandas as pd
 import numpy as np
 from helper import telsendfiles, telsendimg, telsendmsg
-from helper_plucking import compute_urate_floor
+from helper_plucking import compute_urate_floor_panel
 from datetime import date, timedelta
 import statsmodels.formula.api as smf
 import statsmodels.tsa.api as sm
@@ -43,36 +43,24 @@ col_choice = "urate"
 cols_to_compute_ceilings = [col_choice]
 col_ref = "urate"
 # %%
-# Compute ceilings country-by-country
-count_country = 0
-for country in tqdm(list(df["country"].unique())):
-    # restrict country
-    df_sub = df[df["country"] == country].copy()
-    df_sub = df_sub.reset_index(drop=True)
-    # which country
-    print(
-        "Now estimating for "
-        + country
-        + ", with threshold of X = "
-        + str(round(downturn_threshold_multiplier * df_sub[col_choice].std(), 2))
-    )
-    # compute ceiling
-    df_ceiling_sub = compute_urate_floor(
-        data=df_sub,
-        levels_labels=cols_to_compute_ceilings,
-        ref_level_label=col_ref,
-        time_label="month",
-        downturn_threshold=downturn_threshold_multiplier,
-        bounds_timing_shift=-1,
-        hard_bound=True,
-    )
-    # consolidate
-    if count_country == 0:
-        df_ceiling = df_ceiling_sub.copy()
-    elif count_country > 0:
-        df_ceiling = pd.concat([df_ceiling, df_ceiling_sub], axis=0)  # top-down
-    # next
-    count_country += 1
+# Same threshold multiplier for all countries
+country_parameters = pd.DataFrame(
+    {
+        "country": list(df["country"].unique()),
+        "x_multiplier_choice": downturn_threshold_multiplier,
+        "tlb": "",
+    }
+)
+# Compute ceilings for all countries in parallel
+df_ceiling = compute_urate_floor_panel(
+    data=df,
+    country_parameters=country_parameters,
+    levels_labels=cols_to_compute_ceilings,
+    ref_level_label=col_ref,
+    time_label="month",
+    bounds_timing_shift=-1,
+    hard_bound=True,
+)
 # %%
 # Compute urate gap
 df_ceiling["urate_gap"] = df_ceiling["urate"] - df_ceiling["urate_ceiling"]
@@ -1,8 +1,8 @@
 # %%
 import pandas as pd
 import numpy as np
-from helper import telsendfiles, telsendimg, telsendmsg
-from helper_plucking import compute_urate_floor
+from helper import telsendfiles, telsendimg, telsendmsg, write_partitioned_store
+from helper_plucking import compute_urate_floor_panel
 from datetime import date, timedelta
 import statsmodels.formula.api as smf
 import statsmodels.tsa.api as sm
@@ -24,6 +24,8 @@ path_data = "./data/"
 path_output = "./output/"
 path_ceic = "./ceic/"
 path_dep = "./dep/"
+path_cache = "./cache/"
+path_store = path_output + "store/"  # partitioned by frequency and country
 tel_config = os.getenv("TEL_CONFIG")
 
 # %%
@@ -32,12 +34,6 @@ df = pd.read_parquet(path_data + "data_macro_quarterly_urate.parquet")
 country_parameters = pd.read_csv(
     path_dep + "parameters_by_country_quarterly.csv"
 )
-dict_country_x_multiplier = dict(
-    zip(country_parameters["country"], country_parameters["x_multiplier_choice"])
-)
-dict_country_tlb = dict(
-    zip(country_parameters["country"], country_parameters["tlb"].fillna(''))
-)
 
 # %%
 # II --- Additional wrangling
@@ -77,46 +73,18 @@ col_choice = "urate"
 cols_to_compute_ceilings = [col_choice]
 col_ref = "urate"
 # %%
-# Compute ceilings country-by-country
-count_country = 0
-for country in tqdm(list(df["country"].unique())):
-    # restrict country
-    df_sub = df[df["country"] == country].copy()
-    df_sub = df_sub.reset_index(drop=True)
-    # restrict time
-    tlb = dict_country_tlb[country]
-    if tlb == "":
-        pass
-    else:
-        df_sub["quarter"] = pd.to_datetime(df_sub["quarter"]).dt.to_period('q')
-        df_sub = df_sub[df_sub["quarter"] >= tlb]
-        df_sub["quarter"] = df_sub["quarter"].astype("str")
-    # draw out what threshold multiplier to use
-    downturn_threshold_multiplier = dict_country_x_multiplier[country]
-    # which country
-    print(
-        "Now estimating for "
-        + country
-        + ", with threshold of X = "
-        + str(round(downturn_threshold_multiplier * df_sub[col_choice].std(), 2))
-    )
-    # compute ceiling (same function is fine, as the DNS algo is stepwise when looking backwards)
-    df_ceiling_sub = compute_urate_floor(
-        data=df_sub,
-        levels_labels=cols_to_compute_ceilings,
-        ref_level_label=col_ref,
-        time_label="quarter",
-        downturn_threshold=downturn_threshold_multiplier,
-        bounds_timing_shift=-1,
-        hard_bound=True,
-    )
-    # consolidate
-    if count_country == 0:
-        df_ceiling = df_ceiling_sub.copy()
-    elif count_country > 0:
-        df_ceiling = pd.concat([df_ceiling, df_ceiling_sub], axis=0)  # top-down
-    # next
-    count_country += 1
+# Compute ceilings for all countries in parallel
+df_ceiling = compute_urate_floor_panel(
+    data=df,
+    country_parameters=country_parameters,
+    levels_labels=cols_to_compute_ceilings,
+    ref_level_label=col_ref,
+    time_label="quarter",
+    bounds_timing_shift=-1,
+    hard_bound=True,
+    path_cache=path_cache,
+    path_source=path_data + "data_macro_quarterly_urate.parquet",
+)
 # %%
 # Compute urate gap
 df_ceiling["urate_gap"] = df_ceiling["urate"] - df_ceiling["urate_ceiling"]
@@ -143,6 +111,13 @@ df_ceiling = df_ceiling.reset_index(drop=True)
 df_ceiling
 # Save local copy
 df_ceiling.to_parquet(path_output + "plucking_ugap_quarterly.parquet")
+write_partitioned_store(
+    data=df_ceiling,
+    path_store=path_store,
+    dataset="plucking_ugap",
+    frequency="quarterly",
+    path_source=path_output + "plucking_ugap_quarterly.parquet",
+)
 df_ceiling.to_csv(path_output + "plucking_ugap_quarterly.csv", index=False)
 
 # %%
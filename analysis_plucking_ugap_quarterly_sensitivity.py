@@ -0,0 +1,112 @@
+# %%
+import pandas as pd
+import numpy as np
+from helper import telsendfiles, telsendimg, telsendmsg
+from helper_plucking import compute_urate_floor_sensitivity
+from datetime import date, timedelta
+from tqdm import tqdm
+import time
+from dotenv import load_dotenv
+import os
+import ast
+
+time_start = time.time()
+
+# %%
+# 0 --- Main settings
+load_dotenv()
+path_data = "./data/"
+path_output = "./output/"
+path_ceic = "./ceic/"
+path_dep = "./dep/"
+tel_config = os.getenv("TEL_CONFIG")
+
+# Grid of threshold multipliers to evaluate
+list_x_multipliers = list(np.round(np.arange(0.05, 3.0 + 0.005, 0.01), 2))
+
+# %%
+# I --- Load data
+df = pd.read_parquet(path_data + "data_macro_quarterly_urate.parquet")
+country_parameters = pd.read_csv(path_dep + "parameters_by_country_quarterly.csv")
+
+# %%
+# II --- Additional wrangling
+# First difference
+df["urate_diff"] = df["urate"] - df.groupby("country")["urate"].shift(1)
+# Trim countries
+list_countries_keep = [
+    "australia",
+    "malaysia",
+    "singapore",
+    "thailand",
+    "indonesia",
+    "philippines",
+    "united_states",
+    "united_kingdom",
+    "germany",
+    "france",
+    "italy",
+    "japan",
+    "south_korea",
+    # "taiwan",
+    "hong_kong_sar_china_",
+    "india",
+    "china",
+    "chile",
+    "mexico",
+    "brazil",
+]
+df = df[df["country"].isin(list_countries_keep)]
+
+# %%
+# III --- Compute urate floor for all threshold multipliers
+df_sensitivity, df_tipping = compute_urate_floor_sensitivity(
+    data=df,
+    country_parameters=country_parameters,
+    list_multipliers=list_x_multipliers,
+    level_label="urate",
+    time_label="quarter",
+    bounds_timing_shift=-1,
+    hard_bound=True,
+)
+# Where the current choice of multiplier sits
+df_tipping = df_tipping.merge(
+    country_parameters[["country", "x_multiplier_choice"]], on="country", how="left"
+)
+# The first range of each country starts at the lowest grid point, inclusive
+first_range = df_tipping["x_multiplier_lb"] == df_tipping.groupby("country")[
+    "x_multiplier_lb"
+].transform("min")
+above_lb = (df_tipping["x_multiplier_choice"] > df_tipping["x_multiplier_lb"]) | (
+    first_range & (df_tipping["x_multiplier_choice"] >= min(list_x_multipliers))
+)
+df_tipping["current_choice"] = above_lb & (
+    df_tipping["x_multiplier_choice"] <= df_tipping["x_multiplier_ub"]
+)
+
+# %%
+# IV --- Output
+# Display final dataframes
+df_sensitivity
+df_tipping
+# Save local copy
+df_sensitivity.to_parquet(path_output + "plucking_ugap_quarterly_sensitivity.parquet")
+df_tipping.to_parquet(
+    path_output + "plucking_ugap_quarterly_sensitivity_tipping_points.parquet"
+)
+df_tipping.to_csv(
+    path_output + "plucking_ugap_quarterly_sensitivity_tipping_points.csv",
+    index=False,
+)
+
+# %%
+# X --- Notify
+telsendmsg(
+    conf=tel_config,
+    msg="global-plucking --- analysis_plucking_ugap_quarterly_sensitivity: COMPLETED",
+)
+
+# End
+print("\n----- Ran in " + "{:.0f}".format(time.time() - time_start) + " seconds -----")
+
+# %%
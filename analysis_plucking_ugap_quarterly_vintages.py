@@ -2,7 +2,7 @@
 import pandas as pd
 import numpy as np
 from helper import telsendfiles, telsendimg, telsendmsg
-from helper_plucking import compute_urate_floor
+from helper_plucking import compute_urate_floor_panel
 from datetime import date, timedelta
 import statsmodels.formula.api as smf
 import statsmodels.tsa.api as sm
@@ -24,6 +24,7 @@ path_data = "./data/"
 path_output = "./output/"
 path_ceic = "./ceic/"
 path_dep = "./dep/"
+path_cache = "./cache/"
 tel_config = os.getenv("TEL_CONFIG")
 
 list_t_cutoff = [None, "2019Q4"]
@@ -98,49 +99,31 @@ def capybara(
     col_choice = "urate"
     cols_to_compute_ceilings = [col_choice]
     col_ref = "urate"
-    # Compute ceilings country-by-country
-    count_country = 0
-    for country in tqdm(list(df["country"].unique())):
-        # restrict country
-        if t_cutoff is not None:
-            df_sub = df[(df["country"] == country) & (df["quarter"] <= t_cutoff)].copy()
-        elif t_cutoff is None:
-            df_sub = df[df["country"] == country].copy()
-        df_sub = df_sub.reset_index(drop=True)
-        # restrict time
-        tlb = dict_country_starttime[country]
-        if tlb == "":
-            pass
-        else:
-            df_sub["quarter"] = pd.to_datetime(df_sub["quarter"]).dt.to_period("q")
-            df_sub = df_sub[df_sub["quarter"] >= tlb]
-            df_sub["quarter"] = df_sub["quarter"].astype("str")
-        # draw out what threshold multiplier to use
-        downturn_threshold_multiplier = dict_country_threshold[country]
-        # which country
-        print(
-            "Now estimating for "
-            + country
-            + ", with threshold of X = "
-            + str(round(downturn_threshold_multiplier * df_sub[col_choice].std(), 2))
-        )
-        # compute ceiling (same function is fine, as the DNS algo is stepwise when looking backwards)
-        df_ceiling_sub = compute_urate_floor(
-            data=df_sub,
-            levels_labels=cols_to_compute_ceilings,
-            ref_level_label=col_ref,
-            time_label="quarter",
-            downturn_threshold=downturn_threshold_multiplier,
-            bounds_timing_shift=-1,
-            hard_bound=True,
-        )
-        # consolidate
-        if count_country == 0:
-            df_ceiling = df_ceiling_sub.copy()
-        elif count_country > 0:
-            df_ceiling = pd.concat([df_ceiling, df_ceiling_sub], axis=0)  # top-down
-        # next
-        count_country += 1
+    # Parameters by country
+    country_parameters = pd.DataFrame(
+        {
+            "country": list(dict_country_threshold.keys()),
+            "x_multiplier_choice": list(dict_country_threshold.values()),
+            "tlb": [dict_country_starttime[i] for i in dict_country_threshold.keys()],
+        }
+    )
+    # Restrict vintage
+    if t_cutoff is not None:
+        df = df[df["quarter"] <= t_cutoff]
+    elif t_cutoff is None:
+        pass
+    # Compute ceilings for all countries in parallel
+    df_ceiling = compute_urate_floor_panel(
+        data=df,
+        country_parameters=country_parameters,
+        levels_labels=cols_to_compute_ceilings,
+        ref_level_label=col_ref,
+        time_label="quarter",
+        bounds_timing_shift=-1,
+        hard_bound=True,
+        path_cache=path_cache,
+        path_source=path_data + "data_macro_quarterly_urate.parquet",
+    )
     # Compute urate gap
     df_ceiling["urate_gap"] = df_ceiling["urate"] - df_ceiling["urate_ceiling"]
     # Compute urate gap as ratio (rather than arithmetic distance)
@@ -0,0 +1,99 @@
+# %%
+import pandas as pd
+import numpy as np
+from helper import telsendfiles, telsendimg, telsendmsg
+from helper_plucking import compute_urate_floor_vintages
+from datetime import date, timedelta
+from tqdm import tqdm
+import time
+from dotenv import load_dotenv
+import os
+import ast
+
+time_start = time.time()
+
+# %%
+# 0 --- Main settings
+load_dotenv()
+path_data = "./data/"
+path_output = "./output/"
+path_ceic = "./ceic/"
+path_dep = "./dep/"
+tel_config = os.getenv("TEL_CONFIG")
+
+t_first_vintage = "1995Q1"
+
+# %%
+# I --- Load data
+df = pd.read_parquet(path_data + "data_macro_quarterly_urate.parquet")
+country_parameters = pd.read_csv(path_dep + "parameters_by_country_quarterly.csv")
+
+# %%
+# II --- Additional wrangling
+# Chronological order by country
+df = df.sort_values(by=["country", "quarter"], ascending=[True, True])
+df = df.reset_index(drop=True)
+# First difference
+df["urate_diff"] = df["urate"] - df.groupby("country")["urate"].shift(1)
+# Trim countries
+list_countries_keep = [
+    "australia",
+    "malaysia",
+    "singapore",
+    "thailand",
+    "indonesia",
+    "philippines",
+    "united_states",
+    "united_kingdom",
+    "germany",
+    "france",
+    "italy",
+    "japan",
+    "south_korea",
+    # "taiwan",
+    "hong_kong_sar_china_",
+    "india",
+    "china",
+    "chile",
+    "mexico",
+    "brazil",
+]
+df = df[df["country"].isin(list_countries_keep)]
+# Every quarter from the first vintage to the latest data point
+list_vintages = [
+    str(i)
+    for i in pd.period_range(start=t_first_vintage, end=df["quarter"].max(), freq="q")
+]
+
+# %%
+# III --- Compute real-time urate floor at every vintage
+df_ceiling_vintages = compute_urate_floor_vintages(
+    data=df,
+    country_parameters=country_parameters,
+    list_vintages=list_vintages,
+    level_label="urate",
+    time_label="quarter",
+    bounds_timing_shift=-1,
+    hard_bound=True,
+)
+
+# %%
+# IV --- Output
+# Display final dataframe
+df_ceiling_vintages
+# Save local copy
+df_ceiling_vintages.to_parquet(
+    path_output + "plucking_ugap_quarterly_vintages_realtime.parquet"
+)
+
+# %%
+# X --- Notify
+telsendmsg(
+    conf=tel_config,
+    msg="global-plucking --- analysis_plucking_ugap_quarterly_vintages_realtime: COMPLETED",
+)
+
+# End
+print("\n----- Ran in " + "{:.0f}".format(time.time() - time_start) + " seconds -----")
+
+# %%
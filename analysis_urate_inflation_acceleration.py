@@ -13,6 +13,11 @@ from helper import (
     heatmap,
     pil_img2pdf,
     subplots_linecharts,
+    read_partitioned_store,
+    as_period,
+    transform_panel,
+    lag_panel,
+    index_panel,
 )
 import statsmodels.tsa.api as smt
 from statsmodels.tsa.ar_model import ar_select_order
@@ -34,31 +39,7 @@ path_ceic = "./ceic/"
 tel_config = os.getenv("TEL_CONFIG")
 t_start_q = "1991Q1"
 t_end_q = "2023Q1"
-
-# %%
-# I --- Load data
-# Macro
-df = pd.read_parquet(path_data + "data_macro_quarterly.parquet")
-# UGap
-df_ugap = pd.read_parquet(path_output + "plucking_ugap_quarterly.parquet")
-# df_ugap["quarter"] = pd.to_datetime(df_ugap["month"]).dt.to_period("q")
-# df_ugap = (
-#     df_ugap.groupby(["country", "quarter"])[["urate_ceiling", "urate_gap"]]
-#     .mean()
-#     .reset_index(drop=False)
-# )
-df_ugap["quarter"] = df_ugap["quarter"].astype("str")
-# Expected inflation
-df_expcpi = pd.read_parquet(path_data + "data_macro_quarterly_expcpi.parquet")
-# Merge
-df = df.merge(df_ugap, on=["country", "quarter"], how="outer", validate="one_to_one")
-df = df.merge(df_expcpi, on=["country", "quarter"], how="outer", validate="one_to_one")
-# Sort
-df = df.sort_values(by=["country", "quarter"])
-
-# %%
-# II --- Pre-analysis wrangling
-# Trim countries
+# Countries to read from the data store
 list_countries_keep = [
     "australia",
     "malaysia",
@@ -81,26 +62,65 @@ list_countries_keep = [
     "mexico",
     "brazil",
 ]
+
+# %%
+# I --- Load data
+# Macro
+df = read_partitioned_store(
+    path_store=path_data + "store/",
+    dataset="data_macro",
+    frequency="quarterly",
+    countries=list_countries_keep,
+    path_source=path_data + "data_macro_quarterly.parquet",
+)
+# UGap
+df_ugap = read_partitioned_store(
+    path_store=path_output + "store/",
+    dataset="plucking_ugap",
+    frequency="quarterly",
+    countries=list_countries_keep,
+    path_source=path_output + "plucking_ugap_quarterly.parquet",
+)
+# df_ugap["quarter"] = pd.to_datetime(df_ugap["month"]).dt.to_period("q")
+# df_ugap = (
+#     df_ugap.groupby(["country", "quarter"])[["urate_ceiling", "urate_gap"]]
+#     .mean()
+#     .reset_index(drop=False)
+# )
+df_ugap["quarter"] = df_ugap["quarter"].astype("str")
+# Expected inflation
+df_expcpi = read_partitioned_store(
+    path_store=path_data + "store/",
+    dataset="data_macro_expcpi",
+    frequency="quarterly",
+    countries=list_countries_keep,
+    path_source=path_data + "data_macro_quarterly_expcpi.parquet",
+)
+# Merge
+df = df.merge(df_ugap, on=["country", "quarter"], how="outer", validate="one_to_one")
+df = df.merge(df_expcpi, on=["country", "quarter"], how="outer", validate="one_to_one")
+# Sort
+df = df.sort_values(by=["country", "quarter"])
+
+# %%
+# II --- Pre-analysis wrangling
+# Trim countries
 df = df[df["country"].isin(list_countries_keep)]
 # Transform
 cols_pretransformed = ["rgdp", "m2", "maxgepu", "expcpi"]
 cols_levels = ["reer", "ber", "brent", "gepu"]
 cols_rate = ["stir", "ltir", "privdebt", "privdebt_bank"]
 cols_firstdiff = ["cpi", "corecpi"]
-for col in cols_levels:
-    df[col] = 100 * ((df[col] / df.groupby("country")[col].shift(4)) - 1)
-for col in cols_rate:
-    df[col] = df[col] - df.groupby("country")[col].shift(4)
-for col in cols_firstdiff:
-    df[col] = df[col] - df.groupby("country")[col].shift(1)
+df = transform_panel(df, cols_yoy=cols_levels, cols_diff=cols_rate)
+df = transform_panel(df, cols_diff=cols_firstdiff, periods=1)
 # Generate lagged terms for interacted variables
 df["urate_int_urate_gap"] = df["urate"] * df["urate_gap"]
 # Generate lags
-for lag in range(1, 4 + 1):
-    for col in cols_pretransformed + cols_levels + cols_rate + cols_firstdiff:
-        df[col + "_lag" + str(lag)] = df.groupby("country")[col].shift(lag)
+df = lag_panel(
+    df, cols=cols_pretransformed + cols_levels + cols_rate + cols_firstdiff, n_lags=4
+)
 # Trim dates
-df["quarter"] = pd.to_datetime(df["quarter"]).dt.to_period("q")
+df["quarter"] = as_period(df["quarter"], frequency="quarter")
 df = df[(df["quarter"] >= t_start_q) & (df["quarter"] <= t_end_q)]
 # Reset index
 df = df.reset_index(drop=True)
@@ -369,6 +389,14 @@ nice_group_names_by_country_groups = ["ASEAN-4", "Asian NIEs", "Major EMs", "AEs
 snakecase_group_names_by_country_groups = ["asean4", "asianie", "bigemerging", "adv"]
 rows_by_country_groups = [2, 1, 2, 3]
 cols_by_country_groups = [2, 2, 2, 3]
+# Row range of each country group
+df_nairu_by_group, dict_group_slices = index_panel(
+    data=df_nairu,
+    entities_label="country",
+    groups=dict(
+        zip(snakecase_group_names_by_country_groups, nested_list_country_groups)
+    ),
+)
 for country_groups, snakecase_group_name, nice_group_name, n_rows, n_cols in tqdm(
     zip(
         nested_list_country_groups,
@@ -378,7 +406,7 @@ for country_groups, snakecase_group_name, nice_group_name, n_rows, n_cols in tqd
         cols_by_country_groups,
     )
 ):
-    df_sub = df_nairu[df_nairu["country"].isin(country_groups)].copy()
+    df_sub = df_nairu_by_group.iloc[dict_group_slices[snakecase_group_name]].copy()
     df_sub["quarter"] = df_sub["quarter"].astype("str")
     fig = subplots_linecharts(
         data=df_sub,
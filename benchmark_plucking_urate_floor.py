@@ -0,0 +1,237 @@
+# %%
+import pandas as pd
+import numpy as np
+from helper import telsendmsg
+from helper_plucking import (
+    find_peaks_troughs,
+    extrapolate_ceiling,
+    compute_urate_floor_panel,
+    generate_synthetic_urate_panel,
+)
+from datetime import datetime
+import contextlib
+import io
+import json
+import platform
+import time
+from dotenv import load_dotenv
+import os
+
+time_start = time.time()
+
+# %%
+# 0 --- Main settings
+load_dotenv()
+path_output = "./output/"
+tel_config = os.getenv("TEL_CONFIG")
+
+# Panel sizes and lengths to benchmark
+list_n_countries = [10, 100, 1000]
+dict_n_periods = {"quarter": 160, "month": 480}  # 40 years each
+downturn_threshold_multiplier = 1  # x times standard deviation
+n_repeats = 3  # best and median of n runs
+n_jobs = None  # worker processes for the full panel run; None uses all cores
+
+# Flag stages that are slower than the baseline by more than this ratio
+regression_tolerance = 1.25
+file_report = path_output + "benchmark_plucking_urate_floor"
+file_baseline = path_output + "benchmark_plucking_urate_floor_baseline.json"
+update_baseline = False  # overwrite the baseline with this run
+
+
+# %%
+# I --- Stages of compute_urate_floor, timed separately
+def time_stage(func, n_repeats):
+    func()  # warm up imports, so they are not timed
+    list_seconds = []
+    for i in range(n_repeats):
+        t = time.perf_counter()
+        func()
+        list_seconds += [time.perf_counter() - t]
+    return float(np.min(list_seconds)), float(np.median(list_seconds))
+
+
+def prepare_stage_inputs(df, time_label):
+    # one entry per country, as compute_urate_floor sees it
+    list_inputs = []
+    for entity, df_sub in df.groupby("country", sort=False):
+        df_sub = df_sub.reset_index(drop=True)
+        levels = df_sub["urate"].to_numpy()
+        threshold = df_sub["urate"].std() * downturn_threshold_multiplier
+        list_time = list(df_sub[time_label])
+        list_peaks, list_troughs = find_peaks_troughs(
+            levels=levels,
+            index=df_sub.index.to_numpy(),
+            time=list_time,
+            threshold=threshold,
+        )
+        is_peak = df_sub[time_label].isin(list_peaks).astype("float")
+        ceiling = df_sub["urate"].where(is_peak == 1)
+        cepi = is_peak.cumsum()
+        cepi[is_peak == 1] = cepi - 1
+        # interpolated between peaks only, leaving both ends to extrapolate
+        ceiling_inside = ceiling.interpolate(method="linear", limit_area="inside")
+        list_inputs += [
+            {
+                "levels": levels,
+                "index": df_sub.index.to_numpy(),
+                "time": list_time,
+                "threshold": threshold,
+                "ceiling": ceiling,
+                "ceiling_inside": ceiling_inside,
+                "cepi": cepi,
+            }
+        ]
+    return list_inputs
+
+
+def run_detection(list_inputs):
+    for inputs in list_inputs:
+        find_peaks_troughs(
+            levels=inputs["levels"],
+            index=inputs["index"],
+            time=inputs["time"],
+            threshold=inputs["threshold"],
+        )
+
+
+def run_interpolation(list_inputs):
+    # same fallbacks as compute_urate_floor
+    for inputs in list_inputs:
+        try:
+            inputs["ceiling"].interpolate(method="quadratic")
+        except:
+            try:
+                inputs["ceiling"].interpolate(method="slinear")
+            except:
+                inputs["ceiling"].interpolate(method="linear")
+
+
+def run_extrapolation(list_inputs):
+    for inputs in list_inputs:
+        extrapolate_ceiling(ceiling=inputs["ceiling_inside"], cepi=inputs["cepi"])
+
+
+def run_panel(df, country_parameters, time_label):
+    with contextlib.redirect_stdout(io.StringIO()):  # silence episode tables
+        compute_urate_floor_panel(
+            data=df,
+            country_parameters=country_parameters,
+            levels_labels=["urate"],
+            ref_level_label="urate",
+            time_label=time_label,
+            bounds_timing_shift=-1,
+            hard_bound=True,
+            n_jobs=n_jobs,
+        )
+
+
+# %%
+# II --- Run benchmarks
+list_records = []
+for time_label, n_periods in dict_n_periods.items():
+    for n_countries in list_n_countries:
+        df = generate_synthetic_urate_panel(
+            n_countries=n_countries, n_periods=n_periods, frequency=time_label
+        )
+        country_parameters = pd.DataFrame(
+            {
+                "country": list(df["country"].unique()),
+                "x_multiplier_choice": downturn_threshold_multiplier,
+                "tlb": "",
+            }
+        )
+        list_inputs = prepare_stage_inputs(df=df, time_label=time_label)
+        dict_stages = {
+            "detection": lambda: run_detection(list_inputs),
+            "interpolation": lambda: run_interpolation(list_inputs),
+            "extrapolation": lambda: run_extrapolation(list_inputs),
+            "panel": lambda: run_panel(df, country_parameters, time_label),
+        }
+        for stage, func in dict_stages.items():
+            seconds_best, seconds_median = time_stage(func=func, n_repeats=n_repeats)
+            list_records += [
+                {
+                    "frequency": time_label,
+                    "n_countries": n_countries,
+                    "n_periods": n_periods,
+                    "stage": stage,
+                    "seconds_best": seconds_best,
+                    "seconds_median": seconds_median,
+                    "ms_per_country": 1000 * seconds_best / n_countries,
+                }
+            ]
+            print(
+                time_label
+                + " | "
+                + str(n_countries)
+                + " countries | "
+                + stage
+                + ": "
+                + "{:.3f}".format(seconds_best)
+                + "s"
+            )
+df_report = pd.DataFrame(list_records)
+
+# %%
+# III --- Compare against baseline
+cols_key = ["frequency", "n_countries", "n_periods", "stage"]
+if os.path.isfile(file_baseline):
+    with open(file_baseline) as f:
+        df_baseline = pd.DataFrame(json.load(f)["results"])
+    df_report = df_report.merge(
+        df_baseline[cols_key + ["seconds_best"]].rename(
+            columns={"seconds_best": "seconds_baseline"}
+        ),
+        on=cols_key,
+        how="left",
+    )
+    df_report["ratio_to_baseline"] = (
+        df_report["seconds_best"] / df_report["seconds_baseline"]
+    )
+    df_report["regression"] = df_report["ratio_to_baseline"] > regression_tolerance
+else:
+    df_report["seconds_baseline"] = np.nan
+    df_report["ratio_to_baseline"] = np.nan
+    df_report["regression"] = False
+df_regressions = df_report[df_report["regression"]]
+
+# %%
+# IV --- Output
+dict_report = {
+    "timestamp": datetime.now().isoformat(timespec="seconds"),
+    "python": platform.python_version(),
+    "pandas": pd.__version__,
+    "numpy": np.__version__,
+    "cpu_count": os.cpu_count(),
+    "n_repeats": n_repeats,
+    "regression_tolerance": regression_tolerance,
+    "results": df_report.replace({np.nan: None}).to_dict(orient="records"),
+}
+with open(file_report + ".json", "w") as f:
+    json.dump(dict_report, f, indent=2)
+df_report.to_csv(file_report + ".csv", index=False)
+if update_baseline or not os.path.isfile(file_baseline):
+    with open(file_baseline, "w") as f:
+        json.dump(dict_report, f, indent=2)
+
+# %%
+# X --- Notify
+if len(df_regressions) > 0:
+    print(df_regressions[cols_key + ["seconds_best", "seconds_baseline"]])
+    telsendmsg(
+        conf=tel_config,
+        msg="global-plucking --- benchmark_plucking_urate_floor: "
+        + str(len(df_regressions))
+        + " REGRESSIONS",
+    )
+else:
+    telsendmsg(
+        conf=tel_config,
+        msg="global-plucking --- benchmark_plucking_urate_floor: COMPLETED",
+    )
+
+# End
+print("\n----- Ran in " + "{:.0f}".format(time.time() - time_start) + " seconds -----")
+
+# %%
@@ -2,7 +2,14 @@
 import pandas as pd
 from datetime import date, timedelta
 import re
-from helper import telsendmsg, telsendimg, telsendfiles, get_data_from_ceic
+from helper import (
+    telsendmsg,
+    telsendimg,
+    telsendfiles,
+    get_data_from_ceic,
+    write_partitioned_store,
+    read_excel_cached,
+)
 import statsmodels.tsa.api as smt
 from statsmodels.tsa.ar_model import ar_select_order
 from tqdm import tqdm
@@ -19,13 +26,20 @@ load_dotenv()
 path_data = "./data/"
 path_output = "./output/"
 path_ceic = "./ceic/"
+path_cache = "./cache/"
+path_store = path_data + "store/"  # partitioned by frequency and country
 tel_config = os.getenv("TEL_CONFIG")
 t_start = date(1947, 1, 1)
 
 
 # %%
 # I --- Load data
-df = pd.read_excel(path_data + "Consensus_CPI_forecast.xlsx", sheet_name="12m_ahead")
+# Parsed from the workbook only when the file changes
+df = read_excel_cached(
+    path_workbook=path_data + "Consensus_CPI_forecast.xlsx",
+    sheet_name="12m_ahead",
+    path_cache=path_cache,
+)
 
 # %%
 # II --- Wrangle into monthly frame
@@ -56,9 +70,12 @@ dict_rename_wide = {
 df = df.rename(columns=dict_rename_wide)
 # Date format
 df["month"] = pd.to_datetime(df["month"]).dt.to_period("m")
-df["month"] = df["month"].astype("str")
 # Delete eurozone
 del df["eurozone"]
+# Quarterly averages, taken on the wide frame (one groupby for all countries)
+df_q = df.groupby(df["month"].dt.asfreq("q").rename("quarter")).mean(numeric_only=True)
+df_q = df_q.reset_index(drop=False)
+df["month"] = df["month"].astype("str")
 # Convert into long form
 list_countries = [i for i in df.columns if "month" not in i]
 df = pd.melt(
@@ -74,18 +91,37 @@ df = df.reset_index(drop=True)
 # Output monthly frame
 df_m = df.copy()
 df_m.to_parquet(path_data + "data_macro_monthly_expcpi.parquet")
+write_partitioned_store(
+    data=df_m,
+    path_store=path_store,
+    dataset="data_macro_expcpi",
+    frequency="monthly",
+    time_label="month",
+    path_source=path_data + "data_macro_monthly_expcpi.parquet",
+)
 
 # %%
 # III --- Wrangle into quarterly frame
-# Generate copy
-df_q = df_m.copy()
-# Generate quarter identifiers
-df_q["quarter"] = pd.to_datetime(df_q["month"]).dt.to_period("q")
+# Convert into long form
+df_q = pd.melt(
+    df_q,
+    id_vars=["quarter"],
+    var_name="country",
+    value_vars=list_countries,
+    value_name="expcpi",
+)
+df_q = df_q.sort_values(by=["country", "quarter"])
 df_q["quarter"] = df_q["quarter"].astype("str")
-# Collapse
-df_q = df_q.groupby(["country", "quarter"])["expcpi"].mean().reset_index(drop=False)
+df_q = df_q[["country", "quarter", "expcpi"]].reset_index(drop=True)
 # Output quarterly frame
 df_q.to_parquet(path_data + "data_macro_quarterly_expcpi.parquet")
+write_partitioned_store(
+    data=df_q,
+    path_store=path_store,
+    dataset="data_macro_expcpi",
+    frequency="quarterly",
+    path_source=path_data + "data_macro_quarterly_expcpi.parquet",
+)
 
 # %%
 # X --- Notify
@@ -2,7 +2,18 @@
 import pandas as pd
 from datetime import date, timedelta
 import re
-from helper import telsendmsg, telsendimg, telsendfiles, get_data_from_ceic
+from helper import (
+    telsendmsg,
+    telsendimg,
+    telsendfiles,
+    get_data_from_ceic,
+    refresh_data_from_ceic,
+    consolidate_columns_wide,
+    write_partitioned_store,
+    convert_frequency,
+    read_series_catalogue,
+    get_data_from_catalogue,
+)
 import statsmodels.tsa.api as smt
 from statsmodels.tsa.ar_model import ar_select_order
 from tqdm import tqdm
@@ -19,50 +30,72 @@ load_dotenv()
 path_data = "./data/"
 path_output = "./output/"
 path_ceic = "./ceic/"
+path_cache = "./cache/"
 tel_config = os.getenv("TEL_CONFIG")
 t_start = date(1947, 1, 1)
+n_workers_ceic = 8  # series downloaded at the same time
+max_calls_per_second_ceic = 5  # CEIC rate limit
+cache_ttl_days_ceic = 7  # download again after n days
+offline_ceic = False  # rebuild from ./cache/ only, without calling CEIC
+incremental_ceic = True  # only download new and recently revised time points
+path_store_ceic = path_data + "ceic_store/"
+max_age_hours_catalogue = 12  # reuse the shared download of all series lists
+path_store = path_data + "store/"  # partitioned by frequency and country
 
 # %%
 # I --- Load data from CEIC
 # %%
 # Country panel
-seriesids_all = pd.read_csv(path_ceic + "ceic_macro_quarterly" + ".csv")
-count_col = 0
-for col in list(seriesids_all.columns):
-    # subset column by column
-    seriesids = seriesids_all[col].dropna()
-    seriesids = seriesids.astype("str")
-    seriesids = [i.replace(".0", "") for i in seriesids]  # remove trailing decimals
-    seriesids = [re.sub("[^0-9]+", "", i) for i in list(seriesids)]  # keep only number
-    seriesids = [int(i) for i in seriesids]  # convert into list of int
-    # pull from ceic one by one
-    print("Now downloading " + col)
-    # print(', '.join([str(i) for i in seriesids]))
-    df_sub = get_data_from_ceic(
-        series_ids=seriesids, start_date=t_start, historical_extension=True
-    )
+# Series of every list are downloaded once, and shared with the other compile scripts
+catalogue = read_series_catalogue(path_ceic=path_ceic)
+df_ceic = get_data_from_catalogue(
+    catalogue=catalogue,
+    sources=["macro_quarterly"],
+    start_date=t_start,
+    path_cache=path_cache,
+    max_age_hours=max_age_hours_catalogue,
+    incremental=incremental_ceic,
+    path_store=path_store_ceic,
+    n_workers=n_workers_ceic,
+    max_calls_per_second=max_calls_per_second_ceic,
+    cache_ttl_days=cache_ttl_days_ceic,
+    offline=offline_ceic,
+)
+list_df = []
+for col, df_sub in df_ceic.groupby("variable", sort=False):
     # wrangle
-    df_sub = df_sub.reset_index()
-    df_sub = df_sub.rename(columns={"date": "date", "country": "country", "value": col})
+    df_sub = df_sub.rename(columns={"value": col})
     # collapse into quarterly
-    df_sub["quarter"] = pd.to_datetime(df_sub["date"]).dt.to_period("q")  # quarterly
-    df_sub = df_sub.groupby(["quarter", "country"])[col].mean().reset_index(drop=False)
+    df_sub = convert_frequency(
+        data=df_sub, cols=[col], time_label="date", frequency_to="quarter"
+    )
     df_sub = df_sub[["quarter", "country", col]]
-    # merge
-    if count_col == 0:
-        df = df_sub.copy()
-    elif count_col > 0:
-        df = df.merge(df_sub, on=["quarter", "country"], how="outer", validate="one_to_one")
-    # next
-    count_col += 1
-df = df.reset_index(drop=True)
+    # collect, to be merged in one go
+    list_df += [df_sub]
+# outer-merge all columns on quarter and country
+df = consolidate_columns_wide(list_df=list_df, cols_groups=["quarter", "country"])
 # %%
 # Global variables
-df_global = get_data_from_ceic(
-    series_ids=[42651501, 424145097],
-    start_date=t_start,
-    historical_extension=True
-)
+if incremental_ceic:
+    df_global = refresh_data_from_ceic(
+        series_ids=[42651501, 424145097],
+        start_date=t_start,
+        path_store=path_store_ceic,
+        n_workers=n_workers_ceic,
+        max_calls_per_second=max_calls_per_second_ceic,
+        offline=offline_ceic,
+    )
+else:
+    df_global = get_data_from_ceic(
+        series_ids=[42651501, 424145097],
+        start_date=t_start,
+        historical_extension=True,
+        n_workers=n_workers_ceic,
+        max_calls_per_second=max_calls_per_second_ceic,
+        path_cache=path_cache,
+        cache_ttl_days=cache_ttl_days_ceic,
+        offline=offline_ceic,
+    )
 df_global = pd.pivot(data=df_global, index="date", columns="name", values="value")
 df_global = df_global.reset_index(drop=False)
 df_global.columns.name = None
@@ -72,8 +105,13 @@ df_global = df_global.rename(
         "economic_policy_uncertainty_index_global_ppp_adjusted_gdp": "gepu"
         }
     )
-df_global["quarter"] = pd.to_datetime(df_global["date"]).dt.to_period("q")  # quarterly
-df_global = df_global.groupby("quarter")[["brent", "gepu"]].mean().reset_index(drop=False)
+df_global = convert_frequency(
+    data=df_global,
+    cols=["brent", "gepu"],
+    time_label="date",
+    frequency_to="quarter",
+    entities_label=None,
+)
 # %%
 # Compute max-uncertainty
 df_global["_zero"] = 0
@@ -106,6 +144,13 @@ df = df.sort_values(by=cols_groups, ascending=[True, True])
 df = df.reset_index(drop=True)
 # Save processed output
 df.to_parquet(path_data + "data_macro_quarterly" + ".parquet")
+write_partitioned_store(
+    data=df,
+    path_store=path_store,
+    dataset="data_macro",
+    frequency="quarterly",
+    path_source=path_data + "data_macro_quarterly" + ".parquet",
+)
 
 # %%
 # X --- Notify
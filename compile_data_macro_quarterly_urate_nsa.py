@@ -8,8 +8,11 @@ from helper import (
     telsendmsg,
     telsendimg,
     telsendfiles,
-    get_data_from_ceic,
-    x13_deseasonalise,
+    consolidate_columns_wide,
+    deseasonalise_panel,
+    convert_frequency,
+    read_series_catalogue,
+    get_data_from_catalogue,
 )
 import statsmodels.tsa.api as smt
 from statsmodels.tsa.ar_model import ar_select_order
@@ -27,41 +30,48 @@ load_dotenv()
 path_data = "./data/"
 path_output = "./output/"
 path_ceic = "./ceic/"
+path_cache = "./cache/"
 tel_config = os.getenv("TEL_CONFIG")
 t_start = date(1947, 1, 1)
+n_workers_ceic = 8  # series downloaded at the same time
+max_calls_per_second_ceic = 5  # CEIC rate limit
+cache_ttl_days_ceic = 7  # download again after n days
+offline_ceic = False  # rebuild from ./cache/ only, without calling CEIC
+incremental_ceic = True  # only download new and recently revised time points
+path_store_ceic = path_data + "ceic_store/"
+max_age_hours_catalogue = 12  # reuse the shared download of all series lists
+n_workers_x13 = None  # X-13 runs at the same time; None uses all cores
 
 # %%
 # I --- Load data from CEIC
-seriesids_all = pd.read_csv(path_ceic + "ceic_macro_quarterly_urate_nsa" + ".csv")
-count_col = 0
-for col in list(seriesids_all.columns):
-    # subset column by column
-    seriesids = seriesids_all[col].dropna()
-    seriesids = seriesids.astype("str")
-    seriesids = [i.replace(".0", "") for i in seriesids]  # remove trailing decimals
-    seriesids = [re.sub("[^0-9]+", "", i) for i in list(seriesids)]  # keep only number
-    seriesids = [int(i) for i in seriesids]  # convert into list of int
-    # pull from ceic one by one
-    print("Now downloading " + col)
-    # print(', '.join([str(i) for i in seriesids]))
-    df_sub = get_data_from_ceic(
-        series_ids=seriesids, start_date=t_start, historical_extension=True
-    )
+# Series of every list are downloaded once, and shared with the other compile scripts
+catalogue = read_series_catalogue(path_ceic=path_ceic)
+df_ceic = get_data_from_catalogue(
+    catalogue=catalogue,
+    sources=["macro_quarterly_urate_nsa"],
+    start_date=t_start,
+    path_cache=path_cache,
+    max_age_hours=max_age_hours_catalogue,
+    incremental=incremental_ceic,
+    path_store=path_store_ceic,
+    n_workers=n_workers_ceic,
+    max_calls_per_second=max_calls_per_second_ceic,
+    cache_ttl_days=cache_ttl_days_ceic,
+    offline=offline_ceic,
+)
+list_df = []
+for col, df_sub in df_ceic.groupby("variable", sort=False):
     # wrangle
-    df_sub = df_sub.reset_index()
-    df_sub = df_sub.rename(columns={"date": "date", "country": "country", "value": col})
-    # collapse into monthly
-    df_sub["quarter"] = pd.to_datetime(df_sub["date"]).dt.to_period("q")
-    df_sub = df_sub.groupby(["quarter", "country"])[col].mean().reset_index(drop=False)
+    df_sub = df_sub.rename(columns={"value": col})
+    # collapse into quarterly
+    df_sub = convert_frequency(
+        data=df_sub, cols=[col], time_label="date", frequency_to="quarter"
+    )
     df_sub = df_sub[["quarter", "country", col]]
-    # merge
-    if count_col == 0:
-        df = df_sub.copy()
-    elif count_col > 0:
-        df = df.merge(df_sub, on=["quarter", "country"], how="outer")
-    # next
-    count_col += 1
-df = df.reset_index(drop=True)
+    # collect, to be merged in one go
+    list_df += [df_sub]
+# outer-merge all columns on quarter and country
+df = consolidate_columns_wide(list_df=list_df, cols_groups=["quarter", "country"])
 # save interim copy
 df["quarter"] = df["quarter"].astype("str")
 df.to_parquet(path_data + "data_macro_quarterly_urate_nsa_raw" + ".parquet")
@@ -78,24 +88,17 @@ df = df.sort_values(by=cols_groups, ascending=[True, True])
 df = df.dropna(subset=["urate"], axis=0)
 # Reset indices
 df = df.reset_index(drop=True)
-# Now seasonally adjust the series
-df_sa = pd.DataFrame(columns=cols_groups + ["urate"])
-for country in list(df["country"].unique()):
-    # subset
-    df_sub = df[df["country"] == country].copy()
-    # set periodindex
-    df_sub["quarter"] = pd.to_datetime(df_sub["quarter"]).dt.to_period("q")
-    df_sub = df_sub.set_index("quarter")
-    # adjust
-    df_sub = x13_deseasonalise(
-        data=df_sub,
-        cols_to_adj=["urate"]
-    )
-    # wrangle
-    df_sub = df_sub.reset_index(drop=False)
-    df_sub["quarter"] = df_sub["quarter"].astype("str")
-    # merge
-    df_sa = pd.concat([df_sa, df_sub], axis=0)
+# Now seasonally adjust the series, all countries at once (only new or revised series are re-run)
+df_sa = deseasonalise_panel(
+    data=df,
+    cols_to_adj=["urate"],
+    entities_label="country",
+    time_label="quarter",
+    n_workers=n_workers_x13,
+    path_cache=path_cache,
+)
+cols_first = cols_groups + ["urate"]
+df_sa = df_sa[cols_first + [i for i in df_sa.columns if i not in cols_first]]
 
 # Save processed output
 df_sa.to_parquet(path_data + "data_macro_quarterly_urate_nsa_sadjusted" + ".parquet")
@@ -8,6 +8,7 @@ from helper import (
     subplots_scatterplots,
     scatterplot,
     pil_img2pdf,
+    index_panel,
 )
 from helper_plucking import compute_urate_floor
 from datetime import date, timedelta
@@ -182,6 +183,14 @@ plot_colours = [
 ] * 2
 # %%
 # Plot by choice of y-axis
+# Row range of each country group
+df_by_group, dict_group_slices = index_panel(
+    data=df,
+    entities_label="country",
+    groups=dict(
+        zip(snakecase_group_names_by_country_groups, nested_list_country_groups)
+    ),
+)
 for col_y, col_y_nice, plot_colour in zip(cols_y, cols_y_nice, plot_colours):
     list_file_names = []
     for country_groups, snakecase_group_name, nice_group_name, n_rows, n_cols in tqdm(
@@ -193,7 +202,7 @@ for col_y, col_y_nice, plot_colour in zip(cols_y, cols_y_nice, plot_colours):
             cols_by_country_groups,
         )
     ):
-        df_sub = df[df["country"].isin(country_groups)].copy()
+        df_sub = df_by_group.iloc[dict_group_slices[snakecase_group_name]]
         fig_urate_and_ceiling = subplots_scatterplots(
             data=df_sub,
             col_group="country",
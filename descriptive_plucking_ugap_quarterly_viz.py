@@ -9,6 +9,7 @@ from helper import (
     get_data_from_ceic,
     subplots_linecharts,
     pil_img2pdf,
+    index_panel,
 )
 import statsmodels.tsa.api as smt
 from statsmodels.tsa.ar_model import ar_select_order
@@ -113,6 +114,14 @@ dict_countries_snake_to_nice = {
 # %%
 # III --- Plot
 list_file_names = []
+# Row range of each country group
+df_by_group, dict_group_slices = index_panel(
+    data=df,
+    entities_label="country",
+    groups=dict(
+        zip(snakecase_group_names_by_country_groups, nested_list_country_groups)
+    ),
+)
 for country_groups, snakecase_group_name, nice_group_name, n_rows, n_cols in tqdm(
     zip(
         nested_list_country_groups,
@@ -122,7 +131,7 @@ for country_groups, snakecase_group_name, nice_group_name, n_rows, n_cols in tqd
         cols_by_country_groups,
     )
 ):
-    df_sub = df[df["country"].isin(country_groups)].copy()
+    df_sub = df_by_group.iloc[dict_group_slices[snakecase_group_name]].copy()
     df_sub["country"] = df_sub["country"].replace(dict_countries_snake_to_nice)
     fig_urate_and_ceiling = subplots_linecharts(
         data=df_sub,
@@ -10,7 +10,11 @@ from helper import (
     outlier_isolationforest,
     outlier_tailends,
 )
-from helper_plucking import compute_urate_floor
+from helper_plucking import (
+    compute_urate_floor_panel,
+    compute_episode_stats,
+    pair_episodes,
+)
 from datetime import date, timedelta
 import statsmodels.formula.api as smf
 import statsmodels.tsa.api as sm
@@ -32,6 +36,7 @@ path_data = "./data/"
 path_output = "./output/"
 path_ceic = "./ceic/"
 path_dep = "./dep/"
+path_cache = "./cache/"
 tel_config = os.getenv("TEL_CONFIG")
 
 # %%
@@ -91,105 +96,28 @@ col_ref = "urate"
 
 
 # %%
-# Define function
-def compute_bizcycle_paces(data, entities_label, rows_per_epi):
-    # deep copy
-    df = data.copy()
-    # blank data frame
-    df_consol = pd.DataFrame(
-        columns=list(df.columns)
-        + [
-            col_choice + "peak",
-            col_choice + "trough",
-            col_choice + "epi",
-            col_choice + "pace",
-        ]
-    )
-    df_expcon_consol = pd.DataFrame(
-        columns=[entities_label, "expansion_pace", "subsequent_contraction_pace"]
-    )
-    df_conexp_consol = pd.DataFrame(
-        columns=[entities_label, "contraction_pace", "subsequent_expansion_pace"]
-    )
-    # list of countries
-    list_entities = list(df[entities_label].unique())
-    # episodes by country
-    count_entity = 0
-    for entity in tqdm(list_entities):
-        # subset
-        df_sub = df[df[entities_label] == entity].copy()
-        df_sub = df_sub.reset_index(drop=True)
-        # restrict time
-        tlb = dict_country_tlb[entity]
-        if tlb == "":
-            pass
-        else:
-            df_sub["quarter"] = pd.to_datetime(df_sub["quarter"]).dt.to_period("q")
-            df_sub = df_sub[df_sub["quarter"] >= tlb]
-            df_sub["quarter"] = df_sub["quarter"].astype("str")
-        # draw out what threshold multiplier to use
-        downturn_threshold_multiplier = dict_country_x_multiplier[entity]
-        # which country
-        print(
-            "Now estimating for "
-            + entity
-            + ", with threshold of X = "
-            + str(round(downturn_threshold_multiplier * df_sub[col_choice].std(), 2))
-        )
-        # identify peaks and troughs
-        df_sub = compute_urate_floor(
-            data=df_sub,
-            levels_labels=cols_to_compute_ceilings,
-            ref_level_label=col_ref,
-            time_label="quarter",
-            downturn_threshold=downturn_threshold_multiplier,
-            bounds_timing_shift=-1,
-            hard_bound=True,
-        )
-        # restrict that  n rows of each episode
-        if rows_per_epi is not None:
-            df_sub = (
-                df_sub.groupby(col_choice + "_epi")
-                .head(rows_per_epi)
-                .sort_values(by=col_choice + "_epi")
-                .reset_index(drop=False)
-            )
-        elif rows_per_epi is None:
-            pass
-        # parse episodes and valid countries
-        if df_sub[col_choice + "_epi"].max() == 0:
-            pass
-        else:
-            df_sub = df_sub[[col_choice + "_pace", col_choice + "_epi"]]
-            df_sub = df_sub.groupby(col_choice + "_epi").agg("mean")
-            df_sub = pd.DataFrame(df_sub)
-            df_consol = pd.concat([df_consol, df_sub], axis=0)
-            # expcon frame
-            expansions = df_sub.iloc[::2].reset_index(drop=True)
-            subsequent_contractions = df_sub.iloc[1::2].reset_index(drop=True)
-            df_expcon = pd.concat(
-                [expansions, subsequent_contractions], axis=1
-            ).dropna()
-            df_expcon.columns = ["expansion_pace", "subsequent_contraction_pace"]
-            df_expcon[entities_label] = entity
-            df_expcon_consol = pd.concat([df_expcon_consol, df_expcon], axis=0)
-            # conexp frame
-            contractions = df_sub.iloc[1::2].reset_index(drop=True)
-            subsequent_expansions = df_sub.iloc[2::2].reset_index(drop=True)
-            df_conexp = pd.concat(
-                [contractions, subsequent_expansions], axis=1
-            ).dropna()
-            df_conexp.columns = ["contraction_pace", "subsequent_expansion_pace"]
-            df_conexp[entities_label] = entity
-            df_conexp_consol = pd.concat([df_conexp_consol, df_conexp], axis=0)
-        # next
-        count_entity += 1
-    # output
-    return df_consol, df_expcon_consol, df_conexp_consol
-
-
-df, df_expcon, df_conexp = compute_bizcycle_paces(
-    data=df, entities_label="country", rows_per_epi=None
+# Identify peaks and troughs for all countries in parallel
+df_floor = compute_urate_floor_panel(
+    data=df,
+    country_parameters=country_parameters,
+    levels_labels=cols_to_compute_ceilings,
+    ref_level_label=col_ref,
+    time_label="quarter",
+    bounds_timing_shift=-1,
+    hard_bound=True,
+    entities_label="country",
+    path_cache=path_cache,
+    path_source=path_data + "data_macro_quarterly_urate.parquet",
+)
+# Episodic stats and Exp_{t} ->> Con_{t+1} and Con_{t} ->> Exp_{t+1} pairs
+df = compute_episode_stats(
+    data=df_floor, level_label=col_choice, entities_label="country", rows_per_epi=None
+)
+df_expcon, df_conexp = pair_episodes(
+    data=df,
+    stat_label=col_choice + "_pace",
+    stat_suffix="pace",
+    entities_label="country",
 )
 df_expcon_avg = df_expcon.groupby("country").agg("mean")
 df_conexp_avg = df_conexp.groupby("country").agg("mean")
@@ -12,6 +12,8 @@ from helper import (
     lineplot_dualaxes,
     pil_img2pdf,
     heatmap,
+    as_period,
+    convert_frequency,
 )
 from helper_plucking import compute_urate_floor
 from datetime import date, timedelta
@@ -56,29 +58,44 @@ df_expcpi = pd.read_parquet(path_data + "data_macro_quarterly_expcpi.parquet")
 # NAIRU for the US
 df_nairu_us = pd.read_csv(path_data + "us_cbo_nairu.csv")
 df_nairu_us = df_nairu_us.rename(columns={"DATE": "quarter", "NROU": "nairu"})
-df_nairu_us["quarter"] = pd.to_datetime(df_nairu_us["quarter"]).dt.to_period("q")
+df_nairu_us["quarter"] = as_period(df_nairu_us["quarter"], frequency="quarter")
 df_nairu_us["country"] = "united_states"
 df_nairu_us["quarter"] = df_nairu_us["quarter"].astype("str")
 # Extended WTI
 df_wti_us = pd.read_csv(path_data + "us_fred_wti.csv")
 df_wti_us = df_wti_us.rename(columns={"DATE": "month", "WTISPLC": "wti"})
-df_wti_us["quarter"] = pd.to_datetime(df_wti_us["month"]).dt.to_period("q")
-df_wti_us = df_wti_us.groupby("quarter")["wti"].mean().reset_index(drop=False)
-df_wti_us["quarter"] = df_wti_us["quarter"].astype("str")
+df_wti_us = convert_frequency(
+    data=df_wti_us,
+    cols=["wti"],
+    time_label="month",
+    frequency_to="quarter",
+    entities_label=None,
+    output="str",
+)
 # US wages
 df_wage_us = pd.read_csv(path_data + "us_fred_wage.csv")
 df_wage_us = df_wage_us.rename(columns={"DATE": "month", "AHETPI": "wage"})
-df_wage_us["quarter"] = pd.to_datetime(df_wage_us["month"]).dt.to_period("q")
-df_wage_us = df_wage_us.groupby("quarter")["wage"].mean().reset_index(drop=False)
+df_wage_us = convert_frequency(
+    data=df_wage_us,
+    cols=["wage"],
+    time_label="month",
+    frequency_to="quarter",
+    entities_label=None,
+    output="str",
+)
 df_wage_us["country"] = "united_states"
-df_wage_us["quarter"] = df_wage_us["quarter"].astype("str")
 # US lfpr
 df_lfpr_us = pd.read_csv(path_data + "us_fred_lfpr.csv")
 df_lfpr_us = df_lfpr_us.rename(columns={"DATE": "month", "CIVPART": "lfpr"})
-df_lfpr_us["quarter"] = pd.to_datetime(df_lfpr_us["month"]).dt.to_period("q")
-df_lfpr_us = df_lfpr_us.groupby("quarter")["lfpr"].mean().reset_index(drop=False)
+df_lfpr_us = convert_frequency(
+    data=df_lfpr_us,
+    cols=["lfpr"],
+    time_label="month",
+    frequency_to="quarter",
+    entities_label=None,
+    output="str",
+)
 df_lfpr_us["country"] = "united_states"
-df_lfpr_us["quarter"] = df_lfpr_us["quarter"].astype("str")
 # Merge
 df = df.merge(df_ugap, on=["country", "quarter"], how="outer", validate="one_to_one")
 df = df.merge(df_expcpi, on=["country", "quarter"], how="outer", validate="one_to_one")
@@ -8,6 +8,7 @@ from helper import (
     subplots_scatterplots,
     scatterplot_layered,
     pil_img2pdf,
+    index_panel,
 )
 from helper_plucking import compute_urate_floor
 from datetime import date, timedelta
@@ -173,6 +174,14 @@ plot_colours = [
 
 # %%
 # All observations
+# Row range of each country group
+df_by_group, dict_group_slices = index_panel(
+    data=df,
+    entities_label="country",
+    groups=dict(
+        zip(snakecase_group_names_by_country_groups, nested_list_country_groups)
+    ),
+)
 for col_x, col_x_nice, col_y, col_y_nice, plot_colour in zip(
     cols_x, cols_x_nice, cols_y, cols_y_nice, plot_colours
 ):
@@ -186,7 +195,7 @@ for col_x, col_x_nice, col_y, col_y_nice, plot_colour in zip(
             cols_by_country_groups,
         )
     ):
-        df_sub = df[df["country"].isin(country_groups)].copy()
+        df_sub = df_by_group.iloc[dict_group_slices[snakecase_group_name]]
         fig_urate_and_ceiling = subplots_scatterplots(
             data=df_sub,
             col_group="country",
@@ -253,7 +262,7 @@ for col_x, col_x_nice, col_y, col_y_nice, plot_colour in zip(
         )
     ):
         # restrict to countries of interest
-        df_sub = df[df["country"].isin(country_groups)].copy()
+        df_sub = df_by_group.iloc[dict_group_slices[snakecase_group_name]].copy()
         # split x-axis columns into when H = 0 and H = 1
         df_sub.loc[
             df_sub["urate_gap_is_zero"] == 1, col_x + "_when_urate_gap_is_zero"
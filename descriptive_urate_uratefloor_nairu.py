@@ -13,6 +13,7 @@ from helper import (
     lineplot,
     pil_img2pdf,
     heatmap,
+    as_period,
 )
 from helper_plucking import compute_urate_floor
 from datetime import date, timedelta
@@ -57,7 +58,7 @@ df_expcpi = pd.read_parquet(path_data + "data_macro_quarterly_expcpi.parquet")
 # NAIRU for the US
 df_nairu_us = pd.read_csv(path_data + "us_cbo_nairu.csv")
 df_nairu_us = df_nairu_us.rename(columns={"DATE": "quarter", "NROU": "nairu"})
-df_nairu_us["quarter"] = pd.to_datetime(df_nairu_us["quarter"]).dt.to_period("q")
+df_nairu_us["quarter"] = as_period(df_nairu_us["quarter"], frequency="quarter")
 df_nairu_us["country"] = "united_states"
 df_nairu_us["quarter"] = df_nairu_us["quarter"].astype("str")
 # Merge
@@ -0,0 +1,196 @@
+# %%
+import pandas as pd
+import numpy as np
+from helper import telsendmsg
+from helper_plucking import (
+    compute_urate_floor,
+    compute_urate_floor_panel,
+    generate_synthetic_urate_panel,
+)
+from helper_plucking_reference import (
+    compute_urate_floor_reference,
+    compare_urate_floors,
+)
+import contextlib
+import io
+import time
+from dotenv import load_dotenv
+import os
+
+time_start = time.time()
+
+# %%
+# 0 --- Main settings
+load_dotenv()
+path_data = "./data/"
+path_output = "./output/"
+path_dep = "./dep/"
+tel_config = os.getenv("TEL_CONFIG")
+
+# Randomised synthetic panels, on top of the real quarterly panel
+n_synthetic = 20
+n_countries_synthetic = 25
+seed = 42
+
+# Floor settings as in analysis_plucking_ugap_quarterly.py
+col_choice = "urate"
+cols_to_compute_ceilings = [col_choice]
+col_ref = "urate"
+bounds_timing_shift = -1
+hard_bound = True
+
+
+# %%
+# I --- Reference and candidate engines
+def run_country_loop(func, df, country_parameters, time_label):
+    # country-by-country loop of the published scripts
+    dict_country_x_multiplier = dict(
+        zip(country_parameters["country"], country_parameters["x_multiplier_choice"])
+    )
+    dict_country_tlb = dict(
+        zip(country_parameters["country"], country_parameters["tlb"].fillna(""))
+    )
+    dict_floors = {}
+    for country in list(df["country"].unique()):
+        if country not in dict_country_x_multiplier:
+            continue
+        df_sub = df[df["country"] == country].copy()
+        df_sub = df_sub.reset_index(drop=True)
+        tlb = dict_country_tlb[country]
+        if tlb == "":
+            pass
+        else:
+            df_sub[time_label] = pd.to_datetime(df_sub[time_label]).dt.to_period("q")
+            df_sub = df_sub[df_sub[time_label] >= tlb]
+            df_sub[time_label] = df_sub[time_label].astype("str")
+        dict_floors[country] = func(
+            data=df_sub,
+            levels_labels=cols_to_compute_ceilings,
+            ref_level_label=col_ref,
+            time_label=time_label,
+            downturn_threshold=dict_country_x_multiplier[country],
+            bounds_timing_shift=bounds_timing_shift,
+            hard_bound=hard_bound,
+        )
+    return dict_floors
+
+
+def run_reference(df, country_parameters, time_label):
+    return run_country_loop(
+        compute_urate_floor_reference, df, country_parameters, time_label
+    )
+
+
+def run_compute_urate_floor(df, country_parameters, time_label):
+    # current single-country engine, given the same inputs as the reference
+    return run_country_loop(compute_urate_floor, df, country_parameters, time_label)
+
+
+def run_compute_urate_floor_panel(df, country_parameters, time_label):
+    # parallel panel engine
+    df_floor = compute_urate_floor_panel(
+        data=df,
+        country_parameters=country_parameters,
+        levels_labels=cols_to_compute_ceilings,
+        ref_level_label=col_ref,
+        time_label=time_label,
+        bounds_timing_shift=bounds_timing_shift,
+        hard_bound=hard_bound,
+    )
+    return dict(list(df_floor.groupby("country", sort=False)))
+
+
+# Add alternative engines here; each returns {country: floor output}
+dict_engines = {
+    "compute_urate_floor": run_compute_urate_floor,
+    "compute_urate_floor_panel": run_compute_urate_floor_panel,
+}
+
+# %%
+# II --- Datasets
+list_datasets = []
+# real quarterly panel
+if os.path.isfile(path_data + "data_macro_quarterly_urate.parquet"):
+    df = pd.read_parquet(path_data + "data_macro_quarterly_urate.parquet")
+    df["urate_diff"] = df["urate"] - df.groupby("country")["urate"].shift(1)
+    country_parameters = pd.read_csv(path_dep + "parameters_by_country_quarterly.csv")
+    list_datasets += [("data_macro_quarterly_urate", df, country_parameters, "quarter")]
+# randomised synthetic panels, alternating frequencies
+rng = np.random.default_rng(seed)
+for i in range(n_synthetic):
+    time_label = "quarter" if i % 2 == 0 else "month"
+    df = generate_synthetic_urate_panel(
+        n_countries=n_countries_synthetic,
+        n_periods=int(rng.integers(20, 200)),
+        frequency=time_label,
+        seed=int(rng.integers(0, 2**31)),
+    )
+    list_countries = list(df["country"].unique())
+    # random thresholds, and a random start (as tlb) for some quarterly series
+    list_tlb = [""] * len(list_countries)
+    if time_label == "quarter":
+        list_quarters = list(df["quarter"].unique())
+        list_tlb = [
+            (
+                list_quarters[int(rng.integers(1, len(list_quarters) // 2))]
+                if rng.uniform() < 0.3
+                else ""
+            )
+            for country in list_countries
+        ]
+    country_parameters = pd.DataFrame(
+        {
+            "country": list_countries,
+            "x_multiplier_choice": rng.uniform(0.2, 2.5, len(list_countries)).round(2),
+            "tlb": list_tlb,
+        }
+    )
+    list_datasets += [("synthetic_" + str(i), df, country_parameters, time_label)]
+
+# %%
+# III --- Compare every engine against the reference
+list_divergences = []
+for dataset, df, country_parameters, time_label in list_datasets:
+    with contextlib.redirect_stdout(io.StringIO()):  # silence episode tables
+        dict_reference = run_reference(df, country_parameters, time_label)
+    for engine, run_engine in dict_engines.items():
+        with contextlib.redirect_stdout(io.StringIO()):
+            dict_candidate = run_engine(df, country_parameters, time_label)
+        for country, df_reference in dict_reference.items():
+            if country not in dict_candidate:
+                df_divergence = pd.DataFrame({"column": ["(country missing)"]})
+            else:
+                df_divergence = compare_urate_floors(
+                    df_reference=df_reference,
+                    df_candidate=dict_candidate[country],
+                    time_label=time_label,
+                )
+            df_divergence.insert(0, "country", country)
+            df_divergence.insert(0, "engine", engine)
+            df_divergence.insert(0, "dataset", dataset)
+            list_divergences += [df_divergence]
+    print(dataset + ": compared " + str(len(dict_reference)) + " countries")
+df_divergences = pd.concat(list_divergences, axis=0, ignore_index=True)
+
+# %%
+# IV --- Output
+df_divergences.to_csv(path_output + "equivalence_plucking_urate_floor.csv", index=False)
+if len(df_divergences) > 0:
+    print(df_divergences)
+
+# %%
+# X --- Notify
+telsendmsg(
+    conf=tel_config,
+    msg="global-plucking --- equivalence_plucking_urate_floor: "
+    + (
+        "ALL ENGINES MATCH THE REFERENCE"
+        if len(df_divergences) == 0
+        else str(len(df_divergences)) + " COLUMN-LEVEL DIVERGENCES"
+    ),
+)
+
+# End
+print("\n----- Ran in " + "{:.0f}".format(time.time() - time_start) + " seconds -----")
+
+# %%
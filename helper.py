@@ -1,4 +1,5 @@
 import pandas as pd
+import numpy as np
 import telegram_send
 from linearmodels import PanelOLS, RandomEffects
 from pydynpd import regression
@@ -18,6 +19,12 @@ import re
 import os
 import requests
 import json
+import time
+import threading
+import hashlib
+import pickle
+import shutil
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from tqdm import tqdm
 from tabulate import tabulate
@@ -134,11 +141,308 @@ def x13_deseasonalise(data: pd.DataFrame, cols_to_adj: list[str]):
     return df
 
 
+def ma_deseasonalise(series: pd.Series, period: int) -> pd.Series:
+    # classical additive adjustment: centred moving-average trend, then average deviation by season
+    if period % 2 == 0:
+        trend = series.rolling(period).mean().rolling(2).mean().shift(-(period // 2))
+    else:
+        trend = series.rolling(period, center=True).mean()
+    season = np.arange(len(series)) % period
+    seasonal = (series - trend).groupby(season).transform("mean")
+    seasonal = seasonal - seasonal.groupby(season).first().mean()
+    return series - seasonal.fillna(0)
+
+
+def deseasonalise_series(series: pd.Series, fallback: bool = True):
+    """
+    Seasonally adjust one series with X-13, falling back to STL, then to a moving-average adjustment,
+    if the X-13 binary is missing or fails.
+
+    :series `pd.Series`: series with a quarterly or monthly PeriodIndex\n
+    :fallback `Optional[bool]`: use STL or the moving-average adjustment when X-13 fails; if False, X-13 errors are raised\n
+    :return `tuple[pd.Series, str]`: adjusted series, and the method used ("x13", "stl" or "ma")
+    """
+    period = 12 if series.index.freqstr.startswith("M") else 4
+    try:
+        return smt.x13_arima_analysis(endog=series).seasadj, "x13"
+    except Exception:
+        if not fallback:
+            raise
+    try:
+        res = smt.STL(series, period=period, robust=True).fit()
+        return series - res.seasonal, "stl"
+    except Exception:
+        return ma_deseasonalise(series=series, period=period), "ma"
+
+
+def deseasonalise_series_cached(
+    series: pd.Series, path_cache: str = None, fallback: bool = True
+):
+    # look up the adjusted series by a hash of its values and periods
+    if path_cache is None:
+        return deseasonalise_series(series=series, fallback=fallback)
+    key = hashlib.sha256(
+        series.to_numpy(dtype="float64").tobytes()
+        + repr((list(series.index.astype("str")), fallback)).encode()
+    ).hexdigest()
+    path = os.path.join(path_cache, "seasonal_adjustment")
+    file = os.path.join(path, key + ".pkl")
+    if os.path.isfile(file):
+        with open(file, "rb") as f:
+            values, method = pickle.load(f)
+        return pd.Series(values, index=series.index, name=series.name), method
+    series_sa, method = deseasonalise_series(series=series, fallback=fallback)
+    # fallbacks are not cached, so X-13 is tried again next time
+    if method != "x13":
+        return series_sa, method
+    os.makedirs(path, exist_ok=True)
+    with open(file + ".tmp", "wb") as f:
+        pickle.dump((series_sa.to_numpy(), method), f)
+    os.replace(file + ".tmp", file)
+    return series_sa, method
+
+
+def deseasonalise_panel(
+    data: pd.DataFrame,
+    cols_to_adj: list[str],
+    entities_label: str = "country",
+    time_label: str = "quarter",
+    n_workers: int = None,
+    path_cache: str = None,
+    fallback: bool = True,
+) -> pd.DataFrame:
+    """
+    Seasonally adjust every country of a long panel at the same time.
+    Each country-column pair goes to its own X-13 run (an external process), started from a pool of threads;
+    series adjusted by X-13 are cached by a hash of their input, so only new or revised series (or earlier fallbacks) are adjusted again.
+
+    :data `pd.DataFrame`: long panel, with time_label as quarterly or monthly strings (e.g. "1995Q1")\n
+    :cols_to_adj `list[str]`: columns to adjust\n
+    :n_workers `Optional[int]`: number of adjustments running at the same time; None uses all cores\n
+    :path_cache `Optional[str]`: root folder of the cache of adjusted series; None adjusts everything afresh\n
+    :fallback `Optional[bool]`: use STL or the moving-average adjustment when X-13 fails\n
+    :return `pd.DataFrame`: data with cols_to_adj adjusted, stacked country by country
+    """
+    frequency = "quarter" if time_label == "quarter" else "month"
+    data = data.copy()
+    data[time_label] = as_period(data[time_label], frequency=frequency)
+    # one task per country and column
+    list_subs = []
+    list_tasks = []
+    for entity, df_sub in data.groupby(entities_label, sort=False):
+        df_sub = df_sub.set_index(time_label)
+        list_subs += [df_sub]
+        list_tasks += [(len(list_subs) - 1, col, df_sub[col]) for col in cols_to_adj]
+    # adjust
+    with ThreadPoolExecutor(max_workers=n_workers or os.cpu_count()) as pool:
+        list_results = list(
+            tqdm(
+                pool.map(
+                    lambda task: deseasonalise_series_cached(
+                        series=task[2], path_cache=path_cache, fallback=fallback
+                    ),
+                    list_tasks,
+                ),
+                total=len(list_tasks),
+            )
+        )
+    for (i, col, series), (series_sa, method) in zip(list_tasks, list_results):
+        list_subs[i][col] = series_sa
+        if method != "x13":
+            print(
+                "X-13 failed for "
+                + str(list_subs[i][entities_label].iloc[0])
+                + " ("
+                + col
+                + "), used "
+                + method
+            )
+    # stack
+    list_subs = [df_sub.reset_index(drop=False) for df_sub in list_subs]
+    df = pd.concat(list_subs, axis=0)
+    df[time_label] = df[time_label].astype("str")
+
+    return df
+
+
+def ceic_cache_key(
+    source: str, series_id: int, start_date: date, historical_extension: bool
+) -> str:
+    # hash of everything that determines the response
+    return hashlib.sha256(
+        repr(
+            (source, int(series_id), str(start_date), bool(historical_extension))
+        ).encode()
+    ).hexdigest()
+
+
+def read_ceic_cache(path_cache: str, key: str, ttl_days: float = None):
+    """
+    Read a cached CEIC response.
+
+    :path_cache `str`: root folder of the cache\n
+    :key `str`: output of ceic_cache_key\n
+    :ttl_days `Optional[float]`: ignore entries fetched more than n days ago; None keeps all entries\n
+    :return `Optional[dict]`: cached record, or None if missing or stale
+    """
+    file = os.path.join(path_cache, "ceic", key + ".pkl")
+    if not os.path.isfile(file):
+        return None
+    with open(file, "rb") as f:
+        entry = pickle.load(f)
+    if (ttl_days is not None) and (
+        time.time() - entry["fetched_at"] > ttl_days * 24 * 60 * 60
+    ):
+        return None
+    os.utime(file)  # mark as recently used
+    return entry["record"]
+
+
+def write_ceic_cache(path_cache: str, key: str, record: dict):
+    # write to a temporary file first, so an interrupted run never leaves a partial entry
+    path = os.path.join(path_cache, "ceic")
+    os.makedirs(path, exist_ok=True)
+    file = os.path.join(path, key + ".pkl")
+    with open(file + ".tmp", "wb") as f:
+        pickle.dump({"fetched_at": time.time(), "record": record}, f)
+    os.replace(file + ".tmp", file)
+
+
+def evict_ceic_cache(path_cache: str, max_size_mb: float = 1024):
+    # drop least recently used entries until the cache fits
+    path = os.path.join(path_cache, "ceic")
+    if not os.path.isdir(path):
+        return
+    list_files = [os.path.join(path, i) for i in os.listdir(path) if i.endswith(".pkl")]
+    list_files = sorted(list_files, key=os.path.getmtime, reverse=True)
+    size = 0
+    for file in list_files:
+        size += os.path.getsize(file)
+        if size > max_size_mb * 1024 * 1024:
+            os.remove(file)
+
+
+def read_ceic_cache_all(
+    path_cache: str,
+    source: str,
+    series_ids: list[int],
+    start_date: date,
+    historical_extension: bool,
+    ttl_days: float = None,
+    offline: bool = False,
+) -> list:
+    # cached records in the order of series_ids (None where missing), ignoring ttl_days when offline
+    if path_cache is None:
+        records = [None] * len(series_ids)
+    else:
+        records = [
+            read_ceic_cache(
+                path_cache=path_cache,
+                key=ceic_cache_key(source, i, start_date, historical_extension),
+                ttl_days=None if offline else ttl_days,
+            )
+            for i in series_ids
+        ]
+    if offline and any(record is None for record in records):
+        raise FileNotFoundError(
+            "Not in the CEIC cache: "
+            + ", ".join(
+                str(i) for i, record in zip(series_ids, records) if record is None
+            )
+        )
+    return records
+
+
+def write_ceic_cache_all(
+    path_cache: str,
+    source: str,
+    series_ids: list[int],
+    records: list,
+    start_date: date,
+    historical_extension: bool,
+    max_size_mb: float = 1024,
+):
+    # store freshly downloaded records, then keep the cache within limits
+    if path_cache is None:
+        return
+    for i, record in zip(series_ids, records):
+        write_ceic_cache(
+            path_cache=path_cache,
+            key=ceic_cache_key(source, i, start_date, historical_extension),
+            record=record,
+        )
+    evict_ceic_cache(path_cache=path_cache, max_size_mb=max_size_mb)
+
+
+def as_ceic_dates(values) -> pd.Series:
+    # one date dtype from every CEIC download path, and from the parquet files they write
+    return pd.to_datetime(values).astype("datetime64[ns]")
+
+
+def match_ceic_records(series_ids: list[int], records: list, record_ids: list) -> list:
+    # records in the order of series_ids, matched by the ID each record carries
+    dict_records = dict(zip([int(i) for i in record_ids], records))
+    list_not_returned = [i for i in series_ids if i not in dict_records]
+    if len(list_not_returned) > 0:
+        raise ValueError(
+            "CEIC returned no data for series "
+            + ", ".join([str(i) for i in list_not_returned])
+        )
+    return [dict_records[i] for i in series_ids]
+
+
+def make_ceic_session(n_workers: int = 1) -> requests.Session:
+    # one keep-alive connection per worker, reused across requests
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(
+        pool_connections=1, pool_maxsize=max(n_workers, 1)
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def chunk_series_ids(series_ids: list[int], max_chars: int = 1500) -> list[list[int]]:
+    # split series IDs into comma-separated lists that keep the URL within max_chars
+    list_chunks = []
+    chunk = []
+    n_chars = 0
+    for series_id in series_ids:
+        n = len(str(series_id)) + 1
+        if (len(chunk) > 0) and (n_chars + n > max_chars):
+            list_chunks += [chunk]
+            chunk = []
+            n_chars = 0
+        chunk += [series_id]
+        n_chars += n
+    if len(chunk) > 0:
+        list_chunks += [chunk]
+    return list_chunks
+
+
+def get_json_from_api_ceic(session: requests.Session, url: str, wait=None) -> list:
+    # stream the response straight into the JSON parser
+    if wait is not None:
+        wait()
+    with session.get(url, stream=True) as response:
+        response.raise_for_status()
+        response.raw.decode_content = True
+        return json.load(response.raw)["data"]
+
+
 def get_data_from_api_ceic(
     series_ids: list[float],
     series_names: list[str],
     start_date: date,
     historical_extension: bool = False,
+    path_cache: str = None,
+    cache_ttl_days: float = None,
+    offline: bool = False,
+    cache_max_size_mb: float = 1024,
+    n_workers: int = 1,
+    max_calls_per_second: float = None,
+    max_url_chars: int = 1500,
+    base_url: str = "https://api.ceicdata.com/v2/",
 ) -> pd.DataFrame:
     """
     Get CEIC data.
@@ -148,41 +452,163 @@ def get_data_from_api_ceic(
     :series_ids `list[float]`: a list of CEIC Series IDs\n
     :start_date `date`: a date() object of the start date e.g. date(1991, 1, 1)\n
     "continuous `Optional[boolean]`: When set to true, series will include extended historical timepoints\n
+    :path_cache `Optional[str]`: root folder of the on-disk cache of responses; None always downloads\n
+    :cache_ttl_days `Optional[float]`: download again if the cached response is older than n days; None never expires\n
+    :offline `Optional[bool]`: only read from the cache, and fail if a series is not cached\n
+    :cache_max_size_mb `Optional[float]`: size above which least recently used responses are evicted\n
+    :n_workers `Optional[int]`: number of requests in flight at the same time, over one pooled session\n
+    :max_calls_per_second `Optional[float]`: cap on requests per second across workers; None for no cap\n
+    :max_url_chars `Optional[int]`: longest list of series IDs packed into one request without historical extension\n
+    :base_url `Optional[str]`: root of the CEIC REST API\n
     :return `pd.DataFrame`: A DataFrame instance of the data
     """
-    df = pd.DataFrame()
-    series_list = ",".join(map(str, series_ids))
+    series_ids = [int(i) for i in series_ids]
+    content = read_ceic_cache_all(
+        path_cache=path_cache,
+        source="api",
+        series_ids=series_ids,
+        start_date=start_date,
+        historical_extension=historical_extension,
+        ttl_days=cache_ttl_days,
+        offline=offline,
+    )
+    series_ids_missing = [i for i, j in zip(series_ids, content) if j is None]
 
+    # one request per chunk of series, or per series with historical extension
+    list_urls = []
     if historical_extension == False:
-        PATH = f"https://api.ceicdata.com/v2//series/{series_list}/data?format=json&start_date={start_date}"
-        response = requests.get(f"{PATH}&token={os.getenv('CEIC_API_KEY')}")
-        content = json.loads(response.text)["data"]
+        for chunk in chunk_series_ids(series_ids_missing, max_chars=max_url_chars):
+            series_list = ",".join(map(str, chunk))
+            PATH = f"{base_url}/series/{series_list}/data?format=json&start_date={start_date}"
+            list_urls += [f"{PATH}&token={os.getenv('CEIC_API_KEY')}"]
     else:
-        content = []
-        for series in series_ids:
-            PATH = f"https://api.ceicdata.com/v2//series/{series}/data?format=json&start_date={start_date}"
-            response = requests.get(
-                f"{PATH}&with_historical_extension=True&token={os.getenv('CEIC_API_KEY')}"
+        for series in series_ids_missing:
+            PATH = (
+                f"{base_url}/series/{series}/data?format=json&start_date={start_date}"
             )
-            content = content + json.loads(response.text)["data"]
+            list_urls += [
+                f"{PATH}&with_historical_extension=True&token={os.getenv('CEIC_API_KEY')}"
+            ]
+    content_missing = []
+    if len(list_urls) > 0:
+        wait = make_rate_limiter(max_calls_per_second=max_calls_per_second)
+        with make_ceic_session(n_workers=n_workers) as session:
+            with ThreadPoolExecutor(max_workers=n_workers) as pool:
+                for data in pool.map(
+                    lambda url: get_json_from_api_ceic(
+                        session=session, url=url, wait=wait
+                    ),
+                    list_urls,
+                ):
+                    content_missing += data
+    # match responses to the requested IDs by their own IDs, not by position
+    content_missing = match_ceic_records(
+        series_ids=series_ids_missing,
+        records=content_missing,
+        record_ids=[record["id"] for record in content_missing],
+    )
+    write_ceic_cache_all(
+        path_cache=path_cache,
+        source="api",
+        series_ids=series_ids_missing,
+        records=content_missing,
+        start_date=start_date,
+        historical_extension=historical_extension,
+        max_size_mb=cache_max_size_mb,
+    )
+    # slot downloads in between cached responses
+    content_missing = iter(content_missing)
+    content = [j if j is not None else next(content_missing) for j in content]
+    # columnar buffers, assembled into one frame
+    list_time_points = []
+    list_names = []
+    list_countries = []
+    list_n_points = []
     for i, j in zip(
         range(len(series_ids)), series_names
     ):  # series names not in API json
-        data = pd.DataFrame(content[i]["timePoints"])[["date", "value"]]
+        list_time_points += [
+            (tp["date"], tp["value"]) for tp in content[i]["timePoints"]
+        ]
         # name = content[i]["layout"][0]["table"]["name"]
         name = "_".join(j.split(": ")[1:])  # name --> j
-        data["name"] = re.sub("[^A-Za-z0-9]+", "_", name).lower()
+        list_names += [re.sub("[^A-Za-z0-9]+", "_", name).lower()]
         country = content[i]["layout"][0]["topic"]["name"]  # section --> topic
-        data["country"] = re.sub("[^A-Za-z0-9]+", "_", country).lower()
-        df = pd.concat([df, data])
+        list_countries += [re.sub("[^A-Za-z0-9]+", "_", country).lower()]
+        list_n_points += [len(content[i]["timePoints"])]
+    df = pd.DataFrame(list_time_points, columns=["date", "value"])
+    df["name"] = np.repeat(np.array(list_names, dtype="object"), list_n_points)
+    df["country"] = np.repeat(np.array(list_countries, dtype="object"), list_n_points)
+    df["series_id"] = np.repeat(np.array(series_ids, dtype="int64"), list_n_points)
+    df["date"] = as_ceic_dates(df["date"])
 
     df = df.sort_values(["country", "date"]).reset_index(drop=True)
 
     return df
 
 
+def make_rate_limiter(max_calls_per_second: float = None):
+    """
+    Spread calls evenly in time, across threads.
+    Each call of the returned function blocks until the caller's slot; it returns at once if max_calls_per_second is None.
+
+    :max_calls_per_second `Optional[float]`: most calls allowed per second\n
+    :return `Callable`: function to call before each request
+    """
+    lock = threading.Lock()
+    state = {"t_next": 0.0}
+
+    def wait():
+        if max_calls_per_second is None:
+            return
+        with lock:
+            t_now = time.monotonic()
+            t_slot = max(t_now, state["t_next"])
+            state["t_next"] = t_slot + 1 / max_calls_per_second
+        time.sleep(max(0.0, t_slot - t_now))
+
+    return wait
+
+
+def get_series_from_ceic(series_id: int, start_date: date, wait=None) -> list:
+    """
+    Get a single CEIC series with historical extension,
+    reverting to the series without historical extension if that fails.
+
+    :series_id `int`: CEIC Series ID\n
+    :start_date `date`: a date() object of the start date e.g. date(1991, 1, 1)\n
+    :wait `Optional[Callable]`: rate limiter from make_rate_limiter, called before each request\n
+    :return `list`: content of Ceic.series(...).data
+    """
+    if wait is not None:
+        wait()
+    try:
+        return Ceic.series(
+            series_id=series_id,
+            start_date=start_date,
+            with_historical_extension=True,
+        ).data
+    except:
+        # revert to without historical extension if fails
+        if wait is not None:
+            wait()
+        return Ceic.series(
+            series_id=series_id,
+            start_date=start_date,
+            with_historical_extension=False,
+        ).data
+
+
 def get_data_from_ceic(
-    series_ids: list[float], start_date: date, historical_extension: bool = False
+    series_ids: list[float],
+    start_date: date,
+    historical_extension: bool = False,
+    n_workers: int = 1,
+    max_calls_per_second: float = None,
+    path_cache: str = None,
+    cache_ttl_days: float = None,
+    offline: bool = False,
+    cache_max_size_mb: float = 1024,
 ) -> pd.DataFrame:
     """
     Get CEIC data.
@@ -191,44 +617,1300 @@ def get_data_from_ceic(
 
     :series_ids `list[float]`: a list of CEIC Series IDs\n
     :start_date `date`: a date() object of the start date e.g. date(1991, 1, 1)\n
+    :historical_extension `Optional[bool]`: download series one by one with extended historical timepoints\n
+    :n_workers `Optional[int]`: number of series downloaded at the same time when historical_extension is True\n
+    :max_calls_per_second `Optional[float]`: cap on requests per second across workers; None for no cap\n
+    :path_cache `Optional[str]`: root folder of the on-disk cache of time points; None always downloads\n
+    :cache_ttl_days `Optional[float]`: download again if the cached series is older than n days; None never expires\n
+    :offline `Optional[bool]`: only read from the cache, and fail if a series is not cached\n
+    :cache_max_size_mb `Optional[float]`: size above which least recently used series are evicted\n
     :return `pd.DataFrame`: A DataFrame instance of the data
     """
-    Ceic.login(username=os.getenv("CEIC_USERNAME"), password=os.getenv("CEIC_PASSWORD"))
+    series_ids = [int(i) for i in series_ids]
+    records = read_ceic_cache_all(
+        path_cache=path_cache,
+        source="sdk",
+        series_ids=series_ids,
+        start_date=start_date,
+        historical_extension=historical_extension,
+        ttl_days=cache_ttl_days,
+        offline=offline,
+    )
+    series_ids_missing = [i for i, j in zip(series_ids, records) if j is None]
 
-    df = pd.DataFrame()
     content = []
-    if not historical_extension:
-        content = Ceic.series(series_id=series_ids, start_date=start_date).data
+    if len(series_ids_missing) == 0:
+        pass
+    elif not historical_extension:
+        Ceic.login(
+            username=os.getenv("CEIC_USERNAME"), password=os.getenv("CEIC_PASSWORD")
+        )
+        content = Ceic.series(series_id=series_ids_missing, start_date=start_date).data
+        # match the bulk response to the requested IDs by its own metadata, not by position
+        content = match_ceic_records(
+            series_ids=series_ids_missing,
+            records=content,
+            record_ids=[series.metadata.id for series in content],
+        )
     else:
-        for series in tqdm(series_ids):
-            try:
-                content += Ceic.series(
-                    series_id=series,
-                    start_date=start_date,
-                    with_historical_extension=True,
-                ).data
-            except:
-                # revert to without historical extension if fails
-                content += Ceic.series(
-                    series_id=series,
-                    start_date=start_date,
-                    with_historical_extension=False,
-                ).data
-    for i in range(len(series_ids)):  # for i in range(len(content))
-        data = pd.DataFrame(
-            [(tp._date, tp.value) for tp in content[i].time_points],
-            columns=["date", "value"],
+        Ceic.login(
+            username=os.getenv("CEIC_USERNAME"), password=os.getenv("CEIC_PASSWORD")
         )
-        data["name"] = re.sub("[^A-Za-z0-9]+", "_", content[i].metadata.name).lower()
-        data["country"] = re.sub(
-            "[^A-Za-z0-9]+", "_", content[i].metadata.country.name
-        ).lower()
-        df = pd.concat([df, data])
+        wait = make_rate_limiter(max_calls_per_second=max_calls_per_second)
+        with ThreadPoolExecutor(max_workers=n_workers) as pool:
+            # results come back in the order of series_ids
+            for data in tqdm(
+                pool.map(
+                    lambda series: get_series_from_ceic(
+                        series_id=series, start_date=start_date, wait=wait
+                    ),
+                    series_ids_missing,
+                ),
+                total=len(series_ids_missing),
+            ):
+                content += data
+    # keep only the time points, name and country of each series
+    records_missing = [
+        {
+            "time_points": [(tp._date, tp.value) for tp in content[i].time_points],
+            "name": content[i].metadata.name,
+            "country": content[i].metadata.country.name,
+        }
+        for i in range(len(series_ids_missing))
+    ]
+    write_ceic_cache_all(
+        path_cache=path_cache,
+        source="sdk",
+        series_ids=series_ids_missing,
+        records=records_missing,
+        start_date=start_date,
+        historical_extension=historical_extension,
+        max_size_mb=cache_max_size_mb,
+    )
+    # slot downloads in between cached series
+    records_missing = iter(records_missing)
+    records = [j if j is not None else next(records_missing) for j in records]
+    # columnar buffers, assembled into one frame
+    df = pd.DataFrame(
+        [tp for record in records for tp in record["time_points"]],
+        columns=["date", "value"],
+    )
+    list_n_points = [len(record["time_points"]) for record in records]
+    list_names = [
+        re.sub("[^A-Za-z0-9]+", "_", record["name"]).lower() for record in records
+    ]
+    list_countries = [
+        re.sub("[^A-Za-z0-9]+", "_", record["country"]).lower() for record in records
+    ]
+    df["name"] = np.repeat(np.array(list_names, dtype="object"), list_n_points)
+    df["country"] = np.repeat(np.array(list_countries, dtype="object"), list_n_points)
+    df["series_id"] = np.repeat(np.array(series_ids, dtype="int64"), list_n_points)
+    df["date"] = as_ceic_dates(df["date"])
     df = df.sort_values(["country", "date"]).reset_index(drop=True)
 
     return df
 
 
+def refresh_data_from_ceic(
+    series_ids: list[float],
+    start_date: date,
+    path_store: str,
+    revision_months: int = 24,
+    n_workers: int = 1,
+    max_calls_per_second: float = None,
+    revision_tolerance: float = 1e-9,
+    offline: bool = False,
+) -> pd.DataFrame:
+    """
+    Incremental version of get_data_from_ceic (with historical extension).
+    Keeps every series in its own partition of path_store, and only downloads time points from
+    revision_months before the last stored date, so late revisions are picked up with the new releases.
+    Stored points in that window are replaced by the download (an empty download empties the window);
+    revised values, and points no longer returned (with an empty value_new), are appended to path_store/revisions.csv.
+
+    :series_ids `list[float]`: a list of CEIC Series IDs\n
+    :start_date `date`: a date() object of the start date for series not in the store yet\n
+    :path_store `str`: folder of the partitioned store of time points, one parquet file per series\n
+    :revision_months `Optional[int]`: months before the last stored date to download again\n
+    :n_workers `Optional[int]`: number of series downloaded at the same time\n
+    :max_calls_per_second `Optional[float]`: cap on requests per second across workers; None for no cap\n
+    :revision_tolerance `Optional[float]`: smallest change in value logged as a revision\n
+    :offline `Optional[bool]`: only read from path_store, and fail if a series is not stored\n
+    :return `pd.DataFrame`: A DataFrame instance of the data, as in get_data_from_ceic
+    """
+    os.makedirs(path_store, exist_ok=True)
+    series_ids = [int(i) for i in series_ids]
+
+    # replay the store as it is
+    if offline:
+        list_missing = [
+            i
+            for i in series_ids
+            if not os.path.isfile(
+                os.path.join(path_store, "series_id=" + str(i) + ".parquet")
+            )
+        ]
+        if len(list_missing) > 0:
+            raise FileNotFoundError(
+                "Not in the CEIC store: " + ", ".join([str(i) for i in list_missing])
+            )
+        df = pd.concat(
+            [
+                pd.read_parquet(
+                    os.path.join(path_store, "series_id=" + str(i) + ".parquet")
+                ).assign(series_id=i)
+                for i in series_ids
+            ],
+            axis=0,
+        )
+        df["date"] = as_ceic_dates(df["date"])
+        df = df.sort_values(["country", "date"]).reset_index(drop=True)
+        return df
+
+    # last stored date per series
+    dict_stored = {}
+    list_start_dates = []
+    for series_id in series_ids:
+        file = os.path.join(path_store, "series_id=" + str(series_id) + ".parquet")
+        if os.path.isfile(file):
+            dict_stored[series_id] = pd.read_parquet(file)
+            last_date = dict_stored[series_id]["date"].max()
+            list_start_dates += [
+                max(
+                    start_date,
+                    (last_date - pd.DateOffset(months=revision_months)).date(),
+                )
+            ]
+        else:
+            list_start_dates += [start_date]
+
+    # download only the tail of stored series, and the full history of new ones
+    Ceic.login(username=os.getenv("CEIC_USERNAME"), password=os.getenv("CEIC_PASSWORD"))
+    wait = make_rate_limiter(max_calls_per_second=max_calls_per_second)
+    with ThreadPoolExecutor(max_workers=n_workers) as pool:
+        content = list(
+            tqdm(
+                pool.map(
+                    lambda i: get_series_from_ceic(
+                        series_id=i[0], start_date=i[1], wait=wait
+                    ),
+                    zip(series_ids, list_start_dates),
+                ),
+                total=len(series_ids),
+            )
+        )
+
+    # merge into the store, series by series
+    list_df = []
+    list_revisions = []
+    for series_id, window_start, data in zip(series_ids, list_start_dates, content):
+        # no time points in the window: every stored point in it counts as dropped
+        if len(data) == 0:
+            if series_id not in dict_stored:
+                print("No data for " + str(series_id) + ", skipping")
+                continue
+            df_new = dict_stored[series_id].iloc[:0]
+        else:
+            series = match_ceic_records(
+                series_ids=[series_id],
+                records=data,
+                record_ids=[i.metadata.id for i in data],
+            )[0]
+            df_new = pd.DataFrame(
+                [(tp._date, tp.value) for tp in series.time_points],
+                columns=["date", "value"],
+            )
+            df_new["date"] = pd.to_datetime(df_new["date"])
+            df_new["name"] = re.sub("[^A-Za-z0-9]+", "_", series.metadata.name).lower()
+            df_new["country"] = re.sub(
+                "[^A-Za-z0-9]+", "_", series.metadata.country.name
+            ).lower()
+        if series_id in dict_stored:
+            df_stored = dict_stored[series_id]
+            in_window = df_stored["date"] >= pd.Timestamp(window_start)
+            # revised values within the window, and points no longer returned
+            df_overlap = df_stored.loc[
+                in_window, ["date", "value", "name", "country"]
+            ].merge(
+                df_new[["date", "value"]],
+                on="date",
+                how="left",
+                suffixes=("_old", "_new"),
+                indicator=True,
+            )
+            dropped = df_overlap["_merge"] == "left_only"
+            revised = dropped | ~np.isclose(
+                df_overlap["value_old"].astype("float"),
+                df_overlap["value_new"].astype("float"),
+                rtol=0,
+                atol=revision_tolerance,
+                equal_nan=True,
+            )
+            if revised.any():
+                df_revised = df_overlap.loc[
+                    revised, ["date", "value_old", "value_new", "name", "country"]
+                ]
+                df_revised.insert(0, "series_id", series_id)
+                list_revisions += [df_revised]
+            # newly downloaded time points replace the stored window outright
+            keep = ~in_window & ~df_stored["date"].isin(df_new["date"])
+            df_new = pd.concat([df_stored[keep], df_new], axis=0)
+            df_new = df_new.sort_values("date").reset_index(drop=True)
+        file = os.path.join(path_store, "series_id=" + str(series_id) + ".parquet")
+        df_new.to_parquet(file + ".tmp")
+        os.replace(file + ".tmp", file)
+        list_df += [df_new.assign(series_id=series_id)]
+
+    # log revisions
+    if len(list_revisions) > 0:
+        df_revisions = pd.concat(list_revisions, axis=0, ignore_index=True)
+        df_revisions.insert(0, "refreshed_at", pd.Timestamp.now().floor("s"))
+        file_log = os.path.join(path_store, "revisions.csv")
+        df_revisions.to_csv(
+            file_log, mode="a", header=not os.path.isfile(file_log), index=False
+        )
+        print(
+            str(len(df_revisions))
+            + " revised values in "
+            + str(df_revisions["series_id"].nunique())
+            + " series, logged in "
+            + file_log
+        )
+
+    if len(list_df) == 0:
+        return pd.DataFrame(columns=["date", "value", "name", "country", "series_id"])
+    df = pd.concat(list_df, axis=0)
+    df["date"] = as_ceic_dates(df["date"])
+    df = df.sort_values(["country", "date"]).reset_index(drop=True)
+
+    return df
+
+
+def read_series_catalogue(path_ceic: str, path_cache: str = None) -> pd.DataFrame:
+    """
+    Index the CEIC series listed in every path_ceic/ceic_<source>.csv, where each column holds the series IDs of one variable.
+    IDs may carry an annotation, e.g. "371937387 (NNRCAKXYN)".
+
+    :path_ceic `str`: folder of the series lists\n
+    :path_cache `Optional[str]`: cache folder used by get_data_from_catalogue; fills in the country and name of series downloaded before\n
+    :return `pd.DataFrame`: one row per listing (series_id, variable, source e.g. "macro_quarterly", frequency, annotation), in the order of the files and their columns
+    """
+    list_catalogue = []
+    for file in sorted(os.listdir(path_ceic)):
+        if not (file.startswith("ceic_") and file.endswith(".csv")):
+            continue
+        df_sub = pd.read_csv(os.path.join(path_ceic, file), dtype="str")
+        df_sub = df_sub.melt(var_name="variable", value_name="entry")
+        df_sub = df_sub.dropna(subset=["entry"])
+        df_sub["source"] = file[len("ceic_") : -len(".csv")]
+        list_catalogue += [df_sub]
+    catalogue = pd.concat(list_catalogue, axis=0, ignore_index=True)
+    # leading digits are the ID, anything in brackets is kept as annotation
+    df_parsed = catalogue["entry"].str.extract(
+        r"^\s*(?P<series_id>\d+)(?:\.0)?\s*(?:\((?P<annotation>[^)]*)\))?"
+    )
+    if df_parsed["series_id"].isna().any():
+        raise ValueError(
+            "Entries without a series ID: "
+            + ", ".join(catalogue.loc[df_parsed["series_id"].isna(), "entry"])
+        )
+    catalogue["series_id"] = df_parsed["series_id"].astype("int64")
+    catalogue["annotation"] = df_parsed["annotation"]
+    catalogue["frequency"] = np.where(
+        catalogue["source"].str.contains("monthly"), "monthly", "quarterly"
+    )
+    cols_catalogue = ["series_id", "variable", "source", "frequency", "annotation"]
+    catalogue = catalogue[cols_catalogue]
+    # country and name, as last downloaded
+    path = os.path.join(str(path_cache), "ceic_catalogue")
+    if (path_cache is not None) and os.path.isdir(path):
+        list_files = [os.path.join(path, i) for i in os.listdir(path)]
+        list_files = sorted(
+            [i for i in list_files if i.endswith(".parquet")], key=os.path.getmtime
+        )
+        if len(list_files) > 0:
+            df_meta = pd.read_parquet(
+                list_files[-1], columns=["series_id", "country", "name"]
+            )
+            df_meta = df_meta.drop_duplicates(subset="series_id")
+            catalogue = catalogue.merge(df_meta, on="series_id", how="left")
+
+    return catalogue
+
+
+def get_data_from_catalogue(
+    catalogue: pd.DataFrame,
+    sources: list[str],
+    start_date: date,
+    path_cache: str,
+    max_age_hours: float = 12,
+    incremental: bool = True,
+    path_store: str = None,
+    n_workers: int = 1,
+    max_calls_per_second: float = None,
+    cache_ttl_days: float = None,
+    offline: bool = False,
+) -> pd.DataFrame:
+    """
+    Download every unique series of the catalogue once, and return the time points of the series listed under sources.
+    The download is kept as a snapshot in path_cache and reused by later calls (e.g. the other compile scripts)
+    for max_age_hours, so a full refresh costs one download per unique series, however many lists it appears in.
+
+    :catalogue `pd.DataFrame`: output of read_series_catalogue\n
+    :sources `list[str]`: series lists to return, e.g. ["macro_quarterly"]\n
+    :start_date `date`: a date() object of the start date\n
+    :path_cache `str`: root folder of the cache, holding the snapshot\n
+    :max_age_hours `Optional[float]`: download again if the snapshot is older than n hours (ignored when offline)\n
+    :incremental `Optional[bool]`: download with refresh_data_from_ceic into path_store; otherwise with get_data_from_ceic\n
+    :path_store `Optional[str]`: store of refresh_data_from_ceic\n
+    :n_workers `Optional[int]`: number of series downloaded at the same time\n
+    :max_calls_per_second `Optional[float]`: cap on requests per second across workers; None for no cap\n
+    :cache_ttl_days `Optional[float]`: as in get_data_from_ceic\n
+    :offline `Optional[bool]`: only read the snapshot, then path_store if incremental (the per-series cache of get_data_from_ceic otherwise)\n
+    :return `pd.DataFrame`: one row per listing and time point (series_id, variable, source, date, value, name, country), in catalogue order
+    """
+    path = os.path.join(path_cache, "ceic_catalogue")
+    file = os.path.join(path, "snapshot_" + str(start_date) + ".parquet")
+    series_ids = list(catalogue["series_id"].drop_duplicates())
+    # reuse a recent snapshot, topped up with series added to the lists since
+    df = pd.DataFrame(columns=["date", "value", "name", "country", "series_id"])
+    if os.path.isfile(file) and (
+        offline or (time.time() - os.path.getmtime(file) < max_age_hours * 60 * 60)
+    ):
+        df = pd.read_parquet(file)
+        df = df[df["series_id"].isin(series_ids)]
+    series_ids_missing = [i for i in series_ids if i not in set(df["series_id"])]
+    if len(series_ids_missing) > 0:
+        print(
+            "Downloading "
+            + str(len(series_ids_missing))
+            + " unique series for "
+            + str(len(catalogue))
+            + " listings"
+        )
+        if incremental:
+            df_new = refresh_data_from_ceic(
+                series_ids=series_ids_missing,
+                start_date=start_date,
+                path_store=path_store,
+                n_workers=n_workers,
+                max_calls_per_second=max_calls_per_second,
+                offline=offline,
+            )
+        else:
+            df_new = get_data_from_ceic(
+                series_ids=series_ids_missing,
+                start_date=start_date,
+                historical_extension=True,
+                n_workers=n_workers,
+                max_calls_per_second=max_calls_per_second,
+                path_cache=path_cache,
+                cache_ttl_days=cache_ttl_days,
+                offline=offline,
+            )
+        df = pd.concat([df, df_new], axis=0, ignore_index=True)
+        os.makedirs(path, exist_ok=True)
+        df.to_parquet(file + ".tmp", index=False)
+        os.replace(file + ".tmp", file)
+    # one copy of the time points per listing
+    df["date"] = as_ceic_dates(df["date"])
+    df = catalogue.loc[
+        catalogue["source"].isin(sources), ["series_id", "variable", "source"]
+    ].merge(df, on="series_id", how="inner")
+
+    return df
+
+
+def consolidate_columns_wide(
+    list_df: list[pd.DataFrame], cols_groups: list[str]
+) -> pd.DataFrame:
+    """
+    Outer-join frames that each hold cols_groups plus value columns, with one concat and one pivot
+    instead of a chain of merges that copies the accumulated frame every time.
+
+    :list_df `list[pd.DataFrame]`: frames with cols_groups and value columns; rows must be unique by cols_groups\n
+    :cols_groups `list[str]`: columns identifying rows, e.g. ["quarter", "country"]\n
+    :return `pd.DataFrame`: wide frame sorted by cols_groups, with value columns in the order of list_df
+    """
+    cols_values = [
+        i for df_sub in list_df for i in df_sub.columns if i not in cols_groups
+    ]
+    # long, then wide
+    df = pd.concat(
+        [
+            df_sub.melt(id_vars=cols_groups, var_name="_variable", value_name="_value")
+            for df_sub in list_df
+        ],
+        axis=0,
+        ignore_index=True,
+    )
+    df = df.pivot(index=cols_groups, columns="_variable", values="_value")
+    df = df[cols_values]
+    df.columns.name = None
+    df = df.reset_index()
+
+    return df
+
+
+# --- Data store
+
+
+def file_sha256(path: str) -> str:
+    # content hash, read in chunks
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def write_partitioned_store(
+    data: pd.DataFrame,
+    path_store: str,
+    dataset: str,
+    frequency: str,
+    entities_label: str = "country",
+    time_label: str = "quarter",
+    path_source: str = None,
+):
+    """
+    Write a long panel as one parquet file per entity, under path_store/dataset/frequency=.../country=.../,
+    replacing everything previously stored for that dataset and frequency.
+
+    :data `pd.DataFrame`: long panel with entities_label and time_label\n
+    :path_store `str`: root folder of the store\n
+    :dataset `str`: name of the dataset, e.g. "data_macro"\n
+    :frequency `str`: partition of the dataset, e.g. "quarterly" or "monthly"\n
+    :entities_label `str`: column to partition by\n
+    :time_label `str`: time column, stored as strings so that ranges can be compared directly\n
+    :path_source `Optional[str]`: flat parquet file holding the same data; its content hash is recorded, so that readers can tell when the store is out of date
+    """
+    path = os.path.join(path_store, dataset, "frequency=" + frequency)
+    # build the new partition next to the old one, then swap
+    path_tmp = path + ".tmp"
+    shutil.rmtree(path_tmp, ignore_errors=True)
+    df = data.copy()
+    df[time_label] = df[time_label].astype("str")
+    for entity, df_sub in df.groupby(entities_label, sort=True):
+        path_entity = os.path.join(path_tmp, entities_label + "=" + str(entity))
+        os.makedirs(path_entity)
+        df_sub = df_sub.drop(columns=entities_label).reset_index(drop=True)
+        df_sub.to_parquet(os.path.join(path_entity, "part-0.parquet"), index=False)
+    if path_source is not None:
+        with open(os.path.join(path_tmp, "_source.sha256"), "w") as f:
+            f.write(file_sha256(path_source))
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(path_tmp, path)
+
+
+def store_matches_source(path: str, path_source: str) -> bool:
+    # partition exists, and was written from the current content of path_source
+    file = os.path.join(path, "_source.sha256")
+    if not os.path.isfile(file):
+        return False
+    with open(file) as f:
+        return f.read() == file_sha256(path_source)
+
+
+def read_partitioned_store(
+    path_store: str,
+    dataset: str,
+    frequency: str,
+    countries: list[str] = None,
+    t_start: str = None,
+    t_end: str = None,
+    columns: list[str] = None,
+    entities_label: str = "country",
+    time_label: str = "quarter",
+    path_source: str = None,
+) -> pd.DataFrame:
+    """
+    Read a long panel from the partitioned store, touching only the files of the requested entities
+    and deserialising only the requested columns.
+
+    :path_store `str`: root folder of the store\n
+    :dataset `str`: name of the dataset, e.g. "data_macro"\n
+    :frequency `str`: partition of the dataset, e.g. "quarterly" or "monthly"\n
+    :countries `Optional[list[str]]`: entities to read; None reads all\n
+    :t_start `Optional[str]`: first period to keep (inclusive), in the stored format, e.g. "1991Q1"\n
+    :t_end `Optional[str]`: last period to keep (inclusive), in the stored format\n
+    :columns `Optional[list[str]]`: value columns to read; None reads all\n
+    :entities_label `str`: partition column\n
+    :time_label `str`: time column\n
+    :path_source `Optional[str]`: flat parquet file to populate the store from, if the partition does not exist yet or was built from other content\n
+    :return `pd.DataFrame`: long panel sorted by entities_label and time_label
+    """
+    path = os.path.join(path_store, dataset, "frequency=" + frequency)
+    if (
+        (path_source is not None)
+        and os.path.isfile(path_source)
+        and not store_matches_source(path=path, path_source=path_source)
+    ):
+        write_partitioned_store(
+            data=pd.read_parquet(path_source),
+            path_store=path_store,
+            dataset=dataset,
+            frequency=frequency,
+            entities_label=entities_label,
+            time_label=time_label,
+            path_source=path_source,
+        )
+    if not os.path.isdir(path):
+        raise FileNotFoundError(path + " not found; run the compile script first")
+    # partition pruning
+    prefix = entities_label + "="
+    list_entities = sorted(
+        i[len(prefix) :] for i in os.listdir(path) if i.startswith(prefix)
+    )
+    if countries is not None:
+        list_entities = [i for i in list_entities if i in set(countries)]
+    # column projection
+    if columns is not None:
+        columns = [time_label] + [
+            i for i in columns if i not in [entities_label, time_label]
+        ]
+    list_df = []
+    for entity in list_entities:
+        df_sub = pd.read_parquet(
+            os.path.join(path, prefix + entity, "part-0.parquet"), columns=columns
+        )
+        # row filter on the time range
+        if t_start is not None:
+            df_sub = df_sub[df_sub[time_label] >= t_start]
+        if t_end is not None:
+            df_sub = df_sub[df_sub[time_label] <= t_end]
+        df_sub.insert(0, entities_label, entity)
+        list_df += [df_sub]
+    if len(list_df) == 0:
+        return pd.DataFrame(columns=[entities_label] + (columns or [time_label]))
+    df = pd.concat(list_df, axis=0, ignore_index=True)
+    df = df.sort_values(by=[entities_label, time_label]).reset_index(drop=True)
+
+    return df
+
+
+def read_excel_cached(path_workbook: str, sheet_name: str, path_cache: str):
+    """
+    Read one sheet of an Excel workbook through a snapshot of that sheet, in parquet where pyarrow can store it.
+    The sheet is parsed only when the workbook's content hash changes; snapshots of earlier versions are deleted.
+
+    :path_workbook `str`: Excel file, e.g. "./data/Consensus_CPI_forecast.xlsx"\n
+    :sheet_name `str`: sheet to return\n
+    :path_cache `str`: root folder of the cache, e.g. "./cache/"\n
+    :return `pd.DataFrame`: the sheet, as pd.read_excel would return it (column labels as strings)
+    """
+    # content hash of the workbook
+    version = file_sha256(path_workbook)
+    path_workbook_cache = os.path.join(
+        path_cache, "workbooks", os.path.basename(path_workbook)
+    )
+    # invalidate snapshots of other versions
+    if os.path.isdir(path_workbook_cache):
+        for name in os.listdir(path_workbook_cache):
+            if name != version:
+                shutil.rmtree(
+                    os.path.join(path_workbook_cache, name), ignore_errors=True
+                )
+    path_version = os.path.join(path_workbook_cache, version)
+    file = os.path.join(path_version, sheet_name)
+    # convert the sheet
+    if not (os.path.isfile(file + ".parquet") or os.path.isfile(file + ".pkl")):
+        write_sheet_snapshot(
+            df=pd.read_excel(path_workbook, sheet_name=sheet_name), file=file
+        )
+    if os.path.isfile(file + ".parquet"):
+        return pd.read_parquet(file + ".parquet")
+
+    return pd.read_pickle(file + ".pkl")
+
+
+def write_sheet_snapshot(df: pd.DataFrame, file: str):
+    # parquet, or pickle for columns that pyarrow rejects; no .tmp file is left behind
+    df.columns = [str(i) for i in df.columns]
+    os.makedirs(os.path.dirname(file), exist_ok=True)
+    try:
+        try:
+            df.to_parquet(file + ".parquet.tmp", index=False)
+            os.replace(file + ".parquet.tmp", file + ".parquet")
+        except (ValueError, TypeError):
+            # mixed-type columns (e.g. numbers and "n.a.") that pyarrow rejects
+            df.to_pickle(file + ".pkl.tmp")
+            os.replace(file + ".pkl.tmp", file + ".pkl")
+    finally:
+        for file_tmp in [file + ".parquet.tmp", file + ".pkl.tmp"]:
+            if os.path.isfile(file_tmp):
+                os.remove(file_tmp)
+
+
+# --- Frequency conversion
+# Periods are handled as integer ordinals (pandas' own: 0 is 1970M1 / 1970Q1 / 1970),
+# so that converting between frequencies is integer division instead of datetime parsing.
+dict_freq_pandas = {"month": "M", "quarter": "Q", "year": "Y"}
+dict_periods_per_year = {"month": 12, "quarter": 4, "year": 1}
+ordinal_nat = np.iinfo(np.int64).min  # missing period, as in pandas
+
+
+def to_period_ordinal(values, frequency: str = "quarter") -> np.ndarray:
+    """
+    Convert periods, timestamps, or their string forms (e.g. "1991Q1", "1991-01", "1991-01-01") into period ordinals.
+    Strings and other objects are parsed once per unique value.
+
+    :values `pd.Series | array-like`: time identifiers; integers are taken as ordinals already\n
+    :frequency `str`: "month", "quarter" or "year"\n
+    :return `np.ndarray`: int64 ordinals, with missing values as ordinal_nat
+    """
+    freq = dict_freq_pandas[frequency]
+    values = pd.Series(values)
+    if isinstance(values.dtype, pd.PeriodDtype):
+        return values.dt.asfreq(freq).array.asi8
+    if pd.api.types.is_datetime64_any_dtype(values.dtype):
+        return values.dt.to_period(freq).array.asi8
+    if pd.api.types.is_integer_dtype(values.dtype):
+        return values.to_numpy(dtype="int64")
+    # parse the unique values only
+    codes, uniques = pd.factorize(values)
+    ordinals_unique = np.array(
+        [pd.Period(i, freq=freq).ordinal for i in uniques], dtype="int64"
+    )
+    ordinals = np.full(len(codes), ordinal_nat, dtype="int64")
+    ordinals[codes >= 0] = ordinals_unique[codes[codes >= 0]]
+
+    return ordinals
+
+
+def from_period_ordinal(ordinals, frequency: str = "quarter", output: str = "period"):
+    """
+    Convert period ordinals back into periods, their string forms, or leave them as integers.
+
+    :ordinals `array-like`: int64 ordinals, with missing values as ordinal_nat\n
+    :frequency `str`: "month", "quarter" or "year"\n
+    :output `str`: "period" (pandas Period), "str" (e.g. "1991Q1", as astype("str") on periods) or "ordinal"\n
+    :return `np.ndarray | pd.arrays.PeriodArray`: converted values
+    """
+    ordinals = np.asarray(ordinals, dtype="int64")
+    if output == "ordinal":
+        return ordinals
+    periods = pd.arrays.PeriodArray(
+        ordinals, dtype=pd.PeriodDtype(dict_freq_pandas[frequency])
+    )
+    if output == "period":
+        return periods
+    if output == "str":
+        # format the unique values only
+        codes, uniques = pd.factorize(periods)
+        labels = np.array([str(i) for i in uniques] + [np.nan], dtype="object")
+        return labels[codes]
+    raise ValueError("output must be one of 'period', 'str' or 'ordinal'")
+
+
+def as_period(values, frequency: str = "quarter"):
+    # drop-in for pd.to_datetime(values).dt.to_period(...), keeping the index of a series
+    periods = from_period_ordinal(
+        to_period_ordinal(values, frequency=frequency), frequency=frequency
+    )
+    if isinstance(values, pd.Series):
+        return pd.Series(periods, index=values.index, name=values.name)
+    return periods
+
+
+def convert_frequency(
+    data: pd.DataFrame,
+    cols: list[str],
+    time_label: str,
+    frequency_to: str = "quarter",
+    frequency_from: str = None,
+    entities_label: str = "country",
+    how: str = "mean",
+    ragged_edge: str = "keep",
+    output: str = "period",
+) -> pd.DataFrame:
+    """
+    Collapse a (long) panel into a lower frequency, grouping on period ordinals.
+
+    :data `pd.DataFrame`: frame with time_label, cols, and entities_label if not None\n
+    :cols `list[str]`: columns to aggregate\n
+    :time_label `str`: time identifiers of the source (dates, periods or their string forms)\n
+    :frequency_to `str`: "month", "quarter" or "year"; also the name of the output time column\n
+    :frequency_from `Optional[str]`: frequency of the source, needed for ragged_edge="drop"; None maps the source straight to frequency_to\n
+    :entities_label `Optional[str]`: entity column, e.g. "country"; None for a single series\n
+    :how `str`: "mean", "last" (last non-missing value) or "sum" (missing if nothing is observed)\n
+    :ragged_edge `str`: "keep" aggregates whatever is observed; "drop" sets periods with fewer observations than frequency_from has per frequency_to (e.g. 3 months per quarter) to missing, column by column\n
+    :output `str`: format of the output time column, as in from_period_ordinal\n
+    :return `pd.DataFrame`: entities_label, frequency_to and cols, sorted by entity and period
+    """
+    if frequency_from is None:
+        if ragged_edge == "drop":
+            raise ValueError("frequency_from is needed to find incomplete periods")
+        ordinals_from = to_period_ordinal(data[time_label], frequency=frequency_to)
+        ordinals_to = ordinals_from
+        n_expected = 1
+    else:
+        ordinals_from = to_period_ordinal(data[time_label], frequency=frequency_from)
+        n_expected = (
+            dict_periods_per_year[frequency_from] // dict_periods_per_year[frequency_to]
+        )
+        ordinals_to = np.where(
+            ordinals_from == ordinal_nat, ordinal_nat, ordinals_from // n_expected
+        )
+    # groups
+    df = data[cols].reset_index(drop=True)
+    df[frequency_to] = ordinals_to
+    cols_groups = [frequency_to]
+    if entities_label is not None:
+        df.insert(0, entities_label, data[entities_label].to_numpy())
+        cols_groups = [entities_label, frequency_to]
+    if how == "last":
+        # chronological within each period
+        if frequency_from is None:
+            order = (
+                data[time_label]
+                .reset_index(drop=True)
+                .sort_values(kind="stable", na_position="first")
+                .index
+            )
+        else:
+            order = np.argsort(ordinals_from, kind="stable")
+        df = df.iloc[order]
+    df = df[df[frequency_to] != ordinal_nat]
+    grouped = df.groupby(cols_groups, sort=True)[cols]
+    # aggregate
+    if how == "mean":
+        df_agg = grouped.mean()
+    elif how == "last":
+        df_agg = grouped.last()
+    elif how == "sum":
+        df_agg = grouped.sum(min_count=1)
+    else:
+        raise ValueError("how must be one of 'mean', 'last' or 'sum'")
+    if ragged_edge == "drop":
+        df_agg = df_agg.where(grouped.count() >= n_expected)
+    df_agg = df_agg.reset_index(drop=False)
+    df_agg[frequency_to] = from_period_ordinal(
+        df_agg[frequency_to].to_numpy(), frequency=frequency_to, output=output
+    )
+
+    return df_agg
+
+
+# --- Analysis panel
+
+
+def grouped_shift(
+    data: pd.DataFrame,
+    cols: list[str],
+    shifts: list[int],
+    entities_label: str = "country",
+) -> np.ndarray:
+    """
+    Shift several columns by several periods within entities, in one pass over a 2-D array.
+    Same values as data.groupby(entities_label)[col].shift(k) for every col and k.
+
+    :data `pd.DataFrame`: long panel, in time order within each entity\n
+    :cols `list[str]`: numeric columns to shift\n
+    :shifts `list[int]`: periods to shift by; negative values lead\n
+    :entities_label `str`: entity column; rows with a missing entity get missing values\n
+    :return `np.ndarray`: float array of shape (len(shifts), len(data), len(cols))
+    """
+    codes, _ = pd.factorize(data[entities_label])
+    # make entities contiguous, keeping the order within each
+    order = np.argsort(codes, kind="stable")
+    codes = codes[order]
+    values = data[cols].to_numpy(dtype="float64")[order]
+    n = len(codes)
+    shifted = np.full((len(shifts), n, len(cols)), np.nan)
+    for i, k in enumerate(shifts):
+        if k == 0:
+            shifted[i] = values
+            continue
+        m = abs(k)
+        if m >= n:
+            continue
+        if k > 0:
+            same = (codes[m:] == codes[:-m]) & (codes[m:] >= 0)
+            shifted[i, m:][same] = values[:-m][same]
+        else:
+            same = (codes[:-m] == codes[m:]) & (codes[:-m] >= 0)
+            shifted[i, :-m][same] = values[m:][same]
+    # back to the original row order
+    out = np.empty_like(shifted)
+    out[:, order] = shifted
+
+    return out
+
+
+def transform_panel(
+    data: pd.DataFrame,
+    cols_yoy: list[str] = None,
+    cols_diff: list[str] = None,
+    periods: int = 4,
+    entities_label: str = "country",
+) -> pd.DataFrame:
+    """
+    Convert columns of a long panel into growth rates (in %) or differences over a number of periods,
+    within entities, with a single grouped shift.
+
+    :data `pd.DataFrame`: long panel, in time order within each entity\n
+    :cols_yoy `Optional[list[str]]`: columns to convert into growth rates, 100 * (x / x.shift(periods) - 1)\n
+    :cols_diff `Optional[list[str]]`: columns to convert into differences, x - x.shift(periods)\n
+    :periods `int`: periods to compare with, e.g. 4 for YoY on quarterly data\n
+    :entities_label `str`: entity column\n
+    :return `pd.DataFrame`: copy of data with the columns replaced
+    """
+    cols_yoy = list(cols_yoy or [])
+    cols_diff = list(cols_diff or [])
+    if len(set(cols_yoy) & set(cols_diff)) > 0:
+        raise ValueError("columns cannot be in both cols_yoy and cols_diff")
+    cols = cols_yoy + cols_diff
+    df = data.copy()
+    if len(cols) == 0:
+        return df
+    values = df[cols].to_numpy(dtype="float64", copy=True)
+    base = grouped_shift(
+        data=df, cols=cols, shifts=[periods], entities_label=entities_label
+    )[0]
+    n_yoy = len(cols_yoy)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        values[:, :n_yoy] = 100 * ((values[:, :n_yoy] / base[:, :n_yoy]) - 1)
+    values[:, n_yoy:] = values[:, n_yoy:] - base[:, n_yoy:]
+    df[cols] = values
+
+    return df
+
+
+def lag_panel(
+    data: pd.DataFrame,
+    cols: list[str],
+    n_lags: int = 4,
+    entities_label: str = "country",
+) -> pd.DataFrame:
+    """
+    Add lags 1 to n_lags of columns of a long panel, within entities, as col_lag1 ... col_lag<n_lags>.
+    All lags come from a single grouped shift and are appended as one block.
+
+    :data `pd.DataFrame`: long panel, in time order within each entity\n
+    :cols `list[str]`: columns to lag\n
+    :n_lags `int`: number of lags\n
+    :entities_label `str`: entity column\n
+    :return `pd.DataFrame`: data with the lags, ordered by lag then by column
+    """
+    cols = list(dict.fromkeys(cols))
+    if len(cols) == 0 or n_lags < 1:
+        return data.copy()
+    lags = list(range(1, n_lags + 1))
+    shifted = grouped_shift(
+        data=data, cols=cols, shifts=lags, entities_label=entities_label
+    )
+    df_lags = pd.DataFrame(
+        np.concatenate(shifted, axis=1),
+        index=data.index,
+        columns=[col + "_lag" + str(lag) for lag in lags for col in cols],
+    )
+    # lags that already exist are overwritten in place
+    cols_existing = [col for col in df_lags.columns if col in data.columns]
+    df = data.copy()
+    if len(cols_existing) > 0:
+        df[cols_existing] = df_lags[cols_existing]
+        df_lags = df_lags.drop(columns=cols_existing)
+    df = pd.concat([df, df_lags], axis=1)
+
+    return df
+
+
+def declare_features(
+    cols_levels: list[str] = None,
+    cols_rate: list[str] = None,
+    cols_lags: list[str] = None,
+    n_lags: int = 4,
+    cols_is_zero: list[str] = None,
+    cols_powers: list[str] = None,
+    interactions: dict[str, list[str]] = None,
+) -> dict[str, tuple]:
+    """
+    Declare the derived columns of an analysis panel, without computing them.
+
+    :cols_levels `Optional[list[str]]`: columns to convert into YoY growth, in %\n
+    :cols_rate `Optional[list[str]]`: columns to convert into 4-quarter differences\n
+    :cols_lags `Optional[list[str]]`: columns to lag (after all transformations), as col_lag1 to col_lag<n_lags>\n
+    :n_lags `int`: number of lags\n
+    :cols_is_zero `Optional[list[str]]`: columns to flag as col_is_zero (1 if zero, 0 if positive), before transforming\n
+    :cols_powers `Optional[list[str]]`: columns to raise to the power of 2 and 3, as col_sq and col_cube\n
+    :interactions `Optional[dict[str, list[str]]]`: new column name: columns to multiply together\n
+    :return `dict[str, tuple]`: column name: (kind, input columns, parameter), in the order they are computed
+    """
+    features = {}
+    for col in cols_is_zero or []:
+        features[col + "_is_zero"] = ("is_zero", [col], None)
+    for col in cols_levels or []:
+        features[col] = ("yoy", [col], 4)
+    for col in cols_rate or []:
+        features[col] = ("diff", [col], 4)
+    for col in cols_powers or []:
+        features[col + "_sq"] = ("power", [col], 2)
+        features[col + "_cube"] = ("power", [col], 3)
+    for col_new, cols_x in (interactions or {}).items():
+        features[col_new] = ("product", list(cols_x), None)
+    for lag in range(1, n_lags + 1):
+        for col in cols_lags or []:
+            features[col + "_lag" + str(lag)] = ("lag", [col], lag)
+
+    return features
+
+
+def materialise_features(
+    data: pd.DataFrame,
+    features: dict[str, tuple],
+    columns: list[str] = None,
+    entities_label: str = "country",
+    time_label: str = "quarter",
+) -> pd.DataFrame:
+    """
+    Compute declared features on a long panel of raw columns. With columns, only the requested columns
+    and what they depend on are computed; every intermediate column is computed once.
+
+    :data `pd.DataFrame`: long panel of raw columns, in time order within each entity\n
+    :features `dict[str, tuple]`: output of declare_features\n
+    :columns `Optional[list[str]]`: columns to return, e.g. the variables of a formula; names that are neither raw nor declared are ignored, None returns every column\n
+    :entities_label `str`: entity column, always returned\n
+    :time_label `str`: time column, always returned\n
+    :return `pd.DataFrame`: raw columns (transformed in place where declared), then the new columns in order of declaration
+    """
+    cols_all = list(data.columns) + [i for i in features if i not in data.columns]
+    if columns is None:
+        cols_out = cols_all
+    else:
+        cols_out = set(columns) | {entities_label, time_label}
+        cols_out = [i for i in cols_all if i in cols_out]
+    # walk back to everything the requested columns depend on
+    needed = set()
+    stack = list(cols_out)
+    while len(stack) > 0:
+        col = stack.pop()
+        if col in needed:
+            continue
+        needed.add(col)
+        if col in features:
+            # yoy, diff and is_zero read the raw column of the same name
+            if features[col][0] not in ["yoy", "diff", "is_zero"]:
+                stack += features[col][1]
+    memo = {}
+
+    def get(col):
+        return memo[col] if col in memo else data[col]
+
+    list_needed = [i for i in features if i in needed]
+    # zero flags, on raw values
+    for col in [i for i in list_needed if features[i][0] == "is_zero"]:
+        x = data[features[col][1][0]]
+        memo[col] = (x == 0).astype("float").where(x >= 0)
+    # growth rates and differences, in one grouped shift
+    cols_yoy = [i for i in list_needed if features[i][0] == "yoy"]
+    cols_diff = [i for i in list_needed if features[i][0] == "diff"]
+    if len(cols_yoy + cols_diff) > 0:
+        df = transform_panel(
+            data[[entities_label] + cols_yoy + cols_diff],
+            cols_yoy=cols_yoy,
+            cols_diff=cols_diff,
+            entities_label=entities_label,
+        )
+        for col in cols_yoy + cols_diff:
+            memo[col] = df[col]
+    # powers and interactions, in order of declaration
+    for col in list_needed:
+        kind, cols_x, param = features[col]
+        if kind == "power":
+            memo[col] = get(cols_x[0]) ** param
+        elif kind == "product":
+            x = get(cols_x[0])
+            for col_x in cols_x[1:]:
+                x = x * get(col_x)
+            memo[col] = x
+    # lags, in one grouped shift
+    cols_lag = [i for i in list_needed if features[i][0] == "lag"]
+    if len(cols_lag) > 0:
+        cols_x = list(dict.fromkeys(features[i][1][0] for i in cols_lag))
+        lags = sorted(set(features[i][2] for i in cols_lag))
+        df = pd.concat(
+            [data[entities_label]] + [get(i).rename(i) for i in cols_x], axis=1
+        )
+        shifted = grouped_shift(
+            data=df, cols=cols_x, shifts=lags, entities_label=entities_label
+        )
+        for col in cols_lag:
+            i = lags.index(features[col][2])
+            j = cols_x.index(features[col][1][0])
+            memo[col] = pd.Series(shifted[i, :, j], index=data.index, name=col)
+    df = pd.concat([get(i).rename(i) for i in cols_out], axis=1)
+
+    return df
+
+
+def build_analysis_panel(
+    path_data: str,
+    path_output: str,
+    countries: list[str],
+    cols_levels: list[str],
+    cols_rate: list[str],
+    cols_lags: list[str] = None,
+    n_lags: int = 4,
+    cols_is_zero: list[str] = None,
+    cols_powers: list[str] = None,
+    interactions: dict[str, list[str]] = None,
+    formulas: list[str] = None,
+    t_start: str = None,
+    t_end: str = None,
+    path_cache: str = "./cache/",
+) -> pd.DataFrame:
+    """
+    Build the quarterly analysis panel (macro data, u-rate gap and expected inflation, merged and transformed),
+    or load it from the cache if it was already built from the same input files with the same settings.
+
+    Steps, in order: merge the three datasets, trim countries, flag zeros (cols_is_zero),
+    YoY growth (cols_levels), 4-quarter differences (cols_rate), polynomials, interactions, lags, then trim dates.
+
+    :path_data `str`: folder with data_macro_quarterly.parquet and data_macro_quarterly_expcpi.parquet, and their store\n
+    :path_output `str`: folder with plucking_ugap_quarterly.parquet, and its store\n
+    :countries `list[str]`: countries to keep\n
+    :cols_levels `list[str]`: columns to convert into YoY growth, in %\n
+    :cols_rate `list[str]`: columns to convert into 4-quarter differences\n
+    :cols_lags `Optional[list[str]]`: columns to lag (after all transformations), as col_lag1 to col_lag<n_lags>\n
+    :n_lags `int`: number of lags\n
+    :cols_is_zero `Optional[list[str]]`: columns to flag as col_is_zero (1 if zero, 0 if positive), before transforming\n
+    :cols_powers `Optional[list[str]]`: columns to raise to the power of 2 and 3, as col_sq and col_cube\n
+    :interactions `Optional[dict[str, list[str]]]`: new column name: columns to multiply together\n
+    :formulas `Optional[list[str]]`: formulas or variable names the panel is for; only the columns they mention are built, None builds every column\n
+    :t_start `Optional[str]`: first quarter to keep (inclusive), e.g. "1991Q1"\n
+    :t_end `Optional[str]`: last quarter to keep (inclusive); if either bound is given, "quarter" is replaced by a numeric "time" index\n
+    :path_cache `str`: root folder of the cache, e.g. "./cache/"\n
+    :return `pd.DataFrame`: long panel sorted by country and quarter
+    """
+    files_input = [
+        path_data + "data_macro_quarterly.parquet",
+        path_output + "plucking_ugap_quarterly.parquet",
+        path_data + "data_macro_quarterly_expcpi.parquet",
+    ]
+    # variables mentioned in the formulas
+    columns = None
+    if formulas is not None:
+        columns = re.findall(r"[A-Za-z_][A-Za-z0-9_]*", " ".join(formulas))
+    # one folder per version of the input files, one file per set of settings
+    version = hashlib.sha256(
+        repr([file_sha256(i) for i in files_input]).encode()
+    ).hexdigest()
+    key = hashlib.sha256(
+        json.dumps(
+            [
+                sorted(countries),
+                cols_levels,
+                cols_rate,
+                cols_lags,
+                n_lags,
+                cols_is_zero,
+                cols_powers,
+                interactions,
+                None if columns is None else sorted(set(columns)),
+            ]
+        ).encode()
+    ).hexdigest()
+    path_panel = os.path.join(path_cache, "analysis_panel")
+    file_panel = os.path.join(path_panel, version, key + ".parquet")
+    if os.path.isfile(file_panel):
+        df = pd.read_parquet(file_panel)
+    else:
+        # invalidate panels built from earlier versions of the inputs
+        if os.path.isdir(path_panel):
+            for name in os.listdir(path_panel):
+                if name != version:
+                    shutil.rmtree(os.path.join(path_panel, name), ignore_errors=True)
+        # load (each store is rebuilt first if it differs from the flat file hashed above)
+        df = read_partitioned_store(
+            path_store=path_data + "store/",
+            dataset="data_macro",
+            frequency="quarterly",
+            countries=countries,
+            path_source=files_input[0],
+        )
+        df_ugap = read_partitioned_store(
+            path_store=path_output + "store/",
+            dataset="plucking_ugap",
+            frequency="quarterly",
+            countries=countries,
+            path_source=files_input[1],
+        )
+        df_ugap["quarter"] = df_ugap["quarter"].astype("str")
+        df_expcpi = read_partitioned_store(
+            path_store=path_data + "store/",
+            dataset="data_macro_expcpi",
+            frequency="quarterly",
+            countries=countries,
+            path_source=files_input[2],
+        )
+        # merge
+        df = df.merge(
+            df_ugap, on=["country", "quarter"], how="outer", validate="one_to_one"
+        )
+        df = df.merge(
+            df_expcpi, on=["country", "quarter"], how="outer", validate="one_to_one"
+        )
+        df = df.sort_values(by=["country", "quarter"])
+        df = df[df["country"].isin(countries)]
+        # transform
+        features = declare_features(
+            cols_levels=cols_levels,
+            cols_rate=cols_rate,
+            cols_lags=cols_lags,
+            n_lags=n_lags,
+            cols_is_zero=cols_is_zero,
+            cols_powers=cols_powers,
+            interactions=interactions,
+        )
+        df = materialise_features(df, features=features, columns=columns)
+        df = df.reset_index(drop=True)
+        os.makedirs(os.path.dirname(file_panel), exist_ok=True)
+        df.to_parquet(file_panel + ".tmp", index=False)
+        os.replace(file_panel + ".tmp", file_panel)
+    # trim dates
+    if t_start is not None or t_end is not None:
+        df["quarter"] = as_period(df["quarter"], frequency="quarter")
+        if t_start is not None:
+            df = df[df["quarter"] >= t_start]
+        if t_end is not None:
+            df = df[df["quarter"] <= t_end]
+        df = df.reset_index(drop=True)
+        # numeric time index
+        df["time"] = df.groupby("country").cumcount()
+        del df["quarter"]
+
+    return df
+
+
+# --- Compact panel
+
+
+def compact_panel(
+    data: pd.DataFrame,
+    entities_label: str = "country",
+    time_label: str = "quarter",
+    frequency: str = "quarter",
+    float32: bool = False,
+) -> pd.DataFrame:
+    """
+    Store a long panel compactly. Entities become a categorical, time becomes an int32 ordinal, and the
+    numeric columns are held in one contiguous float block. Rows are sorted by entity then time, so every
+    entity is a contiguous range of rows, and slicing that range with .iloc does not copy the block.
+
+    :data `pd.DataFrame`: long panel\n
+    :entities_label `str`: entity column\n
+    :time_label `str`: time column; integers (e.g. a numeric "time" index) are kept as they are, anything else is converted to period ordinals\n
+    :frequency `str`: frequency of time_label, if it is converted to period ordinals\n
+    :float32 `bool`: hold the numeric columns as float32, halving their memory; estimates will differ slightly from float64\n
+    :return `pd.DataFrame`: entities_label, time_label, the numeric columns, then any other columns
+    """
+    entities = data[entities_label].to_numpy()
+    categories = pd.Index(pd.unique(entities)).dropna().sort_values()
+    codes = categories.get_indexer(entities)
+    if pd.api.types.is_integer_dtype(data[time_label]):
+        time = data[time_label].to_numpy(dtype="int32")
+    else:
+        time = to_period_ordinal(data[time_label], frequency=frequency).astype("int32")
+    # entity, then time, keeping the original order of ties
+    order = np.lexsort((time, codes))
+    if np.all(np.diff(order) == 1):
+        order = slice(None)
+    cols = [i for i in data.columns if i not in [entities_label, time_label]]
+    cols_num = [i for i in cols if pd.api.types.is_numeric_dtype(data[i])]
+    cols_other = [i for i in cols if i not in cols_num]
+    values = data[cols_num].to_numpy(dtype="float32" if float32 else "float64")
+    df = pd.DataFrame(np.ascontiguousarray(values[order]), columns=cols_num)
+    df.insert(
+        0,
+        entities_label,
+        pd.Categorical.from_codes(codes[order], categories=categories),
+    )
+    df.insert(1, time_label, time[order])
+    for col in cols_other:
+        df[col] = data[col].to_numpy()[order]
+
+    return df
+
+
+def panel_to_multiindex(
+    data: pd.DataFrame,
+    cols: list[str] = None,
+    entities_label: str = "country",
+    time_label: str = "quarter",
+) -> pd.DataFrame:
+    """
+    Entity-time MultiIndex frame, as linearmodels and localprojections expect.
+
+    :data `pd.DataFrame`: long panel, ideally from compact_panel\n
+    :cols `Optional[list[str]]`: columns to keep; None keeps all\n
+    :entities_label `str`: entity column, first level of the index\n
+    :time_label `str`: time column, second level of the index\n
+    :return `pd.DataFrame`: frame indexed by (entities_label, time_label)
+    """
+    if cols is not None:
+        data = data[[entities_label, time_label] + list(cols)]
+
+    return data.set_index([entities_label, time_label])
+
+
+def index_panel(
+    data: pd.DataFrame,
+    entities_label: str = "country",
+    groups: dict = None,
+):
+    """
+    Index a long panel by entity, so that every entity, and every group of entities, is a contiguous range of rows.
+    Rows are reordered at most once and stably: entities in groups come first, group by group, then the rest,
+    each in order of first appearance. A panel already laid out this way is returned as it is.
+    Fetching an entity or a group is then data.iloc[dict_slices[key]], which does not scan or copy the panel.
+
+    :data `pd.DataFrame`: long panel\n
+    :entities_label `str`: entity column\n
+    :groups `Optional[dict]`: group name -> list of entities (e.g. {"AEs": countries_adv}); each entity can be in one group only\n
+    :return `tuple[pd.DataFrame, dict]`: the panel, and a dict of entity or group name -> slice of rows
+    """
+    codes, entities = pd.factorize(data[entities_label])
+    list_entities = list(entities)
+    # entities in groups first, keeping their order of appearance
+    dict_group_members = {}
+    if groups is not None:
+        for group, members in groups.items():
+            if group in list_entities:
+                raise ValueError(str(group) + " is both a group and an entity")
+            members = set(members)
+            dict_group_members[group] = [i for i in list_entities if i in members]
+        list_grouped = [i for v in dict_group_members.values() for i in v]
+        if len(list_grouped) != len(set(list_grouped)):
+            raise ValueError("Entities can be in one group only")
+        list_entities = list_grouped + [
+            i for i in list_entities if i not in set(list_grouped)
+        ]
+    dict_position = {entity: i for i, entity in enumerate(list_entities)}
+    # position of every row's entity; missing entities (code -1) go last
+    rank = np.array([dict_position[i] for i in entities] + [len(entities)])
+    keys = rank[codes]
+    order = np.argsort(keys, kind="stable")
+    if not np.all(np.diff(order) == 1):
+        data = data.take(order)
+        keys = keys[order]
+    bounds = np.searchsorted(keys, np.arange(len(entities) + 1))
+    # row ranges
+    dict_slices = {
+        entity: slice(int(bounds[i]), int(bounds[i + 1]))
+        for i, entity in enumerate(list_entities)
+    }
+    for group, members in dict_group_members.items():
+        if len(members) == 0:
+            dict_slices[group] = slice(0, 0)
+        else:
+            dict_slices[group] = slice(
+                dict_slices[members[0]].start, dict_slices[members[-1]].stop
+            )
+
+    return data, dict_slices
+
+
 # --- ITS
 
 
@@ -331,11 +2013,8 @@ def estimate_its_arx(
 
 
 def reg_ols(df: pd.DataFrame, eqn: str, del_se=True):
-    # Work on copy
-    d = df.copy()
-
-    # Estimate model
-    mod = smf.ols(formula=eqn, data=d)
+    # Estimate model (does not modify df, so no copy)
+    mod = smf.ols(formula=eqn, data=df)
     res = mod.fit(cov_type="HC3")
     print(res.summary())
 
@@ -376,9 +2055,8 @@ def fe_reg(
     time_effects: bool,
     cov_choice: str,
 ):
-    # Work on copy
-    d = df.copy()
-    d = d.set_index([i_col, t_col])
+    # Indexed frame (set_index does not modify df, so no copy)
+    d = df.set_index([i_col, t_col])
 
     # Create eqn
     if not fixed_effects and not time_effects:
@@ -440,9 +2118,8 @@ def re_reg(
     t_col: str,
     cov_choice: str,
 ):
-    # Work on copy
-    d = df.copy()
-    d = d.set_index([i_col, t_col])
+    # Indexed frame (set_index does not modify df, so no copy)
+    d = df.set_index([i_col, t_col])
 
     # Create eqn
     eqn = y_col + "~" + "1 +" + "+".join(x_cols)
@@ -1331,9 +3008,11 @@ def subplots_linecharts(
     maxcols: int,
     title_size: int = 24,
 ):
+    # Row range of each group, in order of appearance
+    data, dict_slices = index_panel(data=data, entities_label=col_group)
     # Create titles first
     titles = []
-    for group in list(data[col_group].unique()):
+    for group in list(dict_slices.keys()):
         titles = titles + [group]
     maxr = maxrows
     maxc = maxcols
@@ -1342,9 +3021,9 @@ def subplots_linecharts(
     nc = 1
     # columns: shocks, rows: responses; move columns, then rows
     legend_count = 0
-    for group in list(data[col_group].unique()):
-        # Data copy
-        d = data[(data[col_group] == group)].copy()
+    for group in list(dict_slices.keys()):
+        # Rows of the group (a view, not a copy)
+        d = data.iloc[dict_slices[group]]
         # Set legend
         if legend_count == 0:
             showlegend_bool = True
@@ -1413,9 +3092,11 @@ def subplots_scatterplots(
     add_vertical_at_xzero: bool,
     add_horizontal_at_yzero: bool,
 ):
+    # Row range of each group, in order of appearance
+    data, dict_slices = index_panel(data=data, entities_label=col_group)
     # Create titles first
     titles = []
-    for group in list(data[col_group].unique()):
+    for group in list(dict_slices.keys()):
         titles = titles + [group]
     maxr = maxrows
     maxc = maxcols
@@ -1423,9 +3104,9 @@ def subplots_scatterplots(
     nr = 1
     nc = 1
     # columns: shocks, rows: responses; move columns, then rows
-    for group in list(data[col_group].unique()):
-        # Data copy
-        d = data[(data[col_group] == group)].copy()
+    for group in list(dict_slices.keys()):
+        # Rows of the group (a view, not a copy)
+        d = data.iloc[dict_slices[group]]
         # Add scatter plots
         for (
             col_x,
@@ -11,6 +11,360 @@ import time
 from dotenv import load_dotenv
 import os
 import ast
+import hashlib
+import shutil
+from multiprocess import get_context, get_all_start_methods
+from helper import file_sha256
+
+
+def layout_levels(levels: np.ndarray, index: np.ndarray):
+    """
+    Lay out levels by integer index label, for constant-time lookups in find_peaks_troughs.
+    The first row wins for duplicated labels, as with .values[0] on a selection.
+
+    :levels `np.ndarray`: levels of the series, in row order\n
+    :index `np.ndarray`: integer index labels of the rows (as in data.index)\n
+    :return `tuple[list[float], list[bool]]`: levels by label, and whether each label exists
+    """
+    index = np.asarray(index, dtype=np.int64)
+    levels = np.asarray(levels, dtype=np.float64)
+    keep = index >= 0
+    n_labels = int(index[keep].max()) + 1 if keep.any() else 0
+    arr_levels = np.full(n_labels, np.nan)
+    arr_present = np.zeros(n_labels, dtype=bool)
+    arr_levels[index[keep][::-1]] = levels[keep][::-1]
+    arr_present[index[keep]] = True
+    return arr_levels.tolist(), arr_present.tolist()
+
+
+def find_peaks_troughs(
+    levels: np.ndarray,
+    index: np.ndarray,
+    time: list[str],
+    threshold: float,
+    layout: tuple = None,
+    return_threshold_bounds: bool = False,
+):
+    """
+    Find peaks and troughs of a single series.
+    Runs the step-wise peak-trough search of compute_urate_floor on a contiguous array of levels,
+    so each comparison is a constant-time lookup instead of a scan of the whole data frame.
+
+    :levels `np.ndarray`: levels of the series, in row order\n
+    :index `np.ndarray`: integer index labels of the rows (as in data.index)\n
+    :time `list[str]`: time labels of the rows, in row order\n
+    :threshold `float`: downturn threshold, in the same units as levels\n
+    :layout `Optional[tuple]`: output of layout_levels, to reuse across thresholds\n
+    :return_threshold_bounds `Optional[bool]`: also return the range of thresholds (lower exclusive, upper inclusive) that follow the same search path\n
+    :return `tuple[list[str], list[str]]`: time labels of the peaks and troughs
+    """
+    # Lay out levels by index label
+    index = np.asarray(index, dtype=np.int64)
+    if len(index) == 0:
+        if return_threshold_bounds:
+            return [], [], -np.inf, np.inf
+        return [], []
+    if layout is None:
+        layout = layout_levels(levels=levels, index=index)
+    arr_levels, arr_present = layout
+    n_labels = len(arr_levels)
+
+    # Labels missing from the index end the current attempt, as with .values[0] on an empty selection
+    def level(t):
+        if t >= n_labels or not arr_present[t]:
+            raise IndexError(t)
+        return arr_levels[t]
+
+    # Base list of peaks and troughs
+    list_peaks = []
+    list_troughs = []
+
+    # Initialise parameters
+    t_last = int(index[-1])
+    t_cp = 0  # peak candidate
+    t_ct = 0  # trough candidate
+    t_next = t_cp + 1  # initial time stamp
+    just_found_peak = False
+    just_found_trough = False
+    stuck_in_step_two = True
+    stuck_in_step_six = True
+    threshold_lb = -np.inf  # thresholds that pass the same downturn checks
+    threshold_ub = np.inf
+
+    while t_next <= t_last:
+        try:
+            # FIND PEAK
+            # step one and two
+            stuck_in_step_one = True
+            while stuck_in_step_one:
+                if just_found_trough:
+                    t_cp = t_ct + 1
+                    t_next = t_cp + 1
+                else:
+                    t_cp = t_cp + 1
+                    t_next = t_next + 1
+                just_found_trough = (
+                    False  # only allow just_found_trough to be true once per loop
+                )
+                stuck_in_step_one = level(t_cp) > level(t_next)
+            # step three (left as is if interrupted between step three and two, as before)
+            while stuck_in_step_two:
+                level_cp, level_next = level(t_cp), level(t_next)
+                go_back = level_cp + threshold > level_next
+                if go_back:
+                    threshold_lb = max(threshold_lb, level_next - level_cp)
+                elif level_next - level_cp < threshold_ub:
+                    threshold_ub = level_next - level_cp
+                stuck_in_step_two, t_next = go_back, t_next + 1  # without changing t_cp
+                restuck_in_step_one = level(t_cp) > level(t_next)
+                while restuck_in_step_one:  # back to step one
+                    t_cp = t_cp + 1
+                    t_next = t_next + 1
+                    restuck_in_step_one = level(t_cp) > level(t_next)
+            stuck_in_step_two = True  # reset so loop will run again
+            # step four
+            list_peaks.append(time[t_cp])  # we have a peak
+            just_found_peak = True  # voila
+
+            # FIND TROUGH
+            # step five and six (equivalent to one and two)
+            stuck_in_step_five = True
+            while stuck_in_step_five:
+                if just_found_peak:
+                    t_ct = t_cp + 1
+                    t_next = t_ct + 1
+                else:
+                    t_ct = t_ct + 1
+                    t_next = t_next + 1
+                just_found_peak = (
+                    False  # only allow just_found_peak to be true once per loop
+                )
+                stuck_in_step_five = level(t_ct) < level(t_next)
+            # step seven (equivalent to three)
+            while stuck_in_step_six:
+                level_ct, level_next = level(t_ct), level(t_next)
+                go_back = level_ct - threshold < level_next
+                if go_back:
+                    threshold_lb = max(threshold_lb, level_ct - level_next)
+                elif level_ct - level_next < threshold_ub:
+                    threshold_ub = level_ct - level_next
+                stuck_in_step_six, t_next = go_back, t_next + 1  # without changing t_ct
+                restuck_in_step_five = level(t_ct) < level(t_next)
+                while restuck_in_step_five:  # back to step five
+                    t_ct = t_ct + 1
+                    t_next = t_next + 1
+                    restuck_in_step_five = level(t_ct) < level(t_next)
+            stuck_in_step_six = True  # reset so loop will run again
+            # step eight (equivalent to four)
+            list_troughs.append(time[t_ct])  # we have a trough
+            just_found_trough = True
+        except IndexError:
+            pass
+
+    # Output
+    if return_threshold_bounds:
+        return list_peaks, list_troughs, threshold_lb, threshold_ub
+    return list_peaks, list_troughs
+
+
+def extend_with_slope(values: np.ndarray, slope: float):
+    """
+    Fill gaps that follow an observed value by adding a constant slope per step.
+    Equivalent to repeatedly filling missing values with the previous value plus slope until nothing changes,
+    but done in one pass over each gap; gaps before the first observed value are left as is.
+
+    :values `np.ndarray`: series with missing values as NaN\n
+    :slope `float`: increment per step\n
+    :return `np.ndarray`: a filled copy of values
+    """
+    values = np.array(values, dtype=np.float64)
+    if len(values) == 0:
+        return values
+    isna = np.isnan(values)
+    # start and end (exclusive) of every run of missing values
+    edges = np.diff(isna.astype(np.int8))
+    starts = np.flatnonzero(edges == 1) + 1
+    ends = np.flatnonzero(edges == -1) + 1
+    if isna[0]:
+        ends = ends[1:]  # leading gap has nothing to extend from
+    if isna[-1]:
+        ends = np.append(ends, len(values))
+    for start, end in zip(starts, ends):
+        # sequential sums, so values match step-by-step filling exactly
+        steps = np.full(end - start + 1, slope)
+        steps[0] = values[start - 1]
+        values[start:end] = np.cumsum(steps)[1:]
+    return values
+
+
+def extrapolate_ceiling(ceiling: pd.Series, cepi: pd.Series):
+    """
+    Extrapolate the interpolated ceiling beyond the first and last peaks.
+    End points follow the average slope of the ceiling over the second-last ceiling episode,
+    and start points follow the average slope over the first full ceiling episode.
+
+    :ceiling `pd.Series`: interpolated ceiling, with gaps at either end\n
+    :cepi `pd.Series`: ceiling (peak-to-peak) episodes\n
+    :return `pd.Series`: extrapolated ceiling
+    """
+    # end-point extrapolation
+    cepi_minusone = cepi.max() - 1
+    ceiling_minusone_avgdiff = (ceiling - ceiling.shift(1))[
+        cepi == cepi_minusone
+    ].mean()
+    values = extend_with_slope(ceiling.to_numpy(), ceiling_minusone_avgdiff)
+
+    # start-point extrapolation
+    ceiling = pd.Series(values, index=ceiling.index, name=ceiling.name)
+    ceiling_one_avgdiff = (ceiling - ceiling.shift(1))[cepi == 1].mean()
+    values = extend_with_slope(values[::-1], -ceiling_one_avgdiff)[::-1]  # reverse
+
+    # Output
+    return pd.Series(values, index=ceiling.index, name=ceiling.name)
+
+
+def iter_peaks_troughs(levels: list[float], time: list[str], state: dict):
+    """
+    Resumable version of find_peaks_troughs for a series indexed 0 to n-1.
+    Reads state["t_last"] and state["threshold"], and pauses (yields) whenever it needs a row beyond
+    state["t_last"], which is where a search on the truncated series would stop.
+    Peaks, troughs, and the range of thresholds that follow the same path are kept in state.
+
+    :levels `list[float]`: levels of the full series, in row order\n
+    :time `list[str]`: time labels of the full series, in row order\n
+    :state `dict`: t_last, threshold, threshold_lb, threshold_ub, list_peaks and list_troughs
+    """
+    # Initialise parameters
+    t_cp = 0  # peak candidate
+    t_ct = 0  # trough candidate
+    t_next = t_cp + 1  # initial time stamp
+    just_found_peak = False
+    just_found_trough = False
+    stuck_in_step_two = True
+    stuck_in_step_six = True
+
+    while True:
+        while t_next > state["t_last"]:
+            yield
+        # FIND PEAK
+        # step one and two
+        stuck_in_step_one = True
+        while stuck_in_step_one:
+            if just_found_trough:
+                t_cp = t_ct + 1
+                t_next = t_cp + 1
+            else:
+                t_cp = t_cp + 1
+                t_next = t_next + 1
+            just_found_trough = False
+            while t_next > state["t_last"]:
+                yield
+            stuck_in_step_one = levels[t_cp] > levels[t_next]
+        # step three
+        while stuck_in_step_two:
+            go_back = levels[t_cp] + state["threshold"] > levels[t_next]
+            if go_back:
+                state["threshold_lb"] = max(
+                    state["threshold_lb"], levels[t_next] - levels[t_cp]
+                )
+            elif levels[t_next] - levels[t_cp] < state["threshold_ub"]:
+                state["threshold_ub"] = levels[t_next] - levels[t_cp]
+            stuck_in_step_two, t_next = go_back, t_next + 1
+            while t_next > state["t_last"]:
+                yield
+            restuck_in_step_one = levels[t_cp] > levels[t_next]
+            while restuck_in_step_one:
+                t_cp = t_cp + 1
+                t_next = t_next + 1
+                while t_next > state["t_last"]:
+                    yield
+                restuck_in_step_one = levels[t_cp] > levels[t_next]
+        stuck_in_step_two = True
+        # step four
+        state["list_peaks"].append(time[t_cp])
+        just_found_peak = True
+
+        # FIND TROUGH
+        # step five and six
+        stuck_in_step_five = True
+        while stuck_in_step_five:
+            if just_found_peak:
+                t_ct = t_cp + 1
+                t_next = t_ct + 1
+            else:
+                t_ct = t_ct + 1
+                t_next = t_next + 1
+            just_found_peak = False
+            while t_next > state["t_last"]:
+                yield
+            stuck_in_step_five = levels[t_ct] < levels[t_next]
+        # step seven
+        while stuck_in_step_six:
+            go_back = levels[t_ct] - state["threshold"] < levels[t_next]
+            if go_back:
+                state["threshold_lb"] = max(
+                    state["threshold_lb"], levels[t_ct] - levels[t_next]
+                )
+            elif levels[t_ct] - levels[t_next] < state["threshold_ub"]:
+                state["threshold_ub"] = levels[t_ct] - levels[t_next]
+            stuck_in_step_six, t_next = go_back, t_next + 1
+            while t_next > state["t_last"]:
+                yield
+            restuck_in_step_five = levels[t_ct] < levels[t_next]
+            while restuck_in_step_five:
+                t_ct = t_ct + 1
+                t_next = t_next + 1
+                while t_next > state["t_last"]:
+                    yield
+                restuck_in_step_five = levels[t_ct] < levels[t_next]
+        stuck_in_step_six = True
+        # step eight
+        state["list_troughs"].append(time[t_ct])
+        just_found_trough = True
+
+
+def track_peaks_troughs(
+    levels: np.ndarray,
+    time: list[str],
+    list_n_rows: list[int],
+    list_thresholds: list[float],
+):
+    """
+    Find peaks and troughs of every expanding window of a single series indexed 0 to n-1.
+    The search is carried forward from one window to the next, and only restarts when the threshold
+    of the new window would flip a comparison made so far.
+
+    :levels `np.ndarray`: levels of the full series, in row order\n
+    :time `list[str]`: time labels of the full series, in row order\n
+    :list_n_rows `list[int]`: number of rows in each window, in ascending order\n
+    :list_thresholds `list[float]`: downturn threshold of each window\n
+    :return `list[tuple[list[str], list[str]]]`: time labels of the peaks and troughs of each window
+    """
+    levels = np.asarray(levels, dtype=np.float64).tolist()
+    list_results = []
+    state = None
+    for n_rows, threshold in zip(list_n_rows, list_thresholds):
+        # same path as long as the threshold is safely inside the range seen so far
+        tolerance = 1e-9 * max(1, abs(threshold))
+        carry_forward = (
+            (state is not None)
+            and (threshold > state["threshold_lb"] + tolerance)
+            and (threshold <= state["threshold_ub"] - tolerance)
+        )
+        if not carry_forward:
+            state = {
+                "threshold_lb": -np.inf,
+                "threshold_ub": np.inf,
+                "list_peaks": [],
+                "list_troughs": [],
+            }
+            search = iter_peaks_troughs(levels=levels, time=time, state=state)
+        state["t_last"] = n_rows - 1
+        state["threshold"] = threshold
+        next(search)  # run until the window is exhausted
+        list_results.append((list(state["list_peaks"]), list(state["list_troughs"])))
+    # output
+    return list_results
 
 
 def compute_urate_floor(
@@ -21,6 +375,7 @@ def compute_urate_floor(
     downturn_threshold,
     bounds_timing_shift,
     hard_bound,
+    turning_points=None,
 ):
     # Deep copy
     df = data.copy()
@@ -51,13 +406,37 @@ def compute_urate_floor(
 
     # Store list of months
     list_time = [str(i) for i in list(df[time_label])]
-    list_indices = [i for i in list(df.index)]
 
-    # Counter for if lower bound or point estimate is being calculated
-    count_xbound_now = 0
+    # Find peaks and troughs once; the lower bound reuses them with shifted peaks
+    dict_peaks = {}
+    dict_troughs = {}
+    for col_level in cols_levels:
+        # Compute downturn threshold using standard deviation of logdiff
+        # threshold_for_this_col = downturn_threshold
+        threshold_for_this_col = df[col_level].std() * downturn_threshold
+        # threshold_for_this_col = df[col_diff].std() * downturn_threshold
+
+        # Find peaks and troughs (unless already found, e.g. by track_peaks_troughs)
+        if turning_points is not None:
+            list_peaks_col, list_troughs_col = turning_points[col_level]
+        else:
+            list_peaks_col, list_troughs_col = find_peaks_troughs(
+                levels=df[col_level].to_numpy(dtype="float64", na_value=np.nan),
+                index=df.index.to_numpy(),
+                time=list_time,
+                threshold=threshold_for_this_col,
+            )
+        list_peaks = list_peaks + list_peaks_col
+        list_troughs = list_troughs + list_troughs_col
+        dict_peaks[col_level] = list_peaks
+        dict_troughs[col_level] = list_troughs
+
+        # Check
+        print("Peaks in " + col_level + ": " + ", ".join(list_peaks))
+        print("Troughs in " + col_level + ": " + ", ".join(list_troughs))
 
-    # Loop through list of timestamps
-    while count_xbound_now <= 1:
+    # Point estimate (0) and lower bound (1) from the same peaks and troughs
+    for count_xbound_now in [0, 1]:
         for (
             col_level,
             col_peak,
@@ -86,177 +465,18 @@ def compute_urate_floor(
                 col_pace = col_pace + "_lb"
                 col_ceiling = col_ceiling + "_lb"
 
-            # Compute downturn threshold using standard deviation of logdiff
-            # threshold_for_this_col = downturn_threshold
-            threshold_for_this_col = df[col_level].std() * downturn_threshold
-            # threshold_for_this_col = df[col_diff].std() * downturn_threshold
-
-            # Initialise parameters
-            t_cp = 0  # peak candidate
-            t_ct = 0  # trough candidate
-            t_next = t_cp + 1  # initial time stamp
-            just_found_peak = False
-            just_found_trough = False
-            stuck_in_step_one = True
-            stuck_in_step_two = True
-            stuck_in_step_five = True
-            stuck_in_step_six = True
-
-            # Define all requisite steps as functions
-
-            def step_one(just_found_trough: bool, t_cp, t_ct, t_next):
-                if just_found_trough:
-                    t_cp = t_ct + 1
-                    t_next = t_cp + 1
-                elif not just_found_trough:
-                    t_cp = t_cp + 1
-                    t_next = t_next + 1
-                return t_cp, t_next
-
-            def step_two(df: pd.DataFrame, t_cp, t_next):
-                go_back = (
-                    df.loc[df.index == t_cp, col_level].values[0]
-                    > df.loc[df.index == t_next, col_level].values[0]  # opposite
-                )
-                return go_back
-
-            def step_three(df: pd.DataFrame, t_next):
-                go_back = (
-                    df.loc[df.index == t_cp, col_level].values[0]
-                    + threshold_for_this_col
-                    > df.loc[df.index == t_next, col_level].values[0]  # opposite
-                )
-                t_next = t_next + 1  # without changing t_cp
-                return go_back, t_next
-
-            def step_four(t_cp, list_peaks):
-                list_peaks = list_peaks + [list_time[t_cp]]
-                just_found_peak = True
-                return list_peaks, just_found_peak
-
-            def step_five(just_found_peak: bool, t_cp, t_ct, t_next):
-                if just_found_peak:
-                    t_ct = t_cp + 1
-                    t_next = t_ct + 1
-                elif not just_found_peak:
-                    t_ct = t_ct + 1
-                    t_next = t_next + 1
-                return t_ct, t_next
-
-            def step_six(df: pd.DataFrame, t_ct, t_next):
-                go_back = (
-                    df.loc[df.index == t_ct, col_level].values[0]
-                    < df.loc[df.index == t_next, col_level].values[0]  # opposite
-                )
-                return go_back
-
-            def step_seven(df: pd.DataFrame, t_next):
-                go_back = (
-                    df.loc[df.index == t_ct, col_level].values[0]
-                    - threshold_for_this_col
-                    < df.loc[df.index == t_next, col_level].values[0]  # opposite
-                )
-                t_next = t_next + 1  # without changing t_cp
-                return go_back, t_next
-
-            def step_eight(t_ct, list_troughs):
-                list_troughs = list_troughs + [list_time[t_ct]]
-                just_found_trough = True
-                return list_troughs, just_found_trough
-
-            while t_next <= list_indices[-1]:
-                try:
-                    # FIND PEAK
-                    # step one and two
-                    while stuck_in_step_one:
-                        # print('Step 1: t_next = ' + list_time[t_next] + ' for ' + col_level)
-                        t_cp, t_next = step_one(
-                            just_found_trough=just_found_trough,
-                            t_cp=t_cp,
-                            t_ct=t_ct,
-                            t_next=t_next,
-                        )
-                        just_found_trough = False  # only allow just_found_trough to be true once per loop
-                        stuck_in_step_one = step_two(df=df, t_cp=t_cp, t_next=t_next)
-                    stuck_in_step_one = True  # reset so loop will run again
-                    # step three
-                    while stuck_in_step_two:
-                        # print('Step 2-3: t_next = ' + list_time[t_next] + ' for ' + col_level)
-                        stuck_in_step_two, t_next = step_three(
-                            df=df, t_next=t_next
-                        )  # if true, skips next line
-                        restuck_in_step_one = step_two(df=df, t_cp=t_cp, t_next=t_next)
-                        while (
-                            restuck_in_step_one
-                        ):  # if step 3 is executed, but then fails step 2, so back to step 1
-                            # print('Back to step 1-2: t_next = ' + list_time[t_next] + ' for ' + col_level)
-                            t_cp, t_next = step_one(
-                                just_found_trough=just_found_trough,
-                                t_cp=t_cp,
-                                t_ct=t_ct,
-                                t_next=t_next,
-                            )
-                            restuck_in_step_one = step_two(
-                                df=df, t_cp=t_cp, t_next=t_next
-                            )
-                    stuck_in_step_two = True  # reset so loop will run again
-                    # step four
-                    # print('Step 4: t_cp = ' + list_time[t_cp] + ' for ' + col_level)
-                    list_peaks, just_found_peak = step_four(
-                        t_cp=t_cp, list_peaks=list_peaks
-                    )  # we have a peak
-                    just_found_peak = True  # voila
-
-                    # FIND TROUGH
-                    # step five and six (equivalent to one and two)
-                    while stuck_in_step_five:
-                        # print('Step 5: t_next = ' + list_time[t_next] + ' for ' + col_level)
-                        t_ct, t_next = step_five(
-                            just_found_peak=just_found_peak,
-                            t_cp=t_cp,
-                            t_ct=t_ct,
-                            t_next=t_next,
-                        )
-                        just_found_peak = (
-                            False  # only allow just_found_peak to be true once per loop
-                        )
-                        stuck_in_step_five = step_six(df=df, t_ct=t_ct, t_next=t_next)
-                    stuck_in_step_five = True  # reset so loop will run again
-                    # step seven (equivalent to three)
-                    while stuck_in_step_six:
-                        # print('Step 6-7: t_next = ' + list_time[t_next] + ' for ' + col_level)
-                        stuck_in_step_six, t_next = step_seven(
-                            df=df, t_next=t_next
-                        )  # if true, skips next line
-                        restuck_in_step_five = step_six(df=df, t_ct=t_ct, t_next=t_next)
-                        while restuck_in_step_five:
-                            # print('Back to step 5-6: t_next = ' + list_time[t_next] + ' for ' + col_level)
-                            t_ct, t_next = step_five(
-                                just_found_peak=just_found_peak,
-                                t_cp=t_cp,
-                                t_ct=t_ct,
-                                t_next=t_next,
-                            )
-                            restuck_in_step_five = step_six(
-                                df=df, t_ct=t_ct, t_next=t_next
-                            )
-                    stuck_in_step_six = True  # reset so loop will run again
-                    # step eight (equivalent to four)
-                    # print('Step 8: t_ct = ' + list_time[t_ct] + ' for ' + col_level)
-                    list_troughs, just_found_trough = step_eight(
-                        t_ct=t_ct, list_troughs=list_troughs
-                    )  # we have a trough
-                except:
-                    pass
-
-            # Check
-            print("Peaks in " + col_level + ": " + ", ".join(list_peaks))
-            print("Troughs in " + col_level + ": " + ", ".join(list_troughs))
+            # Lower bound sees the turning points of every column in levels_labels
+            if count_xbound_now == 0:
+                list_peaks_now = dict_peaks[col_level]
+                list_troughs_now = dict_troughs[col_level]
+            elif count_xbound_now == 1:
+                list_peaks_now = list_peaks
+                list_troughs_now = list_troughs
 
             # Add columns indicating peaks and troughs
-            df.loc[df[time_label].isin(list_peaks), col_peak] = 1
+            df.loc[df[time_label].isin(list_peaks_now), col_peak] = 1
             df[col_peak] = df[col_peak].fillna(0)
-            df.loc[df[time_label].isin(list_troughs), col_trough] = 1
+            df.loc[df[time_label].isin(list_troughs_now), col_trough] = 1
             df[col_trough] = df[col_trough].fillna(0)
 
             # For Xbounds
@@ -304,28 +524,10 @@ def compute_urate_floor(
                         df[col_ceiling] = df[col_ceiling].interpolate(
                             method="linear"
                         )  # too sparse for cubic
-                # end-point extrapolation
-                cepi_minusone = df[col_cepi].max() - 1
-                df["_x"] = df[col_ceiling] - df[col_ceiling].shift(1)
-                ceiling_minusone_avgdiff = (
-                    df.loc[df[col_cepi] == cepi_minusone, "_x"]
-                ).mean()
-                del df["_x"]
-                nrows_na = len(df.isna())
-                for r in range(nrows_na):
-                    df.loc[df[col_ceiling].isna(), col_ceiling] = (
-                        df[col_ceiling].shift(1) + ceiling_minusone_avgdiff
-                    )
-
-                # start-point extrapolation
-                df["_x"] = df[col_ceiling] - df[col_ceiling].shift(1)
-                ceiling_one_avgdiff = (df.loc[df[col_cepi] == 1, "_x"]).mean()
-                del df["_x"]
-                nrows_na = len(df.isna())
-                for r in range(nrows_na):
-                    df.loc[df[col_ceiling].isna(), col_ceiling] = (
-                        df[col_ceiling].shift(-1) - ceiling_one_avgdiff
-                    )  # reverse
+                # end- and start-point extrapolation
+                df[col_ceiling] = extrapolate_ceiling(
+                    ceiling=df[col_ceiling], cepi=df[col_cepi]
+                )
             if single_exp:
                 df[col_peak] = df[ref_peak].copy()
                 df[col_cepi] = df[ref_cepi].copy()
@@ -348,28 +550,10 @@ def compute_urate_floor(
                             method="linear"
                         )  # too sparse for cubic
 
-                # end-point extrapolation
-                cepi_minusone = df[col_cepi].max() - 1
-                df["_x"] = df[col_ceiling] - df[col_ceiling].shift(1)
-                ceiling_minusone_avgdiff = (
-                    df.loc[df[col_cepi] == cepi_minusone, "_x"]
-                ).mean()
-                del df["_x"]
-                nrows_na = len(df.isna())
-                for r in range(nrows_na):
-                    df.loc[df[col_ceiling].isna(), col_ceiling] = (
-                        df[col_ceiling].shift(1) + ceiling_minusone_avgdiff
-                    )
-
-                # start-point extrapolation
-                df["_x"] = df[col_ceiling] - df[col_ceiling].shift(1)
-                ceiling_one_avgdiff = (df.loc[df[col_cepi] == 1, "_x"]).mean()
-                del df["_x"]
-                nrows_na = len(df.isna())
-                for r in range(nrows_na):
-                    df.loc[df[col_ceiling].isna(), col_ceiling] = (
-                        df[col_ceiling].shift(-1) - ceiling_one_avgdiff
-                    )  # reverse
+                # end- and start-point extrapolation
+                df[col_ceiling] = extrapolate_ceiling(
+                    ceiling=df[col_ceiling], cepi=df[col_cepi]
+                )
 
             # hard-impose definition of 'ceiling' (floor for urate) & non-negative condition
             if hard_bound | (col_level == "ln_lforce") | (col_level == "ln_nks"):
@@ -378,14 +562,813 @@ def compute_urate_floor(
                 ]  # replace with levels if first guess is lower; opposite because urate
                 df.loc[df[col_ceiling] < 0, col_ceiling] = 0  # non-negative condition
 
-        # Left-right merge + bounds
-        if count_xbound_now == 0:
-            df_consol = df.copy()
-        elif count_xbound_now == 1:
-            df_consol = df_consol.combine_first(df)  # with xbounds
+    # Output
+    return df
+
+
+def split_panel_by_country(
+    data: pd.DataFrame,
+    country_parameters: pd.DataFrame,
+    entities_label: str,
+    time_label: str,
+):
+    # Parameters by country
+    dict_country_x_multiplier = dict(
+        zip(
+            country_parameters[entities_label],
+            country_parameters["x_multiplier_choice"],
+        )
+    )
+    dict_country_tlb = dict(
+        zip(country_parameters[entities_label], country_parameters["tlb"].fillna(""))
+    )
+    # Sort panel by country once (stable, in order of first appearance), so each country is a row range
+    codes, entities = pd.factorize(data[entities_label])
+    codes[codes < 0] = len(entities)  # missing countries last, and left out
+    order = np.argsort(codes, kind="stable")
+    if not np.all(np.diff(order) == 1):
+        data = data.take(order)
+        codes = codes[order]
+    bounds = np.searchsorted(codes, np.arange(len(entities) + 1))
+    # Split panel into countries in one pass, with views of the sorted panel
+    list_splits = []
+    for entity, start, stop in zip(entities, bounds[:-1], bounds[1:]):
+        if entity not in dict_country_x_multiplier:
+            print("No parameters for " + str(entity) + ", skipping")
+            continue
+        df_sub = data.iloc[start:stop].reset_index(drop=True)
+        # restrict time
+        tlb = dict_country_tlb[entity]
+        if tlb == "":
+            pass
+        else:
+            df_sub[time_label] = pd.to_datetime(df_sub[time_label]).dt.to_period("q")
+            df_sub = df_sub[df_sub[time_label] >= tlb].copy()
+            df_sub[time_label] = df_sub[time_label].astype("str")
+        list_splits.append((entity, df_sub, dict_country_x_multiplier[entity], tlb))
+    # output
+    return list_splits
+
+
+def run_by_country(func, list_tasks: list[tuple], n_jobs: int = None):
+    # workers are forked, as the calling scripts have no __main__ guard
+    if n_jobs is None:
+        n_jobs = os.cpu_count()
+    if (n_jobs > 1) & (len(list_tasks) > 1) & ("fork" in get_all_start_methods()):
+        with get_context("fork").Pool(processes=min(n_jobs, len(list_tasks))) as pool:
+            list_results = pool.starmap(func, list_tasks)
+    else:
+        list_results = [func(*task) for task in list_tasks]
+    # output
+    return list_results
+
+
+def fingerprint_urate_floor_inputs(
+    data: pd.DataFrame,
+    levels_labels: list[str],
+    ref_level_label: str,
+    time_label: str,
+    downturn_threshold: float,
+    bounds_timing_shift: int,
+    hard_bound: bool,
+    tlb: str,
+):
+    # hash of the series (values, index and dtypes) and of the floor parameters
+    h = hashlib.sha256()
+    h.update(pd.util.hash_pandas_object(data, index=True).to_numpy().tobytes())
+    h.update(
+        repr(
+            (
+                [str(i) for i in data.columns],
+                [str(i) for i in data.dtypes],
+                list(levels_labels),
+                ref_level_label,
+                time_label,
+                float(downturn_threshold),
+                int(bounds_timing_shift),
+                bool(hard_bound),
+                str(tlb),
+            )
+        ).encode()
+    )
+    return h.hexdigest()
+
+
+def prepare_urate_floor_cache(path_cache: str, path_source: str = None):
+    """
+    Set up the on-disk cache of urate floors for one source data file.
+    Entries are kept in a folder named after the content hash of path_source;
+    folders made from earlier versions of the same file are deleted, so a changed file invalidates the cache.
+
+    :path_cache `str`: root folder of the cache, e.g. "./cache/"\n
+    :path_source `Optional[str]`: data file the floors are computed from, e.g. "./data/data_macro_quarterly_urate.parquet"\n
+    :return `str`: folder holding the cache entries for the current version of path_source
+    """
+    if path_source is None:
+        path_source_cache = os.path.join(path_cache, "urate_floor", "unversioned")
+        data_version = "unversioned"
+    else:
+        path_source_cache = os.path.join(
+            path_cache, "urate_floor", os.path.basename(path_source)
+        )
+        data_version = file_sha256(path_source)
+    # invalidate entries from other versions of the source
+    if os.path.isdir(path_source_cache):
+        for name in os.listdir(path_source_cache):
+            if name != data_version:
+                shutil.rmtree(os.path.join(path_source_cache, name), ignore_errors=True)
+    path_version = os.path.join(path_source_cache, data_version)
+    os.makedirs(path_version, exist_ok=True)
+    # output
+    return path_version
+
+
+def evict_urate_floor_cache(
+    path_version: str, max_size_mb: float = 512, max_entries: int = 10000
+):
+    # least recently used entries first
+    list_entries = sorted(
+        [i for i in os.scandir(path_version) if i.name.endswith(".pkl")],
+        key=lambda i: i.stat().st_mtime,
+    )
+    total_size = sum([i.stat().st_size for i in list_entries])
+    while (len(list_entries) > 0) and (
+        (total_size > max_size_mb * 1024**2) | (len(list_entries) > max_entries)
+    ):
+        entry = list_entries.pop(0)
+        total_size -= entry.stat().st_size
+        os.remove(entry.path)
+
+
+def compute_urate_floor_cached(
+    data: pd.DataFrame,
+    levels_labels: list[str],
+    ref_level_label: str,
+    time_label: str,
+    downturn_threshold: float,
+    bounds_timing_shift: int,
+    hard_bound: bool,
+    tlb: str,
+    path_version: str,
+):
+    # look up by hash of the series and parameters
+    key = fingerprint_urate_floor_inputs(
+        data=data,
+        levels_labels=levels_labels,
+        ref_level_label=ref_level_label,
+        time_label=time_label,
+        downturn_threshold=downturn_threshold,
+        bounds_timing_shift=bounds_timing_shift,
+        hard_bound=hard_bound,
+        tlb=tlb,
+    )
+    path_entry = os.path.join(path_version, key + ".pkl")
+    if os.path.exists(path_entry):
+        os.utime(path_entry)  # mark as recently used
+        print("Loaded cached floor " + key[:12])
+        return pd.read_pickle(path_entry)
+    # compute and store (atomic rename, as workers may write at the same time)
+    df = compute_urate_floor(
+        data=data,
+        levels_labels=levels_labels,
+        ref_level_label=ref_level_label,
+        time_label=time_label,
+        downturn_threshold=downturn_threshold,
+        bounds_timing_shift=bounds_timing_shift,
+        hard_bound=hard_bound,
+    )
+    path_tmp = path_entry + "." + str(os.getpid()) + ".tmp"
+    df.to_pickle(path_tmp)
+    os.replace(path_tmp, path_entry)
+    # output
+    return df
+
+
+def compute_urate_floor_entity(
+    data: pd.DataFrame,
+    entity: str,
+    downturn_threshold: float,
+    levels_labels: list[str],
+    ref_level_label: str,
+    time_label: str,
+    bounds_timing_shift: int,
+    hard_bound: bool,
+    tlb: str = "",
+    path_version: str = None,
+):
+    # which country
+    print(
+        "Now estimating for "
+        + entity
+        + ", with threshold of X = "
+        + str(round(downturn_threshold * data[ref_level_label].std(), 2))
+    )
+    # compute ceiling (same function is fine, as the DNS algo is stepwise when looking backwards)
+    if path_version is None:
+        df = compute_urate_floor(
+            data=data,
+            levels_labels=levels_labels,
+            ref_level_label=ref_level_label,
+            time_label=time_label,
+            downturn_threshold=downturn_threshold,
+            bounds_timing_shift=bounds_timing_shift,
+            hard_bound=hard_bound,
+        )
+    else:
+        df = compute_urate_floor_cached(
+            data=data,
+            levels_labels=levels_labels,
+            ref_level_label=ref_level_label,
+            time_label=time_label,
+            downturn_threshold=downturn_threshold,
+            bounds_timing_shift=bounds_timing_shift,
+            hard_bound=hard_bound,
+            tlb=tlb,
+            path_version=path_version,
+        )
+    # output
+    return df
+
+
+def compute_urate_floor_panel(
+    data: pd.DataFrame,
+    country_parameters: pd.DataFrame,
+    levels_labels: list[str],
+    ref_level_label: str,
+    time_label: str,
+    bounds_timing_shift: int,
+    hard_bound: bool,
+    entities_label: str = "country",
+    n_jobs: int = None,
+    path_cache: str = None,
+    path_source: str = None,
+    cache_max_size_mb: float = 512,
+):
+    """
+    Compute urate floors for every country in a long panel.
+    The panel is sorted by country once and split into contiguous row ranges (split_panel_by_country),
+    run through compute_urate_floor in parallel worker processes, and stacked top-down with a single concat,
+    in the order countries first appear in data.
+    Countries without a row in country_parameters are dropped from the output (with a printed "skipping" note).
+
+    :data `pd.DataFrame`: long panel with entities_label and time_label columns\n
+    :country_parameters `pd.DataFrame`: per-country x_multiplier_choice and tlb (as in dep/parameters_by_country_quarterly.csv)\n
+    :n_jobs `Optional[int]`: number of worker processes; None uses all cores, 1 runs in the current process\n
+    :path_cache `Optional[str]`: root folder of the on-disk cache of floors; None computes everything afresh\n
+    :path_source `Optional[str]`: data file behind data; the cache is cleared whenever its content changes\n
+    :cache_max_size_mb `Optional[float]`: size above which least recently used entries are evicted\n
+    :return `pd.DataFrame`: output of compute_urate_floor for all countries with parameters
+    """
+    # Cache for this version of the source data
+    if path_cache is None:
+        path_version = None
+    else:
+        path_version = prepare_urate_floor_cache(
+            path_cache=path_cache, path_source=path_source
+        )
+
+    # Split panel into countries in one pass
+    list_tasks = [
+        (
+            df_sub,
+            entity,
+            x_multiplier,
+            levels_labels,
+            ref_level_label,
+            time_label,
+            bounds_timing_shift,
+            hard_bound,
+            tlb,
+            path_version,
+        )
+        for entity, df_sub, x_multiplier, tlb in split_panel_by_country(
+            data=data,
+            country_parameters=country_parameters,
+            entities_label=entities_label,
+            time_label=time_label,
+        )
+    ]
+
+    # Compute floors
+    list_floors = run_by_country(
+        func=compute_urate_floor_entity, list_tasks=list_tasks, n_jobs=n_jobs
+    )
+
+    # Keep cache within limits
+    if path_version is not None:
+        evict_urate_floor_cache(
+            path_version=path_version, max_size_mb=cache_max_size_mb
+        )
+
+    # Consolidate top-down
+    df = pd.concat(list_floors, axis=0)
+
+    # Output
+    return df
+
+
+def find_threshold_tipping_points(
+    levels: np.ndarray,
+    index: np.ndarray,
+    time: list[str],
+    threshold_min: float,
+    threshold_max: float,
+    layout: tuple = None,
+):
+    """
+    Find the downturn thresholds at which the peaks and troughs of a single series change.
+    Walks from threshold_min to threshold_max by jumping straight to the edge of each search path,
+    so the number of searches is the number of distinct paths, not the number of grid points.
+
+    :levels `np.ndarray`: levels of the series, in row order\n
+    :index `np.ndarray`: integer index labels of the rows (as in data.index)\n
+    :time `list[str]`: time labels of the rows, in row order\n
+    :threshold_min `float`: lowest threshold to consider\n
+    :threshold_max `float`: highest threshold to consider\n
+    :layout `Optional[tuple]`: output of layout_levels, to reuse across calls\n
+    :return `list[list]`: [lower (exclusive, except threshold_min for the first range), upper (inclusive), peaks, troughs] for each range of thresholds
+    """
+    if layout is None:
+        layout = layout_levels(levels=levels, index=index)
+    list_ranges = []
+    threshold = threshold_min
+    while True:
+        list_peaks, list_troughs, threshold_lb, threshold_ub = find_peaks_troughs(
+            levels=levels,
+            index=index,
+            time=time,
+            threshold=threshold,
+            layout=layout,
+            return_threshold_bounds=True,
+        )
+        threshold_ub = min(threshold_ub, threshold_max)
+        # extend the current range if only the path (not the turning points) changed
+        if (
+            (len(list_ranges) > 0)
+            and (list_ranges[-1][2] == list_peaks)
+            and (list_ranges[-1][3] == list_troughs)
+        ):
+            list_ranges[-1][1] = threshold_ub
+        else:
+            list_ranges.append([threshold_min, threshold_ub, list_peaks, list_troughs])
+        if threshold_ub >= threshold_max:
+            break
+        # smallest threshold beyond this path (at least one step up, against rounding)
+        threshold = np.nextafter(max(threshold_ub, threshold), np.inf)
+    # the lower bound of each later range is the upper bound of the one before
+    for range_before, range_now in zip(list_ranges[:-1], list_ranges[1:]):
+        range_now[0] = range_before[1]
+    # output
+    return list_ranges
+
+
+def compute_urate_floor_sensitivity_entity(
+    data: pd.DataFrame,
+    entity: str,
+    list_multipliers: list[float],
+    level_label: str,
+    time_label: str,
+    bounds_timing_shift: int,
+    hard_bound: bool,
+    entities_label: str = "country",
+):
+    # levels laid out once, and reused for every multiplier
+    std = data[level_label].std()
+    levels = data[level_label].to_numpy(dtype="float64", na_value=np.nan)
+    index = data.index.to_numpy()
+    list_time = [str(i) for i in list(data[time_label])]
+    layout = layout_levels(levels=levels, index=index)
+    # exact multipliers at which the turning points change
+    list_ranges = find_threshold_tipping_points(
+        levels=levels,
+        index=index,
+        time=list_time,
+        threshold_min=std * min(list_multipliers),
+        threshold_max=std * max(list_multipliers),
+        layout=layout,
+    )
+    df_tipping = pd.DataFrame(
+        {
+            entities_label: entity,
+            "x_multiplier_lb": [i[0] / std for i in list_ranges],
+            "x_multiplier_ub": [i[1] / std for i in list_ranges],
+            "n_peaks": [len(i[2]) for i in list_ranges],
+            "n_troughs": [len(i[3]) for i in list_ranges],
+            level_label + "_peaks": [", ".join(i[2]) for i in list_ranges],
+            level_label + "_troughs": [", ".join(i[3]) for i in list_ranges],
+        }
+    )
+    # floors only once per distinct set of turning points
+    dict_floors = {}
+    list_cube = []
+    for x_multiplier in list_multipliers:
+        list_peaks, list_troughs = find_peaks_troughs(
+            levels=levels,
+            index=index,
+            time=list_time,
+            threshold=std * x_multiplier,
+            layout=layout,
+        )
+        key = (tuple(list_peaks), tuple(list_troughs))
+        if key not in dict_floors:
+            df = compute_urate_floor(
+                data=data,
+                levels_labels=[level_label],
+                ref_level_label=level_label,
+                time_label=time_label,
+                downturn_threshold=x_multiplier,
+                bounds_timing_shift=bounds_timing_shift,
+                hard_bound=hard_bound,
+                turning_points={level_label: (list_peaks, list_troughs)},
+            )
+            df[level_label + "_gap"] = df[level_label] - df[level_label + "_ceiling"]
+            df = df[
+                [
+                    time_label,
+                    level_label,
+                    level_label + "_ceiling",
+                    level_label + "_gap",
+                    level_label + "_peak",
+                    level_label + "_trough",
+                ]
+            ]
+            df = df.astype(
+                {level_label + "_peak": "int8", level_label + "_trough": "int8"}
+            )
+            dict_floors[key] = df
+        list_cube.append(dict_floors[key])
+    # country x multiplier x time cube
+    df_cube = pd.concat(list_cube, axis=0, ignore_index=True)
+    df_cube.insert(
+        0,
+        "x_multiplier",
+        np.repeat(list_multipliers, [len(i) for i in list_cube]),
+    )
+    df_cube.insert(0, entities_label, entity)
+    # output
+    return df_cube, df_tipping
+
+
+def compute_urate_floor_sensitivity(
+    data: pd.DataFrame,
+    country_parameters: pd.DataFrame,
+    list_multipliers: list[float],
+    level_label: str,
+    time_label: str,
+    bounds_timing_shift: int,
+    hard_bound: bool,
+    entities_label: str = "country",
+    n_jobs: int = None,
+):
+    """
+    Evaluate the urate floor over a grid of downturn threshold multipliers for every country.
+    Turning points are searched once per multiplier on a shared array of levels, floors are computed once per
+    distinct set of turning points, and the exact multipliers at which the set changes are reported.
+
+    :data `pd.DataFrame`: long panel with entities_label and time_label columns\n
+    :country_parameters `pd.DataFrame`: per-country tlb (as in dep/parameters_by_country_quarterly.csv); x_multiplier_choice is not used\n
+    :list_multipliers `list[float]`: grid of downturn threshold multipliers\n
+    :n_jobs `Optional[int]`: number of worker processes; None uses all cores, 1 runs in the current process\n
+    :return `tuple[pd.DataFrame, pd.DataFrame]`: country x multiplier x time cube of floors, gaps, peaks and troughs; and ranges of multipliers with the same turning points by country
+    """
+    # Split panel into countries in one pass
+    list_tasks = [
+        (
+            df_sub,
+            entity,
+            list(list_multipliers),
+            level_label,
+            time_label,
+            bounds_timing_shift,
+            hard_bound,
+            entities_label,
+        )
+        for entity, df_sub, _, _ in split_panel_by_country(
+            data=data,
+            country_parameters=country_parameters,
+            entities_label=entities_label,
+            time_label=time_label,
+        )
+    ]
+
+    # Compute sensitivity by country
+    list_results = run_by_country(
+        func=compute_urate_floor_sensitivity_entity,
+        list_tasks=list_tasks,
+        n_jobs=n_jobs,
+    )
 
-        # Indicator to trigger computation of xbounds
-        count_xbound_now += 1
+    # Consolidate top-down
+    df_cube = pd.concat([i[0] for i in list_results], axis=0, ignore_index=True)
+    df_tipping = pd.concat([i[1] for i in list_results], axis=0, ignore_index=True)
 
     # Output
+    return df_cube, df_tipping
+
+
+def compute_urate_floor_vintages_entity(
+    data: pd.DataFrame,
+    entity: str,
+    list_vintages: list[str],
+    downturn_threshold: float,
+    level_label: str,
+    time_label: str,
+    bounds_timing_shift: int,
+    hard_bound: bool,
+    entities_label: str = "country",
+):
+    # vintages in chronological order
+    list_vintages = sorted(list_vintages)
+    list_time = [str(i) for i in list(data[time_label])]
+    list_n_rows = [int((data[time_label] <= i).sum()) for i in list_vintages]
+    # carry the search forward only if every vintage is a leading block of rows indexed 0 to n-1
+    incremental = data.index.equals(pd.RangeIndex(len(data))) & bool(
+        data[time_label].is_monotonic_increasing
+    )
+    if incremental:
+        list_thresholds = [
+            data[level_label].iloc[:i].std() * downturn_threshold for i in list_n_rows
+        ]
+        list_turning_points = track_peaks_troughs(
+            levels=data[level_label].to_numpy(dtype="float64", na_value=np.nan),
+            time=list_time,
+            list_n_rows=list_n_rows,
+            list_thresholds=list_thresholds,
+        )
+    else:
+        list_turning_points = [None] * len(list_vintages)
+    # floor as it would have looked at each vintage
+    list_floors = []
+    for vintage, n_rows, turning_points in zip(
+        list_vintages, list_n_rows, list_turning_points
+    ):
+        if n_rows == 0:
+            continue
+        if incremental:
+            df_sub = data.iloc[:n_rows]
+            turning_points = {level_label: turning_points}
+        else:
+            df_sub = data[data[time_label] <= vintage]
+        df = compute_urate_floor(
+            data=df_sub,
+            levels_labels=[level_label],
+            ref_level_label=level_label,
+            time_label=time_label,
+            downturn_threshold=downturn_threshold,
+            bounds_timing_shift=bounds_timing_shift,
+            hard_bound=hard_bound,
+            turning_points=turning_points,
+        )
+        df["vintage"] = vintage
+        list_floors.append(df)
+    cols_keep = [
+        "vintage",
+        entities_label,
+        time_label,
+        level_label + "_gap",
+        level_label + "_gap_ratio",
+        level_label,
+        level_label + "_ceiling",
+        level_label + "_peak",
+        level_label + "_trough",
+    ]
+    if len(list_floors) == 0:
+        return pd.DataFrame(columns=cols_keep)
+    df = pd.concat(list_floors, axis=0, ignore_index=True)
+    # compute urate gap
+    df[level_label + "_gap"] = df[level_label] - df[level_label + "_ceiling"]
+    df[level_label + "_gap_ratio"] = df[level_label] / df[level_label + "_ceiling"]
+    # trim columns
+    df = df[cols_keep]
+    # output
+    return df
+
+
+def compute_urate_floor_vintages(
+    data: pd.DataFrame,
+    country_parameters: pd.DataFrame,
+    list_vintages: list[str],
+    level_label: str,
+    time_label: str,
+    bounds_timing_shift: int,
+    hard_bound: bool,
+    entities_label: str = "country",
+    n_jobs: int = None,
+):
+    """
+    Compute real-time urate floors, as they would have looked at every vintage (cut-off) in list_vintages.
+    Peaks and troughs are found with one search per country carried forward across vintages (track_peaks_troughs);
+    countries whose rows are not a plain expanding window (e.g. cut by tlb) are recomputed at each vintage instead.
+
+    :data `pd.DataFrame`: long panel with entities_label and time_label columns\n
+    :country_parameters `pd.DataFrame`: per-country x_multiplier_choice and tlb (as in dep/parameters_by_country_quarterly.csv)\n
+    :list_vintages `list[str]`: cut-offs, comparable with time_label (e.g. "1995Q1")\n
+    :n_jobs `Optional[int]`: number of worker processes; None uses all cores, 1 runs in the current process\n
+    :return `pd.DataFrame`: long frame by vintage, country and time
+    """
+    # Split panel into countries in one pass
+    list_tasks = [
+        (
+            df_sub,
+            entity,
+            list(list_vintages),
+            x_multiplier,
+            level_label,
+            time_label,
+            bounds_timing_shift,
+            hard_bound,
+            entities_label,
+        )
+        for entity, df_sub, x_multiplier, tlb in split_panel_by_country(
+            data=data,
+            country_parameters=country_parameters,
+            entities_label=entities_label,
+            time_label=time_label,
+        )
+    ]
+
+    # Compute vintages by country
+    list_floors = run_by_country(
+        func=compute_urate_floor_vintages_entity,
+        list_tasks=list_tasks,
+        n_jobs=n_jobs,
+    )
+
+    # Consolidate top-down
+    df = pd.concat(list_floors, axis=0, ignore_index=True)
+
+    # Output
+    return df
+
+
+def compute_episode_stats(
+    data: pd.DataFrame,
+    level_label: str,
+    entities_label: str = "country",
+    rows_per_epi: int = None,
+):
+    """
+    Summarise every peak-to-trough and trough-to-peak episode of all countries in one grouped pass.
+    Countries with a single episode are dropped.
+
+    :data `pd.DataFrame`: output of compute_urate_floor_panel\n
+    :level_label `str`: level whose episodes are summarised (e.g. "urate")\n
+    :rows_per_epi `Optional[int]`: only use the first n rows of each episode; None uses all rows\n
+    :return `pd.DataFrame`: one row per country and episode, with pace, amplitude, duration, first and last level
+    """
+    col_epi = level_label + "_epi"
+    # countries in the order they first appear
+    df = data[[entities_label, col_epi, level_label, level_label + "_pace"]].copy()
+    df["_entity_order"] = pd.factorize(df[entities_label])[0]
+    # restrict to n rows of each episode
+    if rows_per_epi is not None:
+        df = df.groupby(["_entity_order", col_epi]).head(rows_per_epi)
+    # drop countries with only one episode
+    df = df[df.groupby("_entity_order")[col_epi].transform("max") > 0]
+    # episodic stats
+    df = (
+        df.groupby(["_entity_order", col_epi])
+        .agg(
+            **{
+                entities_label: (entities_label, "first"),
+                level_label + "_pace": (level_label + "_pace", "mean"),
+                level_label + "_first": (level_label, "first"),
+                level_label + "_last": (level_label, "last"),
+                level_label + "_duration": (level_label, "size"),
+            }
+        )
+        .reset_index()
+    )
+    df[level_label + "_amplitude"] = (
+        df[level_label + "_last"] - df[level_label + "_first"]
+    )
+    # order of episodes within each country
+    df["epi_order"] = df.groupby("_entity_order").cumcount()
+    # output
+    df = df[
+        [
+            entities_label,
+            col_epi,
+            "epi_order",
+            level_label + "_pace",
+            level_label + "_amplitude",
+            level_label + "_duration",
+            level_label + "_first",
+            level_label + "_last",
+        ]
+    ]
+    return df
+
+
+def pair_episodes(
+    data: pd.DataFrame,
+    stat_label: str,
+    stat_suffix: str,
+    entities_label: str = "country",
+):
+    """
+    Pair every episode with the one that follows it, as Exp_{t} ->> Con_{t+1} and Con_{t} ->> Exp_{t+1}.
+    Even-numbered episodes of each country count as expansions and odd-numbered ones as contractions;
+    pairs with a missing stat on either side are dropped.
+
+    :data `pd.DataFrame`: output of compute_episode_stats\n
+    :stat_label `str`: column to pair (e.g. "urate_pace")\n
+    :stat_suffix `str`: suffix of the output columns (e.g. "pace" gives expansion_pace and subsequent_contraction_pace)\n
+    :return `tuple[pd.DataFrame, pd.DataFrame]`: expansion -> contraction pairs, and contraction -> expansion pairs
+    """
+    df = data[[entities_label, "epi_order", stat_label]]
+    # next episode of the same country
+    df_next = df.copy()
+    df_next["epi_order"] = df_next["epi_order"] - 1
+    df = df.merge(
+        df_next,
+        on=[entities_label, "epi_order"],
+        how="inner",
+        suffixes=("", "_next"),
+        sort=False,
+    )
+    df = df.dropna(subset=[stat_label, stat_label + "_next"])
+    # split by what the earlier episode was
+    is_expansion = df["epi_order"] % 2 == 0
+    df_expcon = df.loc[is_expansion, [entities_label, stat_label, stat_label + "_next"]]
+    df_expcon.columns = [
+        entities_label,
+        "expansion_" + stat_suffix,
+        "subsequent_contraction_" + stat_suffix,
+    ]
+    df_conexp = df.loc[
+        ~is_expansion, [entities_label, stat_label, stat_label + "_next"]
+    ]
+    df_conexp.columns = [
+        entities_label,
+        "contraction_" + stat_suffix,
+        "subsequent_expansion_" + stat_suffix,
+    ]
+    # output
+    return df_expcon.reset_index(drop=True), df_conexp.reset_index(drop=True)
+
+
+def generate_synthetic_urate_panel(
+    n_countries: int,
+    n_periods: int,
+    frequency: str = "quarter",
+    start: str = "1990-01-01",
+    seed: int = 0,
+    entities_label: str = "country",
+):
+    """
+    Simulate a long panel of unemployment rates with plucking-style cycles:
+    long, gradual declines towards a floor during expansions, broken by short and sharp spikes during downturns.
+
+    :n_countries `int`: number of countries\n
+    :n_periods `int`: number of periods per country\n
+    :frequency `str`: "quarter" or "month"; also the name of the time column\n
+    :seed `Optional[int]`: seed of the random number generator\n
+    :return `pd.DataFrame`: long panel with entities_label, frequency, urate and urate_diff columns
+    """
+    rng = np.random.default_rng(seed)
+    # scale per-period moves so both frequencies trace similar cycles in calendar time
+    if frequency == "quarter":
+        periods_per_year = 4
+    elif frequency == "month":
+        periods_per_year = 12
+    else:
+        raise ValueError("frequency must be either quarter or month")
+    scale = 4 / periods_per_year
+    # country-specific floors, downturn odds and severity
+    floor = rng.uniform(2, 6, n_countries)
+    prob_downturn = rng.uniform(0.02, 0.06, n_countries) * scale
+    size_downturn = rng.uniform(0.4, 1.2, n_countries) * scale
+    pace_recovery = rng.uniform(0.05, 0.2, n_countries) * scale
+    # simulate all countries one period at a time
+    urate = np.empty((n_periods, n_countries))
+    urate[0] = floor + rng.uniform(0, 3, n_countries)
+    downturn_left = np.zeros(n_countries, dtype=np.int64)
+    for t in range(1, n_periods):
+        starts = (downturn_left == 0) & (rng.uniform(size=n_countries) < prob_downturn)
+        downturn_left[starts] = rng.integers(2, 7, starts.sum()) * int(1 / scale)
+        in_downturn = downturn_left > 0
+        step = np.where(
+            in_downturn,
+            size_downturn * rng.uniform(0.5, 1.5, n_countries),
+            -pace_recovery * (urate[t - 1] - floor) / 2,
+        )
+        shock = rng.normal(0, 0.08 * np.sqrt(scale), n_countries)
+        urate[t] = np.maximum(urate[t - 1] + step + shock, floor * 0.8)
+        downturn_left[in_downturn] -= 1
+    # long panel
+    time = pd.period_range(
+        start=start, periods=n_periods, freq="Q" if frequency == "quarter" else "M"
+    ).astype("str")
+    df = pd.DataFrame(
+        {
+            entities_label: np.repeat(
+                ["country_" + str(i).zfill(4) for i in range(n_countries)], n_periods
+            ),
+            frequency: np.tile(np.asarray(time), n_countries),
+            "urate": urate.T.reshape(-1).round(2),
+        }
+    )
+    df["urate_diff"] = df["urate"] - df.groupby(entities_label)["urate"].shift(1)
+    # output
     return df